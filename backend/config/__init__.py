@@ -0,0 +1,5 @@
+# Charge l'application Celery avec Django: les tâches mises en file depuis
+# les vues utilisent la configuration CELERY_* des settings
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
@@ -24,6 +24,10 @@ app.conf.beat_schedule = {
         'task': 'scheduler.tasks.check_delayed_samples',
         'schedule': crontab(minute=0),  # Every hour
     },
+    'reschedule-delayed-samples-daily': {
+        'task': 'scheduler.tasks.reprogrammer_echantillons_retardes',
+        'schedule': crontab(hour=5, minute=30),  # Every day at 5:30 AM, before optimization
+    },
     'optimize-schedule-daily': {
         'task': 'scheduler.tasks.optimize_daily_schedule',
         'schedule': crontab(hour=6, minute=0),  # Every day at 6 AM
@@ -32,6 +36,30 @@ app.conf.beat_schedule = {
         'task': 'scheduler.tasks.auto_send_scheduled_essais',
         'schedule': crontab(minute='*/15'),  # Every 15 minutes
     },
+    'release-expired-capacity-holds': {
+        'task': 'core.tasks.liberer_reservations_capacite_expirees',
+        'schedule': crontab(minute='*/5'),  # Every 5 minutes
+    },
+    'resync-capacity-slots-daily': {
+        'task': 'core.tasks.resynchroniser_creneaux_capacite',
+        'schedule': crontab(hour=2, minute=0),  # Every day at 2 AM
+    },
+    'refresh-dashboard-stats': {
+        'task': 'core.tasks.rafraichir_statistiques_dashboard',
+        'schedule': crontab(minute='*/5'),  # Every 5 minutes
+    },
+    'purge-sync-tombstones-daily': {
+        'task': 'core.tasks.purger_suppressions_synchronisation',
+        'schedule': crontab(hour=3, minute=0),  # Every day at 3 AM
+    },
+    'clean-report-blobs-daily': {
+        'task': 'core.tasks.nettoyer_blobs',
+        'schedule': crontab(hour=3, minute=30),  # Every day at 3:30 AM
+    },
+    'resume-stuck-report-emails': {
+        'task': 'core.tasks.relancer_envois_rapports',
+        'schedule': crontab(minute='*/10'),  # Every 10 minutes
+    },
 }
 
 @app.task(bind=True)
@@ -0,0 +1,211 @@
+"""
+Analyses des résultats d'essais
+Les grandeurs numériques de chaque essai (calculées ou saisies dans resultats)
+sont recopiées dans la table indexée mesures_resultats à chaque calcul; les
+filtres par plage, regroupements et percentiles sont exécutés en SQL sans lire
+les JSON
+"""
+
+import math
+import uuid
+from datetime import date
+
+from django.db import transaction
+from django.db.models import Aggregate, Avg, Count, F, FloatField, Max, Min
+from django.db.models.functions import Cast, ExtractYear, Floor
+
+from .calculs_geotechniques import CHAMPS_CALCULES, _nombre, _normaliser
+from .models import Essai, MesureResultat
+
+
+LONGUEUR_METRIQUE = 60
+
+PERCENTILES_DEFAUT = (10, 50, 90)
+MAX_PERCENTILES = 10
+
+# Pas par défaut des tranches de profondeur (m)
+PAS_PROFONDEUR = 1
+
+MAX_GROUPES = 1000
+
+
+class ParametreInvalide(ValueError):
+    """Levée quand un paramètre de l'analyse est invalide"""
+
+
+class Percentile(Aggregate):
+    """percentile_cont de PostgreSQL (interpolation linéaire entre les valeurs)"""
+
+    function = 'PERCENTILE_CONT'
+    template = '%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+    output_field = FloatField()
+
+    def __init__(self, expression, fraction, **extra):
+        super().__init__(expression, fraction=float(fraction), **extra)
+
+
+def valeurs(resultats, calcule=None):
+    """
+    Grandeurs numériques d'un essai {métrique: valeur}
+
+    Les valeurs scalaires de resultats sont reprises sous leur nom normalisé
+    ("Teneur en eau (%)" -> teneur_en_eau); les grandeurs calculées priment.
+    """
+    mesures = {}
+    if isinstance(resultats, dict):
+        for cle, valeur in resultats.items():
+            nombre = _nombre(valeur)
+            metrique = _normaliser(cle)[:LONGUEUR_METRIQUE]
+            if metrique and math.isfinite(nombre):
+                mesures[metrique] = nombre
+    if calcule is not None:
+        for champ in CHAMPS_CALCULES:
+            valeur = getattr(calcule, champ)
+            if valeur is not None and math.isfinite(valeur):
+                mesures[champ] = valeur
+    return mesures
+
+
+def indexer(essais, calcules):
+    """
+    Remplace les mesures d'un lot d'essais
+
+    Args:
+        essais: [(id, type, resultats)]
+        calcules: ResultatCalcule du lot (core.calculs_geotechniques.calculer)
+    """
+    calcules = {calcule.essai_id: calcule for calcule in calcules}
+    echantillons = dict(
+        Essai.objects.filter(pk__in=[essai_id for essai_id, _, _ in essais]).values_list('id', 'echantillon_id')
+    )
+    lignes = [
+        MesureResultat(essai_id=essai_id, echantillon_id=echantillons[essai_id], type=type_essai, metrique=metrique, valeur=valeur)
+        for essai_id, type_essai, resultats in essais if essai_id in echantillons
+        for metrique, valeur in valeurs(resultats, calcules.get(essai_id)).items()
+    ]
+    with transaction.atomic():
+        MesureResultat.objects.filter(essai_id__in=echantillons).delete()
+        MesureResultat.objects.bulk_create(lignes, batch_size=5000)
+    return len(lignes)
+
+
+def a_indexer():
+    """Essais avec des résultats mais sans aucune mesure indexée (antérieurs à la table)"""
+    return Essai.objects.filter(resultats__isnull=False, mesures_resultats__isnull=True)
+
+
+def _nombre_parametre(parametres, nom, positif=False):
+    valeur = parametres.get(nom)
+    if valeur in (None, ''):
+        return None
+    nombre = _nombre(valeur)
+    if not math.isfinite(nombre) or (positif and nombre <= 0):
+        raise ParametreInvalide(f'{nom} doit être un nombre{" positif" if positif else ""}')
+    return nombre
+
+
+def _date_parametre(parametres, nom):
+    valeur = parametres.get(nom)
+    if not valeur:
+        return None
+    try:
+        return date.fromisoformat(valeur)
+    except ValueError:
+        raise ParametreInvalide(f'{nom} doit être une date AAAA-MM-JJ')
+
+
+def _uuid_parametre(parametres, nom):
+    valeur = parametres.get(nom)
+    if not valeur:
+        return None
+    try:
+        return uuid.UUID(valeur)
+    except ValueError:
+        raise ParametreInvalide(f'{nom} doit être un identifiant')
+
+
+def _percentiles(parametres):
+    texte = parametres.get('percentiles')
+    if texte is None:
+        return PERCENTILES_DEFAUT
+    percentiles = []
+    for morceau in filter(None, texte.split(',')):
+        nombre = _nombre(morceau)
+        if not 0 <= nombre <= 100:
+            raise ParametreInvalide('percentiles: valeurs entre 0 et 100 séparées par des virgules')
+        percentiles.append(nombre)
+    if len(percentiles) > MAX_PERCENTILES:
+        raise ParametreInvalide(f'{MAX_PERCENTILES} percentiles au plus')
+    return percentiles
+
+
+def _groupement(grouper, pas_profondeur):
+    """Colonnes du regroupement {nom: expression}"""
+    if grouper == 'client':
+        return {'client': F('echantillon__client'), 'client_nom': F('echantillon__client__nom')}
+    if grouper == 'nature':
+        return {'nature': F('echantillon__nature')}
+    if grouper == 'type':
+        return {'type_essai': F('type')}
+    if grouper == 'annee':
+        return {'annee': ExtractYear('essai__date_fin')}
+    if grouper == 'profondeur':
+        profondeur = Cast('echantillon__profondeur_debut', FloatField())
+        return {'profondeur': Floor(profondeur / pas_profondeur) * pas_profondeur}
+    raise ParametreInvalide('grouper: client, nature, profondeur, type ou annee')
+
+
+def analyser(parametres):
+    """
+    Agrégats d'une grandeur (nombre, moyenne, min, max, percentiles), par groupe
+
+    Args:
+        parametres: metrique (obligatoire), min, max, type, client, nature,
+            profondeur_min, profondeur_max, depuis, jusqu_a (date de fin de
+            l'essai), grouper, pas_profondeur, percentiles ("10,50,90")
+
+    Raises:
+        ParametreInvalide
+    """
+    metrique = _normaliser(parametres.get('metrique') or '')
+    if not metrique:
+        raise ParametreInvalide('metrique est obligatoire (ex. indice_cbr, densite_seche_max)')
+
+    mesures = MesureResultat.objects.filter(metrique=metrique)
+    plages = {
+        'valeur__gte': _nombre_parametre(parametres, 'min'),
+        'valeur__lte': _nombre_parametre(parametres, 'max'),
+        'echantillon__profondeur_debut__gte': _nombre_parametre(parametres, 'profondeur_min'),
+        'echantillon__profondeur_debut__lte': _nombre_parametre(parametres, 'profondeur_max'),
+        'essai__date_fin__gte': _date_parametre(parametres, 'depuis'),
+        'essai__date_fin__lte': _date_parametre(parametres, 'jusqu_a'),
+        'type': parametres.get('type') or None,
+        'echantillon__client': _uuid_parametre(parametres, 'client'),
+        'echantillon__nature': parametres.get('nature') or None,
+    }
+    mesures = mesures.filter(**{filtre: valeur for filtre, valeur in plages.items() if valeur is not None})
+
+    percentiles = _percentiles(parametres)
+    agregats = {
+        'nombre': Count('id'),
+        'moyenne': Avg('valeur'),
+        'minimum': Min('valeur'),
+        'maximum': Max('valeur'),
+        **{f'p{percentile:g}': Percentile('valeur', percentile / 100) for percentile in percentiles},
+    }
+
+    grouper = parametres.get('grouper')
+    if not grouper:
+        groupes = [mesures.aggregate(**agregats)]
+    else:
+        colonnes = _groupement(grouper, _nombre_parametre(parametres, 'pas_profondeur', positif=True) or PAS_PROFONDEUR)
+        groupes = list(
+            mesures.values(**colonnes).annotate(**agregats).order_by(*colonnes)[:MAX_GROUPES]
+        )
+
+    return {
+        'metrique': metrique,
+        'grouper': grouper or None,
+        'percentiles': [f'p{percentile:g}' for percentile in percentiles],
+        'groupes': groupes,
+    }
@@ -0,0 +1,192 @@
+"""
+Stockage des fichiers de rapports
+Les PDF envoyés en base64 (ou data URL) sont décodés et écrits une seule fois
+sur le stockage de médias, sous leur empreinte SHA-256; les modèles ne gardent
+qu'une référence vers le Blob
+"""
+
+import base64
+import binascii
+import hashlib
+from datetime import timedelta
+from urllib.parse import unquote_to_bytes
+
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.db import IntegrityError
+from django.db.models import Count, F, ProtectedError
+from django.utils import timezone
+
+from .models import Blob, RapportMarketing, WorkflowValidation, RapportValidation, RapportArchive, RenduRapport
+
+
+# Champs référençant un Blob, par modèle
+CHAMPS_BLOB = {
+    RapportMarketing: ('fichier', 'rapport_signe'),
+    WorkflowValidation: ('fichier',),
+    RapportValidation: ('fichier', 'fichier_original'),
+    RapportArchive: ('fichier',),
+    RenduRapport: ('fichier', 'source'),
+}
+
+# Type des blobs qui contiennent une URL plutôt qu'un fichier
+TYPE_URL = 'text/uri-list'
+
+# Débuts des contenus reçus traités comme des URLs (le base64 brut peut
+# commencer par "/": "/9j/" pour un JPEG)
+PREFIXES_URL = ('http://', 'https://', '/api/', '/media/')
+
+# Délai avant qu'un blob sans référence soit supprimé (requêtes encore en cours)
+DELAI_ORPHELINS = timedelta(days=1)
+
+# Validité des liens de téléchargement signés (iframe, img, window.open
+# n'envoient pas l'en-tête Authorization)
+DUREE_LIEN = timedelta(hours=12)
+
+_signataire = signing.TimestampSigner(salt='core.blobs')
+
+
+class ContenuInvalide(ValueError):
+    """Levée quand le contenu reçu n'est ni du base64, ni une data URL, ni une URL"""
+
+
+def decoder(contenu):
+    """
+    Décode un contenu tel que reçu par l'API
+
+    Returns:
+        (octets, type_mime): type_mime vide pour du base64 brut
+    """
+    if contenu.startswith(PREFIXES_URL):
+        return contenu.encode(), TYPE_URL
+
+    type_mime = ''
+    if contenu.startswith('data:'):
+        entete, _, contenu = contenu.partition(',')
+        parametres = entete[5:].split(';')
+        type_mime = parametres[0] or 'text/plain'
+        if 'base64' not in parametres[1:]:
+            return unquote_to_bytes(contenu), type_mime
+
+    try:
+        return base64.b64decode(contenu, validate=True), type_mime
+    except (binascii.Error, ValueError):
+        raise ContenuInvalide(contenu[:50])
+
+
+def chemin(sha256):
+    return f'blobs/{sha256[:2]}/{sha256}'
+
+
+def stocker(contenu):
+    """
+    Stocke un contenu (base64, data URL ou URL) et retourne son Blob
+
+    Un contenu déjà connu n'est pas réécrit. Le Blob renvoyé n'est pas encore
+    référencé: la référence est comptée à l'enregistrement du modèle.
+    """
+    if not contenu:
+        return None
+    octets, type_mime = decoder(contenu)
+    return stocker_octets(octets, type_mime)
+
+
+def stocker_octets(octets, type_mime=''):
+    """Stocke des octets et retourne leur Blob (dédupliqué par SHA-256)"""
+    sha256 = hashlib.sha256(octets).hexdigest()
+    blob = Blob.objects.filter(pk=sha256).first()
+    if blob is not None:
+        return blob
+
+    blob = Blob(sha256=sha256, taille=len(octets), type_mime=type_mime)
+    if blob.fichier.storage.exists(chemin(sha256)):
+        blob.fichier.name = chemin(sha256)
+    else:
+        blob.fichier.name = blob.fichier.storage.save(chemin(sha256), ContentFile(octets))
+    try:
+        blob.save(force_insert=True)
+    except IntegrityError:
+        # Même contenu stocké en parallèle: même fichier, même ligne
+        blob = Blob.objects.get(pk=sha256)
+    return blob
+
+
+def lire(blob):
+    """Contenu complet d'un blob"""
+    with blob.fichier.open('rb') as fichier:
+        return fichier.read()
+
+
+def representation(blob):
+    """
+    Valeur renvoyée à l'API à la place de l'ancienne colonne base64
+
+    Data URL si le type est connu, base64 brut sinon, URL telle quelle.
+    """
+    if blob is None:
+        return ''
+    octets = lire(blob)
+    if blob.type_mime == TYPE_URL:
+        return octets.decode()
+    encode = base64.b64encode(octets).decode()
+    return f'data:{blob.type_mime};base64,{encode}' if blob.type_mime else encode
+
+
+def jeton_telechargement(sha256):
+    """Jeton autorisant le téléchargement d'un blob sans authentification, pendant DUREE_LIEN"""
+    return _signataire.sign(sha256).split(':', 1)[1]
+
+
+def jeton_valide(sha256, jeton):
+    if not jeton:
+        return False
+    try:
+        return _signataire.unsign(f'{sha256}:{jeton}', max_age=DUREE_LIEN) == sha256
+    except signing.BadSignature:
+        return False
+
+
+def referencer(sha256s, increment):
+    """Ajoute increment aux compteurs de références des blobs donnés"""
+    for sha256 in sha256s:
+        if sha256:
+            Blob.objects.filter(pk=sha256).update(nombre_references=F('nombre_references') + increment)
+
+
+def recompter_references():
+    """
+    Recalcule les compteurs de références depuis les clés étrangères
+
+    Corrige les écarts laissés par les mises à jour en masse (update(),
+    suppressions SQL directes) qui ne passent pas par les signaux.
+
+    Returns:
+        Nombre de blobs corrigés
+    """
+    comptes = {}
+    for modele, champs in CHAMPS_BLOB.items():
+        for champ in champs:
+            lignes = modele.objects.filter(**{f'{champ}__isnull': False}).order_by().values(f'{champ}_id').annotate(nombre=Count('pk'))
+            for ligne in lignes:
+                comptes[ligne[f'{champ}_id']] = comptes.get(ligne[f'{champ}_id'], 0) + ligne['nombre']
+
+    corriges = 0
+    for sha256, nombre in Blob.objects.values_list('sha256', 'nombre_references'):
+        if comptes.get(sha256, 0) != nombre:
+            corriges += Blob.objects.filter(pk=sha256).update(nombre_references=comptes.get(sha256, 0))
+    return corriges
+
+
+def purger_orphelins():
+    """Supprime les blobs sans référence depuis DELAI_ORPHELINS; retourne le nombre supprimé"""
+    limite = timezone.now() - DELAI_ORPHELINS
+    supprimes = 0
+    for blob in Blob.objects.filter(nombre_references=0, created_at__lt=limite):
+        try:
+            blob.delete()
+        except ProtectedError:
+            # Encore référencé malgré le compteur: corrigé au prochain recomptage
+            continue
+        blob.fichier.storage.delete(blob.fichier.name)
+        supprimes += 1
+    return supprimes
@@ -0,0 +1,389 @@
+"""
+Calcul des grandeurs géotechniques dérivées des résultats d'essais
+Les mesures brutes (tableau 'mesures' des résultats, voir core.import_essais)
+de tous les essais d'un même type sont rangées dans des matrices NumPy
+(un essai par ligne, complétées par NaN) et traitées en une fois. Les valeurs
+saisies à la main complètent ce qui ne peut pas être calculé. Les résultats
+sont enregistrés dans ResultatCalcule, interrogeable en SQL
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+from django.db import transaction
+
+from .models import Essai, ResultatCalcule
+
+
+# À incrémenter à chaque correction de formule: les essais calculés avec une
+# version antérieure sont repérés par a_recalculer()
+VERSION_FORMULES = 1
+
+# Essais traités par lot lors d'un recalcul complet
+TAILLE_LOT = 2000
+
+# Forces de référence du poinçonnement CBR (kN) à 2,5 mm et 5 mm d'enfoncement
+FORCE_REFERENCE_25MM = 13.35
+FORCE_REFERENCE_5MM = 19.93
+
+# Colonnes reconnues dans les mesures importées (noms normalisés), par grandeur
+COLONNES = {
+    'diametre': ('tamis', 'diametre', 'ouverture', 'maille', 'd', 'd_mm', 'tamis_mm', 'diametre_mm'),
+    'passant': ('passant', 'passants', 'passant_pct', 'pourcentage_passant', 'passant_cumule', 'tamisat'),
+    'teneur_eau': ('teneur_eau', 'teneur_en_eau', 'w', 'w_pct', 'humidite'),
+    'densite_seche': ('densite_seche', 'gamma_d', 'yd', 'masse_volumique_seche', 'densite'),
+    'penetration': ('penetration', 'enfoncement', 'penetration_mm', 'enfoncement_mm'),
+    'force': ('force', 'effort', 'charge', 'force_kn', 'effort_kn'),
+    'contrainte': ('contrainte', 'pression', 'sigma', 'contrainte_kpa', 'pression_kpa', 'sigma_v'),
+    'indice_vides': ('indice_vides', 'indice_des_vides', 'e'),
+    'contrainte_normale': ('contrainte_normale', 'sigma_n', 'normale', 'sigma', 'contrainte_normale_kpa'),
+    'cisaillement': ('cisaillement', 'tau', 'tau_max', 'contrainte_cisaillement', 'cisaillement_kpa'),
+}
+
+# Mesures (abscisse, ordonnée) utilisées par type d'essai
+SERIES = {
+    'AG': ('diametre', 'passant'),
+    'Proctor': ('teneur_eau', 'densite_seche'),
+    'CBR': ('penetration', 'force'),
+    'Oedometre': ('contrainte', 'indice_vides'),
+    'Cisaillement': ('contrainte_normale', 'cisaillement'),
+}
+
+# Valeurs saisies (clés des résultats) reprises quand le calcul ne les fournit pas
+SAISIES = {
+    'AG': {
+        'passant_2mm': 'pourcent_inf_2mm',
+        'passant_80um': 'pourcent_inf_80um',
+        'coefficient_uniformite': 'coefficient_uniformite',
+    },
+    'Proctor': {
+        'teneur_eau_optimale': 'teneur_eau_opt',
+        'densite_seche_max': 'densite_opt',
+    },
+    'CBR': {
+        'cbr_95': 'cbr_95',
+        'gonflement': 'gonflement',
+    },
+    'Oedometre': {
+        'indice_compression': 'cc',
+        'indice_gonflement': 'cs',
+        'pression_preconsolidation': 'gp',
+    },
+    'Cisaillement': {
+        'cohesion': 'cohesion',
+        'angle_frottement': 'phi',
+    },
+}
+
+CHAMPS_CALCULES = [
+    'd10', 'd30', 'd60', 'coefficient_uniformite', 'coefficient_courbure', 'passant_2mm', 'passant_80um',
+    'teneur_eau_optimale', 'densite_seche_max', 'cbr_25mm', 'cbr_5mm', 'indice_cbr', 'cbr_95', 'gonflement',
+    'indice_compression', 'indice_gonflement', 'pression_preconsolidation', 'cohesion', 'angle_frottement',
+]
+
+
+def _normaliser(nom):
+    nom = unicodedata.normalize('NFKD', str(nom)).encode('ascii', 'ignore').decode().lower()
+    return re.sub(r'[^a-z0-9]+', '_', nom).strip('_')
+
+
+def _nombre(valeur):
+    if isinstance(valeur, bool):
+        return np.nan
+    if isinstance(valeur, (int, float)):
+        return float(valeur)
+    if isinstance(valeur, str):
+        try:
+            return float(valeur.strip().replace(',', '.'))
+        except ValueError:
+            return np.nan
+    return np.nan
+
+
+@lru_cache(maxsize=256)
+def _colonnes_serie(noms, type_essai):
+    """Colonnes (abscisse, ordonnée) du type d'essai parmi les noms d'un tableau de mesures"""
+    normalises = {_normaliser(nom): nom for nom in noms}
+    return tuple(
+        next((normalises[nom] for nom in COLONNES[grandeur] if nom in normalises), None)
+        for grandeur in SERIES[type_essai]
+    )
+
+
+def extraire_serie(resultats, type_essai):
+    """(abscisses, ordonnées) des mesures d'un essai, dans l'ordre de l'essai"""
+    mesures = resultats.get('mesures') if isinstance(resultats, dict) else None
+    if not mesures or not isinstance(mesures, list) or not isinstance(mesures[0], dict) or type_essai not in SERIES:
+        return [], []
+    colonne_x, colonne_y = _colonnes_serie(tuple(mesures[0]), type_essai)
+    if colonne_x is None or colonne_y is None:
+        return [], []
+    points = [
+        (_nombre(mesure.get(colonne_x)), _nombre(mesure.get(colonne_y)))
+        for mesure in mesures if isinstance(mesure, dict)
+    ]
+    points = [(x, y) for x, y in points if x == x and y == y]
+    return [x for x, _ in points], [y for _, y in points]
+
+
+def matrices(series):
+    """Abscisses et ordonnées de plusieurs essais, une ligne par essai, complétées par NaN"""
+    largeur = max([len(x) for x, _ in series] + [1])
+    x = np.full((len(series), largeur), np.nan)
+    y = np.full((len(series), largeur), np.nan)
+    for ligne, (abscisses, ordonnees) in enumerate(series):
+        x[ligne, :len(abscisses)] = abscisses
+        y[ligne, :len(ordonnees)] = ordonnees
+    return x, y
+
+
+def trier(x, y):
+    """Trie chaque ligne par abscisse croissante (NaN en fin de ligne)"""
+    ordre = np.argsort(np.where(np.isnan(x), np.inf, x), axis=1)
+    return np.take_along_axis(x, ordre, axis=1), np.take_along_axis(y, ordre, axis=1)
+
+
+def interpoler(x, y, cible):
+    """
+    Interpolation linéaire ligne par ligne (x trié), NaN hors de l'intervalle mesuré
+
+    Args:
+        cible: Abscisse recherchée, commune ou une par ligne
+    """
+    cible = np.broadcast_to(np.asarray(cible, dtype=float), x.shape[:1])
+    valide = ~np.isnan(x) & ~np.isnan(y)
+    au_dessus = valide & (x >= cible[:, None])
+    j = np.argmax(au_dessus, axis=1)
+    i = np.maximum(j - 1, 0)
+    rangs = np.arange(x.shape[0])
+    x0, x1, y0, y1 = x[rangs, i], x[rangs, j], y[rangs, i], y[rangs, j]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        valeur = np.where(x1 == cible, y1, y0 + (cible - x0) / (x1 - x0) * (y1 - y0))
+    trouve = au_dessus.any(axis=1) & ((x1 == cible) | ((j > 0) & valide[rangs, i]))
+    return np.where(trouve, valeur, np.nan)
+
+
+def calculer_ag(x, y):
+    """Diamètres caractéristiques (interpolation log-linéaire), Cu, Cc et passants"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        log_d = np.where(x > 0, np.log10(x), np.nan)
+    passant, log_d_par_passant = trier(np.where(np.isnan(log_d), np.nan, y), log_d)
+    d10, d30, d60 = (10 ** interpoler(passant, log_d_par_passant, p) for p in (10, 30, 60))
+
+    log_d, passant = trier(log_d, y)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {
+            'd10': d10,
+            'd30': d30,
+            'd60': d60,
+            'coefficient_uniformite': d60 / d10,
+            'coefficient_courbure': d30 ** 2 / (d10 * d60),
+            'passant_2mm': interpoler(log_d, passant, np.log10(2)),
+            'passant_80um': interpoler(log_d, passant, np.log10(0.08)),
+        }
+
+
+def calculer_proctor(x, y):
+    """Optimum par ajustement parabolique de la densité sèche en fonction de la teneur en eau"""
+    valide = ~np.isnan(x) & ~np.isnan(y)
+    w, g = np.where(valide, x, 0), np.where(valide, y, 0)
+    n = valide.sum(axis=1)
+    s1, s2, s3, s4 = ((w ** k).sum(axis=1) for k in (1, 2, 3, 4))
+    t0, t1, t2 = g.sum(axis=1), (w * g).sum(axis=1), (w ** 2 * g).sum(axis=1)
+
+    # Équations normales des moindres carrés g = a w² + b w + c, résolues pour toutes les lignes
+    a_mat = np.stack([
+        np.stack([s4, s3, s2], axis=-1),
+        np.stack([s3, s2, s1], axis=-1),
+        np.stack([s2, s1, n], axis=-1),
+    ], axis=1)
+    b_vec = np.stack([t2, t1, t0], axis=-1)
+    resolvable = (n >= 3) & (np.abs(np.linalg.det(a_mat)) > 1e-12)
+    coefficients = np.full((x.shape[0], 3), np.nan)
+    if resolvable.any():
+        coefficients[resolvable] = np.linalg.solve(a_mat[resolvable], b_vec[resolvable][..., None])[..., 0]
+    a, b, c = coefficients.T
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        w_opt = -b / (2 * a)
+        g_max = c - b ** 2 / (4 * a)
+    # Parabole concave et optimum dans la plage mesurée, sinon point mesuré le plus dense
+    dans_plage = (a < 0) & (w_opt >= np.nanmin(np.where(valide, x, np.nan), axis=1, initial=np.inf)) \
+        & (w_opt <= np.nanmax(np.where(valide, x, np.nan), axis=1, initial=-np.inf))
+    meilleur = np.argmax(np.where(valide, y, -np.inf), axis=1)
+    rangs = np.arange(x.shape[0])
+    mesure = n > 0
+    return {
+        'teneur_eau_optimale': np.where(dans_plage, w_opt, np.where(mesure, x[rangs, meilleur], np.nan)),
+        'densite_seche_max': np.where(dans_plage, g_max, np.where(mesure, y[rangs, meilleur], np.nan)),
+    }
+
+
+def calculer_cbr(x, y):
+    """Indices CBR à 2,5 et 5 mm d'enfoncement; l'indice retenu est le plus grand"""
+    x, y = trier(x, y)
+    cbr_25mm = interpoler(x, y, 2.5) / FORCE_REFERENCE_25MM * 100
+    cbr_5mm = interpoler(x, y, 5.0) / FORCE_REFERENCE_5MM * 100
+    return {
+        'cbr_25mm': cbr_25mm,
+        'cbr_5mm': cbr_5mm,
+        'indice_cbr': np.fmax(cbr_25mm, cbr_5mm),
+    }
+
+
+def calculer_oedometre(x, y):
+    """
+    Indices de compression et de gonflement sur la courbe e - log σ'
+
+    Cc: pente la plus forte des paliers de chargement; Cs: pente moyenne des
+    paliers de déchargement. σ'p: intersection de la droite de recompression
+    (premier palier) et de la droite vierge (palier de pente Cc).
+    """
+    if x.shape[1] < 2:
+        # Aucun essai du lot n'a deux paliers: pas de pente
+        vide = np.full(x.shape[0], np.nan)
+        return {'indice_compression': vide, 'indice_gonflement': vide, 'pression_preconsolidation': vide}
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        log_s = np.where(x > 0, np.log10(x), np.nan)
+        d_log = np.diff(log_s, axis=1)
+        pentes = -np.diff(y, axis=1) / d_log
+    chargement = np.where(d_log > 0, pentes, np.nan)
+    dechargement = np.where(d_log < 0, pentes, np.nan)
+
+    rangs = np.arange(x.shape[0])
+    vierge = np.argmax(np.where(np.isnan(chargement), -np.inf, chargement), axis=1)
+    cc = chargement[rangs, vierge]
+    cr = chargement[:, 0]
+    paliers_dechargement = (~np.isnan(dechargement)).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cs = np.where(paliers_dechargement > 0, np.nansum(dechargement, axis=1) / paliers_dechargement, np.nan)
+        log_p = (y[rangs, vierge] - y[:, 0] + cc * log_s[rangs, vierge] - cr * log_s[:, 0]) / (cc - cr)
+    return {
+        'indice_compression': cc,
+        'indice_gonflement': cs,
+        'pression_preconsolidation': np.where((cc > cr) & (vierge > 0), 10 ** log_p, np.nan),
+    }
+
+
+def calculer_cisaillement(x, y):
+    """Droite de Coulomb τ = c + σ tan φ ajustée par moindres carrés"""
+    valide = ~np.isnan(x) & ~np.isnan(y)
+    s, t = np.where(valide, x, 0), np.where(valide, y, 0)
+    n = valide.sum(axis=1)
+    sx, sy, sxx, sxy = s.sum(axis=1), t.sum(axis=1), (s * s).sum(axis=1), (s * t).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pente = (n * sxy - sx * sy) / (n * sxx - sx ** 2)
+        cohesion = (sy - pente * sx) / n
+    ajuste = (n >= 2) & np.isfinite(pente)
+    return {
+        'cohesion': np.where(ajuste, cohesion, np.nan),
+        'angle_frottement': np.where(ajuste, np.degrees(np.arctan(pente)), np.nan),
+    }
+
+
+CALCULS = {
+    'AG': calculer_ag,
+    'Proctor': calculer_proctor,
+    'CBR': calculer_cbr,
+    'Oedometre': calculer_oedometre,
+    'Cisaillement': calculer_cisaillement,
+}
+
+
+def courbes(x, y):
+    """Points [x, y] triés de chaque ligne (courbe granulométrique)"""
+    x, y = trier(x, y)
+    points = np.stack([np.round(x, 4), np.round(y, 2)], axis=-1).tolist()
+    return [ligne[:nombre] or None for ligne, nombre in zip(points, (~np.isnan(x)).sum(axis=1).tolist())]
+
+
+def calculer(essais):
+    """
+    Résultats calculés d'essais, traités par type en une passe vectorisée
+
+    Args:
+        essais: [(id, type, resultats), ...]
+
+    Returns:
+        Instances ResultatCalcule non enregistrées, pour les essais ayant au
+        moins une grandeur (calculée ou saisie)
+    """
+    par_type = {}
+    for essai_id, type_essai, resultats in essais:
+        if type_essai in CALCULS:
+            par_type.setdefault(type_essai, []).append((essai_id, resultats if isinstance(resultats, dict) else {}))
+
+    lignes = []
+    for type_essai, groupe in par_type.items():
+        x, y = matrices([extraire_serie(resultats, type_essai) for _, resultats in groupe])
+        valeurs = CALCULS[type_essai](x, y)
+        finis = {champ: np.isfinite(valeur) for champ, valeur in valeurs.items()}
+        courbe = courbes(x, y) if type_essai == 'AG' else None
+
+        for rang, (essai_id, resultats) in enumerate(groupe):
+            champs = {champ: float(valeur[rang]) for champ, valeur in valeurs.items() if finis[champ][rang]}
+            source = 'mesures' if champs else 'saisie'
+            for champ, cle in SAISIES[type_essai].items():
+                saisie = _nombre(resultats.get(cle))
+                if champ not in champs and np.isfinite(saisie):
+                    champs[champ] = saisie
+            if not champs:
+                continue
+            if courbe and courbe[rang]:
+                champs['courbe_granulometrique'] = courbe[rang]
+            lignes.append(ResultatCalcule(
+                essai_id=essai_id, type=type_essai, source=source,
+                version_formules=VERSION_FORMULES, **champs
+            ))
+    return lignes
+
+
+def enregistrer(essais):
+    """
+    Calcule et enregistre (insertion ou mise à jour en masse) avec les mesures
+    indexées des essais (core.analyses_resultats); retourne le nombre de lignes
+    """
+    from .analyses_resultats import indexer
+
+    essais = list(essais)
+    lignes = calculer(essais)
+    avec_resultat = {ligne.essai_id for ligne in lignes}
+    with transaction.atomic():
+        # Essais dont les résultats ne donnent plus aucune grandeur
+        ResultatCalcule.objects.filter(
+            essai_id__in=[essai_id for essai_id, _, _ in essais if essai_id not in avec_resultat]
+        ).delete()
+        ResultatCalcule.objects.bulk_create(
+            lignes, update_conflicts=True, unique_fields=['essai'],
+            update_fields=['type', 'source', 'version_formules', 'courbe_granulometrique', 'calcule_le'] + CHAMPS_CALCULES,
+        )
+        indexer(essais, lignes)
+    return len(lignes)
+
+
+def a_recalculer():
+    """Essais jamais calculés ou calculés avec une version antérieure des formules"""
+    return Essai.objects.exclude(resultat_calcule__version_formules=VERSION_FORMULES)
+
+
+def recalculer(essais=None, taille_lot=TAILLE_LOT):
+    """
+    Recalcule les résultats d'un ensemble d'essais (tous par défaut), par lots
+
+    Returns:
+        Nombre de résultats enregistrés
+    """
+    essais = Essai.objects.all() if essais is None else essais
+    lignes = essais.order_by().values_list('id', 'type', 'resultats').iterator(chunk_size=taille_lot)
+    total, lot = 0, []
+    for ligne in lignes:
+        lot.append(ligne)
+        if len(lot) >= taille_lot:
+            total += enregistrer(lot)
+            lot = []
+    if lot:
+        total += enregistrer(lot)
+    return total
@@ -0,0 +1,119 @@
+"""
+Calendrier de capacité du laboratoire
+Calcule la capacité utilisée, réservée et restante par type d'essai sur une
+plage de dates à partir des créneaux d'occupation (une seule requête)
+"""
+
+from datetime import timedelta
+
+from django.db.models import Count
+
+from .models import CapaciteLaboratoire, CreneauCapacite, PlanificationEssai
+from .utils import est_weekend, est_jour_ferie
+
+
+# Nombre maximum de jours renvoyés par le calendrier
+MAX_JOURS_CALENDRIER = 92
+
+
+def charger_capacites(types=None):
+    """Retourne {type_essai: capacite_quotidienne} en une requête"""
+    capacites = CapaciteLaboratoire.objects.all()
+    if types:
+        capacites = capacites.filter(type_essai__in=types)
+    return dict(capacites.values_list('type_essai', 'capacite_quotidienne'))
+
+
+def charger_utilisation(date_debut, date_fin, types=None, source='essais'):
+    """
+    Retourne {(type_essai, date): (utilise, reserve)} en une requête
+
+    Args:
+        source: 'essais' lit les créneaux d'occupation (essais réceptionnés et
+                réservations actives), 'planifications' compte les
+                planifications par date planifiée (une par essai, quelle que
+                soit capacite_utilisee, comme avant le calendrier)
+    """
+    if source == 'planifications':
+        lignes = PlanificationEssai.objects.filter(
+            date_planifiee__gte=date_debut,
+            date_planifiee__lte=date_fin
+        )
+        if types:
+            lignes = lignes.filter(essai__type__in=types)
+        lignes = lignes.values_list('essai__type', 'date_planifiee').annotate(
+            utilise=Count('id')
+        ).order_by()
+        return {(type_essai, jour): (utilise, 0) for type_essai, jour, utilise in lignes}
+
+    lignes = CreneauCapacite.objects.filter(date__gte=date_debut, date__lte=date_fin)
+    if types:
+        lignes = lignes.filter(type_essai__in=types)
+    lignes = lignes.values_list('type_essai', 'date', 'utilise', 'reserve')
+
+    return {(type_essai, jour): (utilise, reserve) for type_essai, jour, utilise, reserve in lignes}
+
+
+def cellule(capacite_totale, utilise, reserve=0):
+    """Construit une cellule du calendrier (capacité illimitée si non définie)"""
+    if capacite_totale is None:
+        return {
+            'capacite_totale': None,
+            'capacite_utilisee': utilise,
+            'capacite_reservee': reserve,
+            'capacite_restante': None,
+            'disponible': True,
+        }
+    return {
+        'capacite_totale': capacite_totale,
+        'capacite_utilisee': utilise,
+        'capacite_reservee': reserve,
+        'capacite_restante': max(0, capacite_totale - utilise - reserve),
+        'disponible': utilise + reserve < capacite_totale,
+    }
+
+
+def calendrier_capacite(date_debut, date_fin, types=None, source='essais'):
+    """
+    Calcule la matrice de capacité jour × type d'essai
+
+    Returns:
+        Liste de jours [{'date', 'ouvrable', 'capacites': {type: cellule}}]
+    """
+    capacites = charger_capacites(types)
+    types = list(types) if types else [t for t, _ in CapaciteLaboratoire.TYPE_ESSAI_CHOICES]
+    utilisation = charger_utilisation(date_debut, date_fin, types, source)
+
+    jours = []
+    jour = date_debut
+    while jour <= date_fin:
+        jours.append({
+            'date': jour,
+            'ouvrable': not est_weekend(jour) and not est_jour_ferie(jour),
+            'capacites': {
+                type_essai: cellule(capacites.get(type_essai), *utilisation.get((type_essai, jour), (0, 0)))
+                for type_essai in types
+            },
+        })
+        jour += timedelta(days=1)
+
+    return jours
+
+
+def capacite_du_jour(type_essai, date):
+    """Retourne la cellule de capacité pour un type d'essai à une date"""
+    return calendrier_capacite(date, date, [type_essai])[0]['capacites'][type_essai]
+
+
+def chercher_prochaine_date(type_essai, date_debut, max_jours=30):
+    """
+    Cherche le premier jour ouvrable avec de la capacité restante
+
+    Returns:
+        (date, cellule) ou (None, None) si aucune date dans la fenêtre
+    """
+    date_fin = date_debut + timedelta(days=max_jours - 1)
+    for jour in calendrier_capacite(date_debut, date_fin, [type_essai]):
+        if jour['ouvrable'] and jour['capacites'][type_essai]['disponible']:
+            return jour['date'], jour['capacites'][type_essai]
+    return None, None
@@ -0,0 +1,103 @@
+"""
+Requêtes conditionnelles (ETag / Last-Modified)
+Les validateurs sont calculés par un seul agrégat (dates de modification
+maximales + nombre de lignes) sur le queryset filtré: quand rien n'a changé,
+la réponse 304 est renvoyée sans rien sérialiser
+"""
+
+import hashlib
+from datetime import datetime
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+def validateurs(queryset, champs=('updated_at',), compteurs=None, version='', relations=()):
+    """
+    Calcule (etag, last_modified) d'un queryset
+
+    Le nombre de lignes détecte les suppressions, les dates maximales les
+    créations et modifications.
+
+    Args:
+        champs: Champs de date dont le maximum date la dernière modification
+        compteurs: {nom: Q} comptages conditionnels complétant l'empreinte
+                   (changements d'état sans date de modification)
+        version: Composante supplémentaire de l'ETag (paramètres de rendu...)
+        relations: Relations inverses imbriquées dans la réponse (essais): leur
+                   nombre et leur updated_at maximal entrent dans l'empreinte,
+                   leur modification ne touchant pas l'objet parent
+    """
+    # La jointure des relations duplique les lignes: comptages distincts
+    distinct = bool(relations)
+    agregats = queryset.order_by().aggregate(
+        nombre=Count('pk', distinct=distinct),
+        **{f'max_{champ}': Max(champ) for champ in champs},
+        **{
+            f'compte_{nom}': Count('pk', filter=condition, distinct=distinct)
+            for nom, condition in (compteurs or {}).items()
+        },
+        **{f'nombre_{relation}': Count(relation, distinct=True) for relation in relations},
+        **{f'max_{relation}_updated_at': Max(f'{relation}__updated_at') for relation in relations},
+    )
+    cles_dates = [f'max_{champ}' for champ in champs] + [f'max_{relation}_updated_at' for relation in relations]
+    dates = [agregats[cle] for cle in cles_dates if agregats[cle]]
+    dernier = max(dates) if dates else None
+
+    empreinte = '|'.join(str(valeur) for valeur in [version, *agregats.values()])
+    etag = quote_etag(hashlib.md5(empreinte.encode()).hexdigest())
+    return etag, dernier
+
+
+def reponse_conditionnelle(request, etag, dernier, construire):
+    """
+    Renvoie 304 si les validateurs du client correspondent, sinon construire()
+
+    La réponse porte ETag / Last-Modified et impose une revalidation par le
+    navigateur, qui renvoie alors de lui-même If-None-Match.
+    """
+    last_modified = int(dernier.timestamp()) if isinstance(dernier, datetime) else None
+    reponse = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if reponse is None:
+        reponse = construire()
+        if reponse.status_code != 200:
+            return reponse
+
+    reponse['ETag'] = etag
+    if last_modified is not None:
+        reponse['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(reponse, private=True, no_cache=True)
+    patch_vary_headers(reponse, ['Authorization'])
+    return reponse
+
+
+class ConditionnelMixin:
+    """
+    Ajoute le GET conditionnel à la liste d'un ViewSet
+
+    Les actions de liste personnalisées passent par self.conditionnel().
+    """
+
+    # Champs de date dont le maximum identifie une modification
+    champs_modification = ('updated_at',)
+
+    # Comptages conditionnels {nom: Q} ajoutés à l'empreinte
+    compteurs_modification = {}
+
+    # Relations inverses imbriquées dans les réponses (voir validateurs)
+    relations_modification = ()
+
+    def conditionnel(self, request, queryset, construire):
+        etag, dernier = validateurs(
+            queryset, self.champs_modification, self.compteurs_modification,
+            version=request.get_full_path(), relations=self.relations_modification
+        )
+        return reponse_conditionnelle(request, etag, dernier, construire)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditionnel(
+            request,
+            self.filter_queryset(self.get_queryset()),
+            lambda: super(ConditionnelMixin, self).list(request, *args, **kwargs)
+        )
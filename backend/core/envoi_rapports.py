@@ -0,0 +1,223 @@
+"""
+Envoi des rapports aux clients par email
+La requête HTTP met les rapports en file; un worker Celery envoie les emails
+par lots sur une seule connexion SMTP et réessaie les échecs avec un délai
+croissant. Le statut de chaque envoi est suivi sur RapportMarketing: chaque
+rapport est réservé (en_file -> en_cours) avant son envoi, un même rapport
+n'est donc jamais envoyé par deux tâches
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from . import blobs
+from .models import RapportMarketing, WorkflowValidation
+
+
+# Nombre d'emails envoyés par tâche (une connexion SMTP par lot)
+TAILLE_LOT = 20
+
+# Tentatives avant de marquer l'envoi en échec
+TENTATIVES_MAX = 5
+
+# Délai avant la première nouvelle tentative, doublé à chaque échec
+DELAI_NOUVELLE_TENTATIVE = 60
+
+# Statuts d'un envoi pas encore terminé (non remis en file)
+STATUTS_EN_COURS = ('en_file', 'en_cours')
+
+# Au-delà, un rapport en file sans tâche (message perdu) est remis en file;
+# supérieur au plus long délai entre deux tentatives
+DELAI_BLOCAGE = timedelta(minutes=30)
+
+
+def construire_email(rapport, connexion=None):
+    """Email du rapport au client, PDF en pièce jointe"""
+    message = f"""
+Bonjour,
+
+Veuillez trouver ci-joint le rapport d'essai pour l'échantillon {rapport.code_echantillon}.
+
+Client: {rapport.client_name}
+Date: {rapport.date_envoi_marketing.strftime('%d/%m/%Y %H:%M') if rapport.date_envoi_marketing else 'N/A'}
+
+Cordialement,
+Service Marketing - SNERTP
+Centre National d'Essais et de Recherches des Travaux Publics
+        """
+
+    email = EmailMessage(
+        subject=f'Rapport d\'essai SNERTP - {rapport.code_echantillon}',
+        body=message,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[rapport.email_client],
+        connection=connexion,
+    )
+    if rapport.fichier_id:
+        email.attach(f'Rapport_{rapport.code_echantillon}.pdf', blobs.lire(rapport.fichier), 'application/pdf')
+    return email
+
+
+def _planifier(ids):
+    """Crée les tâches d'envoi par lots après la transaction"""
+    from .tasks import envoyer_rapports_clients
+
+    lots = [[str(pk) for pk in ids[i:i + TAILLE_LOT]] for i in range(0, len(ids), TAILLE_LOT)]
+    transaction.on_commit(lambda: [envoyer_rapports_clients.delay(lot) for lot in lots])
+
+
+def mettre_en_file(rapports, email_client=None):
+    """
+    Met des rapports en file d'envoi
+
+    Les rapports déjà en file ou en cours d'envoi sont ignorés.
+
+    Args:
+        rapports: Rapports à envoyer (email_client déjà renseigné si email_client est None)
+        email_client: Destinataire commun
+
+    Returns:
+        Nombre de rapports mis en file
+    """
+    maintenant = timezone.now()
+    rapports = [rapport for rapport in rapports if rapport.statut_envoi not in STATUTS_EN_COURS]
+    for rapport in rapports:
+        if email_client:
+            rapport.email_client = email_client
+        rapport.statut_envoi = 'en_file'
+        rapport.tentatives_envoi = 0
+        rapport.erreur_envoi = ''
+        rapport.date_demande_envoi = maintenant
+        rapport.updated_at = maintenant
+
+    # Le filtre écarte les rapports mis en file entre-temps par une autre requête
+    RapportMarketing.objects.exclude(statut_envoi__in=STATUTS_EN_COURS).bulk_update(
+        rapports,
+        ['email_client', 'statut_envoi', 'tentatives_envoi', 'erreur_envoi', 'date_demande_envoi', 'updated_at']
+    )
+    # Seuls les rapports réellement mis en file par cette requête sont planifiés
+    ids = list(RapportMarketing.objects.filter(
+        pk__in=[rapport.pk for rapport in rapports], statut_envoi='en_file', date_demande_envoi=maintenant
+    ).values_list('pk', flat=True))
+
+    _planifier(ids)
+    return len(ids)
+
+
+def _reserver(rapport, maintenant):
+    """Passe le rapport de en_file à en_cours; False si une autre tâche l'a déjà pris"""
+    return RapportMarketing.objects.filter(pk=rapport.pk, statut_envoi='en_file').update(
+        statut_envoi='en_cours', updated_at=maintenant
+    ) == 1
+
+
+def _marquer_envoye(rapport, maintenant):
+    RapportMarketing.objects.filter(pk=rapport.pk, statut_envoi='en_cours').update(
+        statut='envoye', statut_envoi='envoye', date_envoi_client=maintenant,
+        erreur_envoi='', tentatives_envoi=rapport.tentatives_envoi + 1, updated_at=maintenant
+    )
+    # Workflow le plus récent de l'échantillon, comme à l'envoi synchrone
+    workflow = WorkflowValidation.objects.filter(code_echantillon=rapport.code_echantillon).values('pk')[:1]
+    WorkflowValidation.objects.filter(pk__in=workflow).update(
+        etape_actuelle='client', date_envoi_client=maintenant,
+        email_client=rapport.email_client, updated_at=maintenant
+    )
+
+
+def _echec(rapport, erreur, maintenant, statut='en_cours'):
+    """
+    Enregistre un échec du rapport encore au statut donné
+
+    Returns:
+        True si l'envoi doit être réessayé
+    """
+    tentatives = rapport.tentatives_envoi + 1
+    definitif = tentatives >= TENTATIVES_MAX
+    modifies = RapportMarketing.objects.filter(pk=rapport.pk, statut_envoi=statut).update(
+        statut_envoi='echec' if definitif else 'en_file',
+        tentatives_envoi=tentatives, erreur_envoi=str(erreur)[:1000], updated_at=maintenant
+    )
+    return modifies == 1 and not definitif
+
+
+def envoyer_lot(ids):
+    """
+    Envoie les rapports en file parmi ids sur une seule connexion SMTP
+
+    Chaque rapport est réservé juste avant son envoi; les rapports déjà
+    envoyés, retirés de la file ou pris par une autre tâche sont ignorés: un
+    lot peut être rejoué sans envoyer deux fois le même email.
+
+    Returns:
+        (envoyes, a_reessayer): nombre d'envois réussis et ids à réessayer
+    """
+    rapports = list(
+        RapportMarketing.objects.select_related('fichier')
+        .filter(pk__in=ids, statut_envoi='en_file')
+    )
+    if not rapports:
+        return 0, []
+
+    envoyes, a_reessayer = 0, []
+    connexion = get_connection(fail_silently=False)
+    try:
+        connexion.open()
+    except Exception as e:
+        # Serveur SMTP injoignable: tout le lot est à réessayer
+        maintenant = timezone.now()
+        return 0, [str(rapport.pk) for rapport in rapports if _echec(rapport, e, maintenant, 'en_file')]
+
+    try:
+        for rapport in rapports:
+            maintenant = timezone.now()
+            if not _reserver(rapport, maintenant):
+                continue
+            try:
+                construire_email(rapport, connexion).send()
+            except Exception as e:
+                if _echec(rapport, e, maintenant):
+                    a_reessayer.append(str(rapport.pk))
+                continue
+            _marquer_envoye(rapport, maintenant)
+            envoyes += 1
+    finally:
+        connexion.close()
+    return envoyes, a_reessayer
+
+
+def rapports_a_envoyer():
+    """Rapports en attente jamais envoyés ou en échec, avec l'email du client en repli"""
+    return RapportMarketing.objects.select_related('echantillon__client').filter(
+        statut='en_attente', statut_envoi__in=['non_envoye', 'echec']
+    )
+
+
+def relancer_envois_bloques():
+    """
+    Reprend les envois restés sans tâche
+
+    Un rapport en file depuis plus de DELAI_BLOCAGE (tâche non créée après la
+    transaction, message perdu par le broker) est remis en file. Un rapport en
+    cours depuis aussi longtemps (worker arrêté pendant l'envoi) a peut-être
+    été envoyé: il passe en échec pour être relancé à la main.
+
+    Returns:
+        (relances, interrompus)
+    """
+    maintenant = timezone.now()
+    limite = maintenant - DELAI_BLOCAGE
+    interrompus = RapportMarketing.objects.filter(statut_envoi='en_cours', updated_at__lt=limite).update(
+        statut_envoi='echec', erreur_envoi='Envoi interrompu, à vérifier avant de relancer', updated_at=maintenant
+    )
+    with transaction.atomic():
+        ids = list(
+            RapportMarketing.objects.select_for_update(skip_locked=True)
+            .filter(statut_envoi='en_file', updated_at__lt=limite).values_list('pk', flat=True)
+        )
+        RapportMarketing.objects.filter(pk__in=ids).update(updated_at=maintenant)
+        _planifier(ids)
+    return len(ids), interrompus
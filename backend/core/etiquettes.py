@@ -0,0 +1,184 @@
+"""
+QR codes et étiquettes des échantillons
+Les images QR sont rendues par le serveur et gardées sur le stockage de médias
+(clé: code de l'échantillon et empreinte du contenu) ainsi qu'en mémoire (LRU).
+Les planches d'étiquettes d'un lot de réception sont produites en PDF par un
+worker Celery et stockées comme blobs
+"""
+
+import hashlib
+import io
+import itertools
+import json
+from functools import lru_cache
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageDraw
+from reportlab.graphics.barcode.qr import QrCodeWidget
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas
+
+from . import blobs
+from .models import Blob, Echantillon
+
+
+# Taille d'un module (pixel) du QR code PNG, et bornes acceptées par l'API
+TAILLE_MODULE = 8
+TAILLES_MODULE = range(2, 21)
+
+# Modules blancs autour du QR code (zone de silence)
+MARGE_QR = 4
+
+# Nombre d'images QR gardées en mémoire par processus
+TAILLE_CACHE_QR = 512
+
+# Grille des planches A4: colonnes x lignes, marges et taille d'une étiquette
+COLONNES, LIGNES = 3, 8
+MARGE_PAGE_X, MARGE_PAGE_Y = 7 * mm, 10 * mm
+LARGEUR_ETIQUETTE = (A4[0] - 2 * MARGE_PAGE_X) / COLONNES
+HAUTEUR_ETIQUETTE = (A4[1] - 2 * MARGE_PAGE_Y) / LIGNES
+
+# Échantillons par planche, au plus
+MAX_ETIQUETTES = 1000
+
+# Durée de validité du lien entre un lot et sa planche déjà produite
+DUREE_CACHE_PLANCHE = 24 * 3600
+
+CHAMPS_ETIQUETTE = ['id', 'code', 'qr_code', 'client_nom', 'nature', 'profondeur_debut', 'profondeur_fin', 'date_reception']
+
+
+@lru_cache(maxsize=TAILLE_CACHE_QR)
+def matrice_qr(valeur):
+    """Modules du QR code (lignes de booléens, True = noir)"""
+    widget = QrCodeWidget(valeur, barLevel='M')
+    widget.qr.make()
+    return tuple(tuple(bool(module) for module in ligne) for ligne in widget.qr.modules)
+
+
+def chemin_qr(code, valeur, module):
+    empreinte = hashlib.sha256(valeur.encode()).hexdigest()[:12]
+    return f"qr/{code.replace('/', '-')}-{empreinte}-{module}.png"
+
+
+def _dessiner_png(matrice, module):
+    cote = (len(matrice) + 2 * MARGE_QR) * module
+    image = Image.new('1', (cote, cote), 1)
+    dessin = ImageDraw.Draw(image)
+    for y, ligne in enumerate(matrice):
+        for x, noir in enumerate(ligne):
+            if noir:
+                gauche, haut = (x + MARGE_QR) * module, (y + MARGE_QR) * module
+                dessin.rectangle([gauche, haut, gauche + module - 1, haut + module - 1], fill=0)
+    sortie = io.BytesIO()
+    image.save(sortie, 'PNG', optimize=True)
+    return sortie.getvalue()
+
+
+@lru_cache(maxsize=TAILLE_CACHE_QR)
+def png_qr(code, valeur, module=TAILLE_MODULE):
+    """
+    Image PNG du QR code d'un échantillon
+
+    Cherchée en mémoire, puis sur le stockage, sinon rendue et enregistrée.
+    """
+    chemin = chemin_qr(code, valeur, module)
+    if default_storage.exists(chemin):
+        with default_storage.open(chemin, 'rb') as fichier:
+            return fichier.read()
+
+    octets = _dessiner_png(matrice_qr(valeur), module)
+    enregistre = default_storage.save(chemin, ContentFile(octets))
+    if enregistre != chemin:
+        # Rendue en parallèle par une autre requête: même contenu
+        default_storage.delete(enregistre)
+    return octets
+
+
+def donnees_etiquettes(echantillons):
+    """Contenu des étiquettes d'un lot, dans l'ordre d'impression"""
+    natures = dict(Echantillon.NATURE_CHOICES)
+    return [
+        {
+            'id': str(ligne['id']),
+            'code': ligne['code'],
+            'qr_code': ligne['qr_code'],
+            'client': ligne['client_nom'],
+            'nature': natures.get(ligne['nature'], ligne['nature']),
+            'profondeur': f"{ligne['profondeur_debut']} - {ligne['profondeur_fin']} m",
+            'date_reception': ligne['date_reception'].strftime('%d/%m/%Y') if ligne['date_reception'] else '',
+        }
+        for ligne in echantillons.order_by('code').values(*CHAMPS_ETIQUETTE)[:MAX_ETIQUETTES]
+    ]
+
+
+def cle_planche(donnees):
+    contenu = json.dumps([[ligne[champ] for champ in sorted(ligne) if champ != 'id'] for ligne in donnees])
+    return 'etiquettes:' + hashlib.sha256(contenu.encode()).hexdigest()
+
+
+def planche_en_cache(donnees):
+    """Blob de la planche déjà produite pour ce contenu, sinon None"""
+    sha256 = cache.get(cle_planche(donnees))
+    return Blob.objects.filter(pk=sha256).first() if sha256 else None
+
+
+def _dessiner_qr_pdf(dessin, matrice, x, y, cote):
+    """QR code vectoriel de cote points, coin inférieur gauche en (x, y)"""
+    taille = cote / (len(matrice) + 2 * MARGE_QR)
+    for rang, ligne in enumerate(matrice):
+        colonne = 0
+        for noir, modules in itertools.groupby(ligne):
+            nombre = len(list(modules))
+            if noir:
+                dessin.rect(
+                    x + (colonne + MARGE_QR) * taille, y + cote - (rang + MARGE_QR + 1) * taille,
+                    nombre * taille, taille, stroke=0, fill=1
+                )
+            colonne += nombre
+
+
+def _dessiner_etiquette(dessin, etiquette, x, y):
+    cote_qr = HAUTEUR_ETIQUETTE - 4 * mm
+    _dessiner_qr_pdf(dessin, matrice_qr(etiquette['qr_code']), x + 1 * mm, y + 2 * mm, cote_qr)
+
+    texte_x = x + cote_qr + 3 * mm
+    largeur_texte = LARGEUR_ETIQUETTE - cote_qr - 5 * mm
+    dessin.setFont('Helvetica-Bold', 10)
+    dessin.drawString(texte_x, y + HAUTEUR_ETIQUETTE - 9 * mm, etiquette['code'])
+    dessin.setFont('Helvetica', 7)
+    lignes = [etiquette['client'], etiquette['nature'], etiquette['profondeur'], etiquette['date_reception']]
+    for i, ligne in enumerate(lignes):
+        texte = ligne or ''
+        while texte and dessin.stringWidth(texte, 'Helvetica', 7) > largeur_texte:
+            texte = texte[:-1]
+        dessin.drawString(texte_x, y + HAUTEUR_ETIQUETTE - (14 + 4 * i) * mm, texte)
+
+
+def construire_planche(donnees):
+    """PDF A4 des étiquettes (COLONNES x LIGNES par page)"""
+    sortie = io.BytesIO()
+    dessin = canvas.Canvas(sortie, pagesize=A4, invariant=True)
+    dessin.setTitle("Étiquettes d'échantillons")
+    par_page = COLONNES * LIGNES
+    for indice, etiquette in enumerate(donnees):
+        if indice and indice % par_page == 0:
+            dessin.showPage()
+        rang, colonne = divmod(indice % par_page, COLONNES)
+        x = MARGE_PAGE_X + colonne * LARGEUR_ETIQUETTE
+        y = A4[1] - MARGE_PAGE_Y - (rang + 1) * HAUTEUR_ETIQUETTE
+        _dessiner_etiquette(dessin, etiquette, x, y)
+    dessin.save()
+    return sortie.getvalue()
+
+
+def generer_planche(ids):
+    """Produit (ou retrouve) la planche des échantillons ids; retourne son Blob"""
+    donnees = donnees_etiquettes(Echantillon.objects.filter(pk__in=ids))
+    blob = planche_en_cache(donnees)
+    if blob is None:
+        blob = blobs.stocker_octets(construire_planche(donnees), 'application/pdf')
+        cache.set(cle_planche(donnees), blob.sha256, DUREE_CACHE_PLANCHE)
+    return blob
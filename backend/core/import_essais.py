@@ -0,0 +1,268 @@
+"""
+Dépôt groupé des fichiers de mesures des essais
+Les fichiers (envoyés un par un ou dans une archive zip) sont copiés par
+morceaux sur le stockage et rattachés à leur essai pendant la requête; la
+lecture des exports d'appareils (CSV, XLSX) dans resultats est faite ensuite
+par un worker Celery
+"""
+
+import codecs
+import csv
+import io
+import os
+import re
+import uuid
+import zipfile
+from contextlib import nullcontext
+from datetime import date, datetime
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from .models import Essai
+
+
+EXTENSIONS_CSV = ('.csv', '.tsv', '.txt')
+EXTENSIONS_XLSX = ('.xlsx', '.xlsm')
+
+# Limites d'une archive (taille décompressée, nombre de fichiers)
+TAILLE_MAX_ARCHIVE = 500 * 1024 * 1024
+FICHIERS_MAX_ARCHIVE = 500
+
+# Lignes lues au plus par fichier
+LIGNES_MAX = 10000
+
+# Nom de fichier désignant l'essai: <code échantillon>_<type>, ex. S-0001-26_AG.csv
+re_nom_fichier = re.compile(r'^(?P<code>[A-Za-z]+-\d+-\d+)[_ ](?P<type>[A-Za-z]+)', re.IGNORECASE)
+
+re_nombre = re.compile(r'^[-+]?\d+([.,]\d+)?([eE][-+]?\d+)?$')
+
+
+class ArchiveInvalide(ValueError):
+    """Levée quand une archive n'est pas un zip lisible ou dépasse les limites"""
+
+
+def lisible(nom):
+    """Le fichier est un export dont les mesures peuvent être lues"""
+    return os.path.splitext(nom)[1].lower() in EXTENSIONS_CSV + EXTENSIONS_XLSX
+
+
+def _membres(archive):
+    """(nom, ouvrir) des fichiers d'une archive zip"""
+    try:
+        zip_archive = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile:
+        raise ArchiveInvalide(f"{archive.name}: archive zip illisible")
+
+    membres = [
+        info for info in zip_archive.infolist()
+        if not info.is_dir() and not os.path.basename(info.filename).startswith('.')
+        and not info.filename.startswith('__MACOSX/')
+    ]
+    if len(membres) > FICHIERS_MAX_ARCHIVE or sum(info.file_size for info in membres) > TAILLE_MAX_ARCHIVE:
+        raise ArchiveInvalide(f"{archive.name}: archive trop volumineuse")
+    return [
+        (os.path.basename(info.filename), lambda info=info: zip_archive.open(info))
+        for info in membres
+    ]
+
+
+def _cle_nom(nom):
+    """(code échantillon, type d'essai) désignés par un nom de fichier, ou None"""
+    correspondance = re_nom_fichier.match(os.path.splitext(nom)[0])
+    if not correspondance:
+        return None
+    types = {type_essai.lower(): type_essai for type_essai, _ in Essai.TYPE_CHOICES}
+    type_essai = types.get(correspondance['type'].lower())
+    if type_essai is None:
+        return None
+    # Le "/" du code (S-0001/26) est écrit "-" dans les noms de fichiers
+    code, _, annee = correspondance['code'].rpartition('-')
+    return f"{code.upper()}/{annee}", type_essai
+
+
+def _uuid_valide(valeur):
+    try:
+        uuid.UUID(str(valeur))
+    except ValueError:
+        return False
+    return True
+
+
+def essais_des_fichiers(noms, correspondance):
+    """
+    Essai de chaque fichier, en deux requêtes au plus
+
+    Args:
+        correspondance: {nom de fichier: id d'essai}, prioritaire sur le nom
+    """
+    ids = {nom: essai_id for nom, essai_id in correspondance.items() if _uuid_valide(essai_id)}
+    par_id = Essai.objects.select_related('echantillon').in_bulk(set(ids.values()))
+
+    cles = {nom: _cle_nom(nom) for nom in noms if nom not in correspondance}
+    codes = {cle[0] for cle in cles.values() if cle}
+    par_cle = {}
+    # Le plus récent l'emporte (essai repris après rejet)
+    for essai in Essai.objects.select_related('echantillon').filter(echantillon__code__in=codes).order_by('created_at'):
+        par_cle[(essai.echantillon.code, essai.type)] = essai
+
+    essais = {}
+    for nom in noms:
+        if nom in correspondance:
+            essais[nom] = par_id.get(uuid.UUID(ids[nom])) if nom in ids else None
+        else:
+            essais[nom] = par_cle.get(cles[nom]) if cles[nom] else None
+    return essais
+
+
+def deposer(fichiers, archives=(), correspondance=None, autorise=lambda essai: True):
+    """
+    Enregistre les fichiers envoyés et les rattache à leurs essais
+
+    Args:
+        fichiers: Fichiers envoyés (UploadedFile)
+        archives: Archives zip dont chaque fichier est déposé
+        correspondance: {nom de fichier: id d'essai}
+        autorise: Vérifie que l'utilisateur peut modifier l'essai
+
+    Returns:
+        (deposes, ignores): [{'nom', 'essai'}] et [{'nom', 'erreur'}]
+    """
+    sources, ignores = [], []
+    for fichier in fichiers:
+        sources.append((fichier.name, lambda fichier=fichier: nullcontext(fichier)))
+    for archive in archives:
+        try:
+            sources.extend(_membres(archive))
+        except ArchiveInvalide as e:
+            ignores.append({'nom': archive.name, 'erreur': str(e)})
+
+    essais = essais_des_fichiers([nom for nom, _ in sources], correspondance or {})
+    retenus = {}
+    for nom, ouvrir in sources:
+        essai = essais[nom]
+        if essai is None:
+            ignores.append({'nom': nom, 'erreur': 'Essai introuvable (nom attendu: <code échantillon>_<type>.<ext>)'})
+        elif not autorise(essai):
+            ignores.append({'nom': nom, 'erreur': "Vous n'êtes pas autorisé à modifier cet essai"})
+        elif essai.pk in retenus and lisible(retenus[essai.pk][0]) and not lisible(nom):
+            # Un export de mesures l'emporte sur un document (PDF, photo) du même essai
+            ignores.append({'nom': nom, 'erreur': f'Remplacé par {retenus[essai.pk][0]}'})
+        else:
+            if essai.pk in retenus:
+                ignores.append({'nom': retenus[essai.pk][0], 'erreur': f'Remplacé par {nom}'})
+            retenus[essai.pk] = (nom, ouvrir)
+
+    deposes = []
+    for essai_id, (nom, ouvrir) in retenus.items():
+        with ouvrir() as flux:
+            # Copie par morceaux: ni le fichier ni le membre d'archive ne sont chargés en mémoire
+            chemin = default_storage.save(f'essais/{nom}', File(flux, name=nom))
+        Essai.objects.filter(pk=essai_id).update(fichier=chemin, updated_at=timezone.now())
+        deposes.append({'nom': nom, 'essai': str(essai_id)})
+    return deposes, ignores
+
+
+def _valeur(cellule):
+    if isinstance(cellule, str):
+        cellule = cellule.strip()
+        if re_nombre.match(cellule):
+            nombre = float(cellule.replace(',', '.'))
+            return int(nombre) if nombre.is_integer() and '.' not in cellule and ',' not in cellule else nombre
+        return cellule
+    if isinstance(cellule, (datetime, date)):
+        return cellule.isoformat()
+    if isinstance(cellule, float) and cellule.is_integer():
+        return int(cellule)
+    return cellule
+
+
+def _lignes_csv(fichier):
+    debut = fichier.read(64 * 1024)
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(debut, final=False)
+        encodage = 'utf-8-sig'
+    except UnicodeDecodeError:
+        # Exports Excel sous Windows
+        encodage = 'cp1252'
+    try:
+        dialecte = csv.Sniffer().sniff(debut.decode(encodage, errors='ignore'), delimiters=';,\t')
+    except csv.Error:
+        dialecte = csv.excel
+    fichier.seek(0)
+    yield from csv.reader(io.TextIOWrapper(fichier, encoding=encodage, errors='replace', newline=''), dialecte)
+
+
+def _lignes_xlsx(fichier):
+    import openpyxl
+
+    classeur = openpyxl.load_workbook(fichier, read_only=True, data_only=True)
+    try:
+        yield from classeur.worksheets[0].iter_rows(values_only=True)
+    finally:
+        classeur.close()
+
+
+def lire_mesures(nom, fichier):
+    """
+    Résultats lus dans un export d'appareil
+
+    Deux colonnes (libellé, valeur) donnent un dictionnaire de valeurs; un
+    tableau avec en-tête donne {'colonnes': [...], 'mesures': [{...}, ...]}.
+
+    Returns:
+        dict, ou None si le format n'est pas lu (PDF, images...)
+    """
+    if not lisible(nom):
+        return None
+    if os.path.splitext(nom)[1].lower() in EXTENSIONS_XLSX:
+        lignes = _lignes_xlsx(fichier)
+    else:
+        lignes = _lignes_csv(fichier)
+
+    tableau = []
+    for ligne in lignes:
+        cellules = [_valeur(cellule) for cellule in ligne]
+        while cellules and cellules[-1] in (None, ''):
+            cellules.pop()
+        if cellules:
+            tableau.append(cellules)
+        if len(tableau) > LIGNES_MAX:
+            break
+    if not tableau:
+        return {}
+
+    if all(len(ligne) <= 2 for ligne in tableau) and not any(isinstance(ligne[0], (int, float)) for ligne in tableau):
+        return {str(ligne[0]): ligne[1] if len(ligne) > 1 else None for ligne in tableau}
+
+    colonnes = [str(cellule) if cellule not in (None, '') else f'colonne_{i + 1}' for i, cellule in enumerate(tableau[0])]
+    return {
+        'colonnes': colonnes,
+        'mesures': [dict(zip(colonnes, ligne)) for ligne in tableau[1:LIGNES_MAX + 1]],
+    }
+
+
+def importer(essai_id):
+    """
+    Lit le fichier d'un essai et complète ses résultats
+
+    Returns:
+        {'essai', 'fichier', 'statut': 'importe' | 'non_lu' | 'erreur', 'erreur'?}
+    """
+    essai = Essai.objects.filter(pk=essai_id).only('id', 'fichier', 'resultats').first()
+    if essai is None or not essai.fichier:
+        return {'essai': str(essai_id), 'fichier': None, 'statut': 'erreur', 'erreur': 'Aucun fichier'}
+
+    rapport = {'essai': str(essai_id), 'fichier': essai.fichier.name}
+    try:
+        with essai.fichier.open('rb') as fichier:
+            mesures = lire_mesures(essai.fichier.name, fichier)
+    except Exception as e:
+        return {**rapport, 'statut': 'erreur', 'erreur': str(e)[:500]}
+    if mesures is None:
+        return {**rapport, 'statut': 'non_lu'}
+
+    resultats = essai.resultats if isinstance(essai.resultats, dict) else {}
+    Essai.objects.filter(pk=essai_id).update(resultats={**resultats, **mesures}, updated_at=timezone.now())
+    return {**rapport, 'statut': 'importe'}
@@ -0,0 +1,74 @@
+from statistics import median
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import resolve
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.middleware_compression import brotli, compresser
+from core.renderers import ORJSONRenderer
+
+
+ENDPOINTS = [
+    '/api/echantillons/',
+    '/api/echantillons/?page_size=500',
+    '/api/essais/',
+    '/api/workflows/',
+    '/api/rapport-validations/',
+    '/api/dashboard/stats/',
+]
+
+
+class Command(BaseCommand):
+    help = 'Compare le temps de rendu JSON et la taille des reponses (JSON standard / orjson, gzip / brotli)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help="Utilisateur pour les requetes (defaut: premier superutilisateur)")
+        parser.add_argument('--repetitions', type=int, default=20)
+        parser.add_argument('endpoints', nargs='*', help='Chemins a mesurer (defaut: endpoints representatifs)')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        if options['username']:
+            user = User.objects.filter(username=options['username']).first()
+        else:
+            user = User.objects.filter(is_superuser=True).first()
+        if user is None:
+            raise CommandError('Aucun utilisateur pour executer les requetes')
+
+        hote = next((h for h in settings.ALLOWED_HOSTS if h and '*' not in h), 'localhost').lstrip('.')
+        factory = APIRequestFactory()
+        repetitions = options['repetitions']
+
+        self.stdout.write(
+            f"{'endpoint':40} {'json ms':>9} {'orjson ms':>9} {'gain':>6} "
+            f"{'octets':>10} {'gzip':>9} {'brotli':>9}"
+        )
+        for chemin in options['endpoints'] or ENDPOINTS:
+            request = factory.get(chemin, HTTP_HOST=hote)
+            force_authenticate(request, user=user)
+            correspondance = resolve(chemin.split('?')[0])
+            response = correspondance.func(request, *correspondance.args, **correspondance.kwargs)
+            if response.status_code != 200:
+                self.stdout.write(self.style.WARNING(f'{chemin:40} HTTP {response.status_code}'))
+                continue
+
+            temps = {}
+            for nom, renderer in (('json', JSONRenderer()), ('orjson', ORJSONRenderer())):
+                mesures = []
+                for _ in range(repetitions):
+                    debut = perf_counter()
+                    contenu = renderer.render(response.data)
+                    mesures.append(perf_counter() - debut)
+                temps[nom] = median(mesures) * 1000
+
+            taille_gzip = len(compresser(contenu, 'gzip'))
+            taille_brotli = len(compresser(contenu, 'br')) if brotli else None
+            self.stdout.write(
+                f"{chemin:40} {temps['json']:9.2f} {temps['orjson']:9.2f} "
+                f"{temps['json'] / max(temps['orjson'], 1e-9):5.1f}x "
+                f"{len(contenu):10} {taille_gzip:9} {taille_brotli if taille_brotli else '-':>9}"
+            )
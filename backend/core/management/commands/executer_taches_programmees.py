@@ -17,8 +17,8 @@ class Command(BaseCommand):
         count = 0
         for tache in taches:
             try:
-                if tache.type_tache == 'envoi_essai' and tache.essai:
-                    essai = tache.essai
+                if tache.type_tache == 'envoi_essai' and tache.essai_id:
+                    essai = Essai.objects.select_related('echantillon').get(id=tache.essai_id)
                     essai.statut = 'en_cours'
                     essai.date_debut = timezone.now().date()
                     essai.save()
@@ -31,8 +31,8 @@ class Command(BaseCommand):
                         f'Essai {essai.type} demarre automatiquement'
                     ))
                 
-                elif tache.type_tache == 'envoi_traitement' and tache.echantillon:
-                    echantillon = tache.echantillon
+                elif tache.type_tache == 'envoi_traitement' and tache.echantillon_id:
+                    echantillon = Echantillon.objects.get(id=tache.echantillon_id)
                     echantillon.statut = 'traitement'
                     echantillon.save()
                     
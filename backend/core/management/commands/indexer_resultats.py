@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.analyses_resultats import a_indexer
+from core.calculs_geotechniques import recalculer
+from core.models import Essai, MesureResultat
+
+
+class Command(BaseCommand):
+    help = 'Remplit la table des mesures indexées (mesures_resultats) à partir des résultats des essais'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tous', action='store_true', help='Réindexer tous les essais, pas seulement ceux sans mesures')
+        parser.add_argument('--taille-lot', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        essais = Essai.objects.filter(resultats__isnull=False) if options['tous'] else a_indexer()
+
+        debut = time.monotonic()
+        # Les mesures sont indexées avec les grandeurs calculées, lot par lot
+        nombre = recalculer(essais, taille_lot=options['taille_lot'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{nombre} essais calculés, {MesureResultat.objects.count()} mesures indexées '
+            f'en {time.monotonic() - debut:.1f} s'
+        ))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.calculs_geotechniques import VERSION_FORMULES, a_recalculer, recalculer
+from core.models import Essai
+
+
+class Command(BaseCommand):
+    help = 'Recalcule les grandeurs géotechniques des essais (après une correction de formule)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tous', action='store_true', help='Recalculer tous les essais, pas seulement ceux à jour d\'une version antérieure')
+        parser.add_argument('--type', dest='type_essai', choices=[code for code, _ in Essai.TYPE_CHOICES])
+
+    def handle(self, *args, **options):
+        essais = Essai.objects.all() if options['tous'] else a_recalculer()
+        if options['type_essai']:
+            essais = essais.filter(type=options['type_essai'])
+
+        debut = time.monotonic()
+        nombre = recalculer(essais)
+        self.stdout.write(self.style.SUCCESS(
+            f'{nombre} résultats calculés (formules v{VERSION_FORMULES}) en {time.monotonic() - debut:.1f} s'
+        ))
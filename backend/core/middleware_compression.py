@@ -0,0 +1,78 @@
+"""
+Compression des réponses négociée sur Accept-Encoding
+Brotli si le module est installé et accepté par le client, sinon gzip.
+Les petites réponses et les réponses en flux (fichiers statiques de
+WhiteNoise, téléchargements) ne sont pas recompressées
+"""
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    brotli = None
+
+
+# Taille minimale (octets) en dessous de laquelle la compression ne rapporte rien
+TAILLE_MIN_COMPRESSION = 1024
+
+re_accepte_gzip = _lazy_re_compile(r'\bgzip\b')
+re_accepte_brotli = _lazy_re_compile(r'\bbr\b')
+
+
+def choisir_encodage(accept_encoding):
+    """Retourne 'br', 'gzip' ou None selon l'en-tête Accept-Encoding"""
+    if brotli is not None and re_accepte_brotli.search(accept_encoding):
+        return 'br'
+    if re_accepte_gzip.search(accept_encoding):
+        return 'gzip'
+    return None
+
+
+def compresser(contenu, encodage):
+    if encodage == 'br':
+        # Qualité 5: bon compromis taux / temps CPU pour du JSON dynamique
+        return brotli.compress(contenu, quality=5)
+    return compress_string(contenu)
+
+
+class CompressionMiddleware:
+    """Compresse les réponses volumineuses (API JSON principalement)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.taille_min = getattr(settings, 'COMPRESSION_TAILLE_MIN', TAILLE_MIN_COMPRESSION)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if (
+            response.streaming
+            or response.has_header('Content-Encoding')
+            or response.status_code in (204, 206, 304)
+            or len(response.content) < self.taille_min
+        ):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encodage = choisir_encodage(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encodage is None:
+            return response
+
+        compresse = compresser(response.content, encodage)
+        if len(compresse) >= len(response.content):
+            return response
+
+        response.content = compresse
+        response['Content-Length'] = str(len(compresse))
+        response['Content-Encoding'] = encodage
+
+        # Un ETag fort ne vaut plus pour le corps compressé
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+
+        return response
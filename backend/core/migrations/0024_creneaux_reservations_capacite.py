@@ -0,0 +1,72 @@
+# Generated by Django 5.0.1 on 2026-10-19 15:56
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remplir_creneaux(apps, schema_editor):
+    """Initialise les créneaux à partir des essais déjà réceptionnés"""
+    Essai = apps.get_model('core', 'Essai')
+    CreneauCapacite = apps.get_model('core', 'CreneauCapacite')
+
+    lignes = Essai.objects.filter(date_reception__isnull=False).values_list(
+        'type', 'date_reception'
+    ).annotate(nombre=Count('id')).order_by()
+
+    CreneauCapacite.objects.bulk_create(
+        [
+            CreneauCapacite(type_essai=type_essai, date=jour, utilise=nombre)
+            for type_essai, jour, nombre in lignes
+        ],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_add_client_id_to_workflow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CreneauCapacite',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type_essai', models.CharField(choices=[('AG', 'Analyse Granulométrique'), ('Proctor', 'Proctor'), ('CBR', 'CBR'), ('Oedometre', 'Œdomètre'), ('Cisaillement', 'Cisaillement')], max_length=20)),
+                ('date', models.DateField()),
+                ('utilise', models.PositiveIntegerField(default=0, help_text='Essais réceptionnés à cette date')),
+                ('reserve', models.PositiveIntegerField(default=0, help_text='Réservations temporaires actives')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'creneaux_capacite',
+                'ordering': ['date', 'type_essai'],
+                'indexes': [models.Index(fields=['date'], name='creneaux_ca_date_751b20_idx')],
+                'unique_together': {('type_essai', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ReservationCapacite',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('type_essai', models.CharField(choices=[('AG', 'Analyse Granulométrique'), ('Proctor', 'Proctor'), ('CBR', 'CBR'), ('Oedometre', 'Œdomètre'), ('Cisaillement', 'Cisaillement')], max_length=20)),
+                ('date', models.DateField()),
+                ('quantite', models.PositiveIntegerField(default=1)),
+                ('statut', models.CharField(choices=[('active', 'Active'), ('confirmee', 'Confirmée'), ('liberee', 'Libérée'), ('expiree', 'Expirée')], default='active', max_length=15)),
+                ('expire_le', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reservations_capacite', to=settings.AUTH_USER_MODEL)),
+                ('essai', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reservations_capacite', to='core.essai')),
+            ],
+            options={
+                'db_table': 'reservations_capacite',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['statut', 'expire_le'], name='reservation_statut_a92384_idx')],
+            },
+        ),
+        migrations.RunPython(remplir_creneaux, migrations.RunPython.noop),
+    ]
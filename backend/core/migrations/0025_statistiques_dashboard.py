@@ -0,0 +1,25 @@
+# Generated by Django 5.0.1 on 2026-10-19 16:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_creneaux_reservations_capacite'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatistiquesDashboard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cle', models.CharField(default='global', max_length=50, unique=True)),
+                ('donnees', models.JSONField(default=dict)),
+                ('genere_le', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'statistiques_dashboard',
+            },
+        ),
+    ]
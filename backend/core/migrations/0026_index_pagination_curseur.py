@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-19 16:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_statistiques_dashboard'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='actionlog',
+            index=models.Index(fields=['created_at', 'id'], name='action_logs_created_6f4d13_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='echantillon',
+            index=models.Index(fields=['created_at', 'id'], name='echantillon_created_6d8d0b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='essai',
+            index=models.Index(fields=['created_at', 'id'], name='essais_created_4dc550_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='notificatio_user_id_66dee4_idx'),
+        ),
+    ]
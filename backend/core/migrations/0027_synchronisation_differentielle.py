@@ -0,0 +1,60 @@
+# Generated by Django 5.0.1 on 2026-10-19 16:10
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def dater_notifications(apps, schema_editor):
+    """Les notifications existantes sont datées de leur création"""
+    Notification = apps.get_model('core', 'Notification')
+    Notification.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_index_pagination_curseur'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Suppression',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modele', models.CharField(max_length=30)),
+                ('objet_id', models.UUIDField()),
+                ('user_id', models.UUIDField(blank=True, help_text='Destinataire (notifications)', null=True)),
+                ('supprime_le', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'suppressions',
+                'ordering': ['supprime_le'],
+            },
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(dater_notifications, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='echantillon',
+            index=models.Index(fields=['updated_at'], name='echantillon_updated_d02333_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='essai',
+            index=models.Index(fields=['updated_at'], name='essais_updated_b13887_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'updated_at'], name='notificatio_user_id_9699c7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workflowvalidation',
+            index=models.Index(fields=['updated_at'], name='workflow_va_updated_8fe558_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='suppression',
+            index=models.Index(fields=['modele', 'supprime_le'], name='suppression_modele_d36f6c_idx'),
+        ),
+    ]
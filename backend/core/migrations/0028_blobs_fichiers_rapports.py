@@ -0,0 +1,138 @@
+# Generated by Django 5.0.1 on 2026-10-19 16:16
+
+import base64
+import binascii
+import hashlib
+from urllib.parse import unquote_to_bytes
+
+import django.db.models.deletion
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+# (modèle, ancienne colonne base64, nouvelle référence)
+COLONNES = [
+    ('RapportMarketing', 'file_data', 'fichier'),
+    ('RapportMarketing', 'signed_report_data', 'rapport_signe'),
+    ('WorkflowValidation', 'file_data', 'fichier'),
+    ('RapportValidation', 'file_data', 'fichier'),
+    ('RapportValidation', 'original_file_data', 'fichier_original'),
+    ('RapportArchive', 'file_data', 'fichier'),
+]
+
+TYPE_URL = 'text/uri-list'
+
+
+def decoder(contenu):
+    if contenu.startswith(('http://', 'https://', '/api/', '/media/')):
+        return contenu.encode(), TYPE_URL
+    type_mime = ''
+    if contenu.startswith('data:'):
+        entete, _, contenu = contenu.partition(',')
+        parametres = entete[5:].split(';')
+        type_mime = parametres[0] or 'text/plain'
+        if 'base64' not in parametres[1:]:
+            return unquote_to_bytes(contenu), type_mime
+    try:
+        return base64.b64decode(contenu, validate=True), type_mime
+    except (binascii.Error, ValueError):
+        # Contenu non décodable: conservé tel quel
+        return contenu.encode(), 'text/plain'
+
+
+def extraire_fichiers(apps, schema_editor):
+    """Écrit chaque fichier base64 une fois sur le stockage et y fait pointer les lignes"""
+    Blob = apps.get_model('core', 'Blob')
+    references = {}
+    for nom_modele, colonne, reference in COLONNES:
+        modele = apps.get_model('core', nom_modele)
+        lignes = modele.objects.exclude(**{colonne: ''}).values_list('pk', colonne)
+        for pk, contenu in lignes.iterator(chunk_size=50):
+            octets, type_mime = decoder(contenu)
+            sha256 = hashlib.sha256(octets).hexdigest()
+            if sha256 not in references and not Blob.objects.filter(pk=sha256).exists():
+                chemin = f'blobs/{sha256[:2]}/{sha256}'
+                if not default_storage.exists(chemin):
+                    chemin = default_storage.save(chemin, ContentFile(octets))
+                Blob.objects.create(sha256=sha256, fichier=chemin, taille=len(octets), type_mime=type_mime)
+            references[sha256] = references.get(sha256, 0) + 1
+            modele.objects.filter(pk=pk).update(**{f'{reference}_id': sha256})
+
+    for sha256, nombre in references.items():
+        Blob.objects.filter(pk=sha256).update(nombre_references=nombre)
+
+
+def restaurer_fichiers(apps, schema_editor):
+    """Réécrit le contenu des blobs dans les colonnes base64"""
+    Blob = apps.get_model('core', 'Blob')
+    for nom_modele, colonne, reference in COLONNES:
+        modele = apps.get_model('core', nom_modele)
+        lignes = modele.objects.filter(**{f'{reference}__isnull': False}).values_list('pk', f'{reference}_id')
+        for pk, sha256 in lignes.iterator(chunk_size=50):
+            blob = Blob.objects.get(pk=sha256)
+            with default_storage.open(blob.fichier.name, 'rb') as fichier:
+                octets = fichier.read()
+            if blob.type_mime in (TYPE_URL, 'text/plain'):
+                contenu = octets.decode()
+            else:
+                contenu = base64.b64encode(octets).decode()
+                if blob.type_mime:
+                    contenu = f'data:{blob.type_mime};base64,{contenu}'
+            modele.objects.filter(pk=pk).update(**{colonne: contenu})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_synchronisation_differentielle'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('fichier', models.FileField(max_length=255, upload_to='blobs/')),
+                ('taille', models.PositiveBigIntegerField()),
+                ('type_mime', models.CharField(blank=True, max_length=100)),
+                ('nombre_references', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'blobs',
+                'indexes': [models.Index(fields=['nombre_references', 'created_at'], name='blobs_nombre__77c448_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='rapportarchive',
+            name='fichier',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='core.blob'),
+        ),
+        migrations.AddField(
+            model_name='rapportmarketing',
+            name='fichier',
+            field=models.ForeignKey(help_text='Fichier PDF', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='core.blob'),
+        ),
+        migrations.AddField(
+            model_name='rapportmarketing',
+            name='rapport_signe',
+            field=models.ForeignKey(blank=True, help_text='Rapport signé', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='core.blob'),
+        ),
+        migrations.AddField(
+            model_name='rapportvalidation',
+            name='fichier',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='core.blob'),
+        ),
+        migrations.AddField(
+            model_name='rapportvalidation',
+            name='fichier_original',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='core.blob'),
+        ),
+        migrations.AddField(
+            model_name='workflowvalidation',
+            name='fichier',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='core.blob'),
+        ),
+        migrations.RunPython(extraire_fichiers, restaurer_fichiers),
+    ]
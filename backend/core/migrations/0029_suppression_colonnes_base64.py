@@ -0,0 +1,77 @@
+# Generated by Django 5.0.1 on 2026-10-19 16:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_blobs_fichiers_rapports'),
+    ]
+
+    # Les colonnes base64 ne quittent que l'état des modèles: en base elles
+    # deviennent nullables (les insertions ne les renseignent plus) et gardent
+    # leur contenu jusqu'à la migration 0037, qui vérifie les blobs avant de
+    # les supprimer.
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.AlterField(
+                    model_name='rapportarchive',
+                    name='file_data',
+                    field=models.TextField(blank=True, null=True),
+                ),
+                migrations.AlterField(
+                    model_name='rapportmarketing',
+                    name='file_data',
+                    field=models.TextField(blank=True, null=True),
+                ),
+                migrations.AlterField(
+                    model_name='rapportvalidation',
+                    name='file_data',
+                    field=models.TextField(blank=True, null=True),
+                ),
+                migrations.AlterField(
+                    model_name='workflowvalidation',
+                    name='file_data',
+                    field=models.TextField(blank=True, null=True),
+                ),
+                migrations.AlterField(
+                    model_name='rapportmarketing',
+                    name='signed_report_data',
+                    field=models.TextField(blank=True, null=True),
+                ),
+                migrations.AlterField(
+                    model_name='rapportvalidation',
+                    name='original_file_data',
+                    field=models.TextField(blank=True, null=True),
+                ),
+            ],
+            state_operations=[
+                migrations.RemoveField(
+                    model_name='rapportarchive',
+                    name='file_data',
+                ),
+                migrations.RemoveField(
+                    model_name='rapportmarketing',
+                    name='file_data',
+                ),
+                migrations.RemoveField(
+                    model_name='rapportmarketing',
+                    name='signed_report_data',
+                ),
+                migrations.RemoveField(
+                    model_name='rapportvalidation',
+                    name='file_data',
+                ),
+                migrations.RemoveField(
+                    model_name='rapportvalidation',
+                    name='original_file_data',
+                ),
+                migrations.RemoveField(
+                    model_name='workflowvalidation',
+                    name='file_data',
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.1 on 2026-10-19 16:21
+
+from django.db import migrations, models
+
+
+def marquer_rapports_envoyes(apps, schema_editor):
+    RapportMarketing = apps.get_model('core', 'RapportMarketing')
+    RapportMarketing.objects.filter(statut='envoye').update(statut_envoi='envoye')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0029_suppression_colonnes_base64'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rapportmarketing',
+            name='date_demande_envoi',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='rapportmarketing',
+            name='erreur_envoi',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='rapportmarketing',
+            name='statut_envoi',
+            field=models.CharField(choices=[('non_envoye', 'Non envoyé'), ('en_file', "En file d'envoi"), ('envoye', 'Envoyé'), ('echec', "Échec de l'envoi")], default='non_envoye', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='rapportmarketing',
+            name='tentatives_envoi',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(marquer_rapports_envoyes, migrations.RunPython.noop),
+    ]
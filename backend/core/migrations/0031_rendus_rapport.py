@@ -0,0 +1,30 @@
+# Generated by Django 5.0.1 on 2026-10-19 16:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_suivi_envoi_rapports'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RenduRapport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cle', models.CharField(help_text='SHA-256 des entrées du rendu', max_length=64, unique=True)),
+                ('type', models.CharField(choices=[('rapport', 'Rapport'), ('signe', 'Rapport signé')], default='rapport', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('echantillon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rendus_rapport', to='core.echantillon')),
+                ('fichier', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='core.blob')),
+            ],
+            options={
+                'db_table': 'rendus_rapport',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['echantillon', 'type', 'created_at'], name='rendus_rapp_echanti_27c98e_idx')],
+            },
+        ),
+    ]
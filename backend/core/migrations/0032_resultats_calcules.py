@@ -0,0 +1,48 @@
+# Generated by Django 5.0.1 on 2026-10-19 16:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0031_rendus_rapport'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultatCalcule',
+            fields=[
+                ('essai', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resultat_calcule', serialize=False, to='core.essai')),
+                ('type', models.CharField(choices=[('AG', 'Analyse Granulométrique (AG)'), ('Proctor', 'Proctor'), ('CBR', 'CBR'), ('Oedometre', 'Œdomètre'), ('Cisaillement', 'Cisaillement')], max_length=20)),
+                ('source', models.CharField(choices=[('mesures', 'Calculé depuis les mesures'), ('saisie', 'Valeurs saisies')], max_length=10)),
+                ('version_formules', models.PositiveIntegerField()),
+                ('d10', models.FloatField(blank=True, null=True)),
+                ('d30', models.FloatField(blank=True, null=True)),
+                ('d60', models.FloatField(blank=True, null=True)),
+                ('coefficient_uniformite', models.FloatField(blank=True, null=True)),
+                ('coefficient_courbure', models.FloatField(blank=True, null=True)),
+                ('passant_2mm', models.FloatField(blank=True, null=True)),
+                ('passant_80um', models.FloatField(blank=True, null=True)),
+                ('courbe_granulometrique', models.JSONField(blank=True, help_text='[[diamètre mm, passant %], ...]', null=True)),
+                ('teneur_eau_optimale', models.FloatField(blank=True, help_text='%', null=True)),
+                ('densite_seche_max', models.FloatField(blank=True, help_text='t/m³', null=True)),
+                ('cbr_25mm', models.FloatField(blank=True, null=True)),
+                ('cbr_5mm', models.FloatField(blank=True, null=True)),
+                ('indice_cbr', models.FloatField(blank=True, null=True)),
+                ('cbr_95', models.FloatField(blank=True, null=True)),
+                ('gonflement', models.FloatField(blank=True, null=True)),
+                ('indice_compression', models.FloatField(blank=True, null=True)),
+                ('indice_gonflement', models.FloatField(blank=True, null=True)),
+                ('pression_preconsolidation', models.FloatField(blank=True, help_text='kPa', null=True)),
+                ('cohesion', models.FloatField(blank=True, help_text='kPa', null=True)),
+                ('angle_frottement', models.FloatField(blank=True, help_text='degrés', null=True)),
+                ('calcule_le', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'resultats_calcules',
+                'indexes': [models.Index(fields=['type', 'version_formules'], name='resultats_c_type_265c22_idx')],
+            },
+        ),
+    ]
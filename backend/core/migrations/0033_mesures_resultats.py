@@ -0,0 +1,33 @@
+# Generated by Django 5.0.1 on 2026-10-19 16:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0032_resultats_calcules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MesureResultat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('AG', 'Analyse Granulométrique (AG)'), ('Proctor', 'Proctor'), ('CBR', 'CBR'), ('Oedometre', 'Œdomètre'), ('Cisaillement', 'Cisaillement')], max_length=20)),
+                ('metrique', models.CharField(max_length=60)),
+                ('valeur', models.FloatField()),
+                ('echantillon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mesures_resultats', to='core.echantillon')),
+                ('essai', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mesures_resultats', to='core.essai')),
+            ],
+            options={
+                'db_table': 'mesures_resultats',
+                'indexes': [models.Index(fields=['metrique', 'valeur'], name='mesures_res_metriqu_339222_idx'), models.Index(fields=['metrique', 'echantillon'], name='mesures_res_metriqu_c8686d_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='mesureresultat',
+            constraint=models.UniqueConstraint(fields=('essai', 'metrique'), name='mesure_unique_par_essai'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-19 16:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0033_mesures_resultats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='rapportmarketing',
+            name='statut_envoi',
+            field=models.CharField(choices=[('non_envoye', 'Non envoyé'), ('en_file', "En file d'envoi"), ('en_cours', 'Envoi en cours'), ('envoye', 'Envoyé'), ('echec', "Échec de l'envoi")], default='non_envoye', max_length=20),
+        ),
+    ]
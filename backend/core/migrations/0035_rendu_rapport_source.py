@@ -0,0 +1,19 @@
+# Generated by Django 5.0.1 on 2026-10-19 17:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0034_statut_envoi_en_cours'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rendurapport',
+            name='source',
+            field=models.ForeignKey(blank=True, help_text='PDF non signé (rendus signés)', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='core.blob'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations, models
+
+
+def recopier_essais(apps, schema_editor):
+    """L'essai unique des réservations converties devient le premier de leurs essais"""
+    ReservationCapacite = apps.get_model('core', 'ReservationCapacite')
+    Lien = ReservationCapacite.essais.through
+    Lien.objects.bulk_create([
+        Lien(reservationcapacite_id=reservation_id, essai_id=essai_id)
+        for reservation_id, essai_id in ReservationCapacite.objects.filter(
+            essai__isnull=False
+        ).values_list('id', 'essai_id')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0035_rendu_rapport_source'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reservationcapacite',
+            name='essai',
+            field=models.ForeignKey(blank=True, null=True, on_delete=models.deletion.SET_NULL, related_name='+', to='core.essai'),
+        ),
+        migrations.AddField(
+            model_name='reservationcapacite',
+            name='essais',
+            field=models.ManyToManyField(blank=True, help_text='Essais ayant consommé une place', related_name='reservations_capacite', to='core.essai'),
+        ),
+        migrations.RunPython(recopier_essais, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='reservationcapacite',
+            name='essai',
+        ),
+    ]
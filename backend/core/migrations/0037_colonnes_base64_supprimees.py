@@ -0,0 +1,105 @@
+import hashlib
+import importlib
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import migrations
+
+
+# (modèle, ancienne colonne base64, nouvelle référence)
+COLONNES = [
+    ('RapportMarketing', 'file_data', 'fichier'),
+    ('RapportMarketing', 'signed_report_data', 'rapport_signe'),
+    ('WorkflowValidation', 'file_data', 'fichier'),
+    ('RapportValidation', 'file_data', 'fichier'),
+    ('RapportValidation', 'original_file_data', 'fichier_original'),
+    ('RapportArchive', 'file_data', 'fichier'),
+]
+
+decoder = importlib.import_module('core.migrations.0028_blobs_fichiers_rapports').decoder
+
+
+def colonnes_presentes(apps, schema_editor):
+    """
+    (modèle, colonne, référence) encore en base: sous SQLite, les tables
+    reconstruites depuis 0029 ont déjà perdu leurs colonnes base64
+    """
+    introspection = schema_editor.connection.introspection
+    with schema_editor.connection.cursor() as curseur:
+        for nom_modele, colonne, reference in COLONNES:
+            modele = apps.get_model('core', nom_modele)
+            description = introspection.get_table_description(curseur, modele._meta.db_table)
+            if colonne in {c.name for c in description}:
+                yield modele, colonne, reference
+
+
+def verifier_blobs(apps, schema_editor):
+    """
+    Avant de supprimer les colonnes base64 (retirées des modèles en 0029),
+    vérifie que chaque contenu est bien sur un stockage durable: blob de même
+    empreinte, référencé par la ligne et présent sur le stockage
+    """
+    Blob = apps.get_model('core', 'Blob')
+    qn = schema_editor.quote_name
+    anomalies = []
+    nombre = 0
+    colonnes = list(colonnes_presentes(apps, schema_editor))
+    with schema_editor.connection.cursor() as curseur:
+        for modele, colonne, reference in colonnes:
+            table = qn(modele._meta.db_table)
+            colonne_reference = qn(modele._meta.get_field(reference).column)
+            curseur.execute(
+                f"SELECT {qn(modele._meta.pk.column)} FROM {table} "
+                f"WHERE {qn(colonne)} IS NOT NULL AND {qn(colonne)} <> ''"
+            )
+            pks = [ligne[0] for ligne in curseur.fetchall()]
+            for pk in pks:
+                curseur.execute(
+                    f"SELECT {qn(colonne)}, {colonne_reference} FROM {table} "
+                    f"WHERE {qn(modele._meta.pk.column)} = %s",
+                    [pk],
+                )
+                contenu, sha256 = curseur.fetchone()
+                nombre += 1
+                octets, _ = decoder(contenu)
+                blob = Blob.objects.filter(pk=hashlib.sha256(octets).hexdigest()).first()
+                if blob is None or blob.pk != sha256 or not default_storage.exists(blob.fichier.name):
+                    anomalies.append(f'{modele.__name__}.{colonne} #{pk}')
+
+    if anomalies:
+        raise RuntimeError(
+            f"{len(anomalies)} fichier(s) base64 sans blob valide, colonnes conservées: "
+            + ', '.join(anomalies[:20])
+        )
+    if nombre and not settings.STOCKAGE_DURABLE:
+        raise RuntimeError(
+            f"{nombre} fichier(s) ne sont que sur un stockage local effacé au déploiement: "
+            "configurer AWS_STORAGE_BUCKET_NAME (ou STOCKAGE_DURABLE) avant de supprimer "
+            "les colonnes base64"
+        )
+
+
+def supprimer_colonnes(apps, schema_editor):
+    qn = schema_editor.quote_name
+    for modele, colonne, _ in list(colonnes_presentes(apps, schema_editor)):
+        schema_editor.execute(f'ALTER TABLE {qn(modele._meta.db_table)} DROP COLUMN {qn(colonne)}')
+
+
+def recreer_colonnes(apps, schema_editor):
+    """Colonnes rétablies vides: le contenu reste dans les blobs"""
+    qn = schema_editor.quote_name
+    for nom_modele, colonne, _ in COLONNES:
+        table = apps.get_model('core', nom_modele)._meta.db_table
+        schema_editor.execute(f'ALTER TABLE {qn(table)} ADD COLUMN {qn(colonne)} text NULL')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0036_reservation_capacite_essais'),
+    ]
+
+    operations = [
+        migrations.RunPython(verifier_blobs, migrations.RunPython.noop),
+        migrations.RunPython(supprimer_colonnes, recreer_colonnes),
+    ]
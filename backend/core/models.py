@@ -130,6 +130,8 @@ class Echantillon(models.Model):
         indexes = [
             models.Index(fields=['statut', 'priorite']),
             models.Index(fields=['date_reception']),
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['updated_at']),
         ]
     numero_sondage = models.CharField(max_length=50, blank=True, help_text="Numéro de sondage (obligatoire si caroté)")
     date_envoi_ag = models.DateField(blank=True, null=True)
@@ -255,12 +257,105 @@ class Essai(models.Model):
         indexes = [
             models.Index(fields=['statut', 'section']),
             models.Index(fields=['date_debut']),
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['updated_at']),
         ]
     
     def __str__(self):
         return f"{self.get_type_display()} - {self.echantillon.code}"
 
 
+class ResultatCalcule(models.Model):
+    """
+    Grandeurs géotechniques dérivées des résultats d'un essai (voir core.calculs_geotechniques)
+    
+    Recalculées à chaque modification des résultats; version_formules permet
+    de retrouver les lignes à recalculer après une correction de formule.
+    """
+    
+    SOURCE_CHOICES = [
+        ('mesures', 'Calculé depuis les mesures'),
+        ('saisie', 'Valeurs saisies'),
+    ]
+    
+    essai = models.OneToOneField(Essai, on_delete=models.CASCADE, primary_key=True, related_name='resultat_calcule')
+    type = models.CharField(max_length=20, choices=Essai.TYPE_CHOICES)
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES)
+    version_formules = models.PositiveIntegerField()
+    
+    # Analyse granulométrique (diamètres en mm, passants en %)
+    d10 = models.FloatField(null=True, blank=True)
+    d30 = models.FloatField(null=True, blank=True)
+    d60 = models.FloatField(null=True, blank=True)
+    coefficient_uniformite = models.FloatField(null=True, blank=True)
+    coefficient_courbure = models.FloatField(null=True, blank=True)
+    passant_2mm = models.FloatField(null=True, blank=True)
+    passant_80um = models.FloatField(null=True, blank=True)
+    courbe_granulometrique = models.JSONField(null=True, blank=True, help_text="[[diamètre mm, passant %], ...]")
+    
+    # Proctor
+    teneur_eau_optimale = models.FloatField(null=True, blank=True, help_text="%")
+    densite_seche_max = models.FloatField(null=True, blank=True, help_text="t/m³")
+    
+    # CBR
+    cbr_25mm = models.FloatField(null=True, blank=True)
+    cbr_5mm = models.FloatField(null=True, blank=True)
+    indice_cbr = models.FloatField(null=True, blank=True)
+    cbr_95 = models.FloatField(null=True, blank=True)
+    gonflement = models.FloatField(null=True, blank=True)
+    
+    # Œdomètre
+    indice_compression = models.FloatField(null=True, blank=True)
+    indice_gonflement = models.FloatField(null=True, blank=True)
+    pression_preconsolidation = models.FloatField(null=True, blank=True, help_text="kPa")
+    
+    # Cisaillement
+    cohesion = models.FloatField(null=True, blank=True, help_text="kPa")
+    angle_frottement = models.FloatField(null=True, blank=True, help_text="degrés")
+    
+    calcule_le = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'resultats_calcules'
+        indexes = [
+            models.Index(fields=['type', 'version_formules']),
+        ]
+    
+    def __str__(self):
+        return f"Résultats calculés - {self.essai_id}"
+
+
+class MesureResultat(models.Model):
+    """
+    Valeur numérique d'un résultat d'essai: une ligne par essai et par grandeur
+    
+    Grandeurs calculées (ResultatCalcule) et valeurs numériques saisies dans
+    resultats, tenues à jour avec resultats_calcules (voir
+    core.analyses_resultats); servent aux filtres par plage et aux agrégats
+    calculés en SQL.
+    """
+    
+    essai = models.ForeignKey(Essai, on_delete=models.CASCADE, related_name='mesures_resultats')
+    # Recopiés de l'essai (ne changent pas) pour éviter une jointure
+    echantillon = models.ForeignKey(Echantillon, on_delete=models.CASCADE, related_name='mesures_resultats')
+    type = models.CharField(max_length=20, choices=Essai.TYPE_CHOICES)
+    metrique = models.CharField(max_length=60)
+    valeur = models.FloatField()
+    
+    class Meta:
+        db_table = 'mesures_resultats'
+        constraints = [
+            models.UniqueConstraint(fields=['essai', 'metrique'], name='mesure_unique_par_essai'),
+        ]
+        indexes = [
+            models.Index(fields=['metrique', 'valeur']),
+            models.Index(fields=['metrique', 'echantillon']),
+        ]
+    
+    def __str__(self):
+        return f"{self.metrique} = {self.valeur} ({self.essai_id})"
+
+
 class Notification(models.Model):
     """Notifications pour les utilisateurs"""
     
@@ -285,6 +380,7 @@ class Notification(models.Model):
     essai = models.ForeignKey(Essai, on_delete=models.CASCADE, blank=True, null=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     read_at = models.DateTimeField(blank=True, null=True)
     
     class Meta:
@@ -292,6 +388,8 @@ class Notification(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['user', 'read']),
+            models.Index(fields=['user', 'created_at', 'id']),
+            models.Index(fields=['user', 'updated_at']),
         ]
     
     def __str__(self):
@@ -415,6 +513,147 @@ class CapaciteLaboratoire(models.Model):
         return f"{self.get_type_essai_display()} - {self.capacite_quotidienne}/jour"
 
 
+class CreneauCapacite(models.Model):
+    """Occupation d'un type d'essai pour une date (compteurs mis à jour atomiquement)"""
+
+    type_essai = models.CharField(max_length=20, choices=CapaciteLaboratoire.TYPE_ESSAI_CHOICES)
+    date = models.DateField()
+    utilise = models.PositiveIntegerField(default=0, help_text="Essais réceptionnés à cette date")
+    reserve = models.PositiveIntegerField(default=0, help_text="Réservations temporaires actives")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'creneaux_capacite'
+        ordering = ['date', 'type_essai']
+        unique_together = ['type_essai', 'date']
+        indexes = [
+            models.Index(fields=['date']),
+        ]
+
+    def __str__(self):
+        return f"{self.type_essai} {self.date} - {self.utilise}+{self.reserve}"
+
+
+class ReservationCapacite(models.Model):
+    """Réservation temporaire d'une place dans un créneau (brouillon d'envoi)"""
+
+    STATUT_CHOICES = [
+        ('active', 'Active'),
+        ('confirmee', 'Confirmée'),
+        ('liberee', 'Libérée'),
+        ('expiree', 'Expirée'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    type_essai = models.CharField(max_length=20, choices=CapaciteLaboratoire.TYPE_ESSAI_CHOICES)
+    date = models.DateField()
+    quantite = models.PositiveIntegerField(default=1)
+    statut = models.CharField(max_length=15, choices=STATUT_CHOICES, default='active')
+    expire_le = models.DateTimeField()
+    essais = models.ManyToManyField(Essai, blank=True, related_name='reservations_capacite', help_text="Essais ayant consommé une place")
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='reservations_capacite')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'reservations_capacite'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['statut', 'expire_le']),
+        ]
+
+    def __str__(self):
+        return f"Réservation {self.type_essai} {self.date} x{self.quantite} ({self.statut})"
+
+
+class Suppression(models.Model):
+    """Trace d'un objet supprimé, pour la synchronisation différentielle"""
+
+    modele = models.CharField(max_length=30)
+    objet_id = models.UUIDField()
+    user_id = models.UUIDField(blank=True, null=True, help_text="Destinataire (notifications)")
+    supprime_le = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'suppressions'
+        ordering = ['supprime_le']
+        indexes = [
+            models.Index(fields=['modele', 'supprime_le']),
+        ]
+
+    def __str__(self):
+        return f"{self.modele} {self.objet_id} supprimé le {self.supprime_le}"
+
+
+class StatistiquesDashboard(models.Model):
+    """Instantané des statistiques du dashboard, recalculé périodiquement"""
+
+    cle = models.CharField(max_length=50, unique=True, default='global')
+    donnees = models.JSONField(default=dict)
+    genere_le = models.DateTimeField()
+
+    class Meta:
+        db_table = 'statistiques_dashboard'
+
+    def __str__(self):
+        return f"Statistiques {self.cle} du {self.genere_le}"
+
+
+class Blob(models.Model):
+    """
+    Contenu binaire adressé par son empreinte SHA-256
+
+    Un même fichier n'est stocké qu'une fois; nombre_references compte les
+    lignes qui le référencent (maintenu par core.signals).
+    """
+
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    fichier = models.FileField(upload_to='blobs/', max_length=255)
+    taille = models.PositiveBigIntegerField()
+    type_mime = models.CharField(max_length=100, blank=True)
+    nombre_references = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'blobs'
+        indexes = [
+            models.Index(fields=['nombre_references', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Blob {self.sha256[:12]} ({self.taille} octets)"
+
+
+class RenduRapport(models.Model):
+    """
+    PDF de rapport généré par le serveur, indexé par l'empreinte de ses entrées
+
+    Les mêmes données (ou le même rapport avec la même signature) donnent la
+    même clé: le rendu n'est refait que si les entrées changent.
+    """
+
+    TYPE_CHOICES = [
+        ('rapport', 'Rapport'),
+        ('signe', 'Rapport signé'),
+    ]
+
+    cle = models.CharField(max_length=64, unique=True, help_text="SHA-256 des entrées du rendu")
+    type = models.CharField(max_length=10, choices=TYPE_CHOICES, default='rapport')
+    echantillon = models.ForeignKey(Echantillon, on_delete=models.CASCADE, related_name='rendus_rapport')
+    fichier = models.ForeignKey(Blob, on_delete=models.PROTECT, related_name='+')
+    source = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='+', help_text="PDF non signé (rendus signés)")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'rendus_rapport'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['echantillon', 'type', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Rendu {self.get_type_display()} {self.echantillon_id} ({self.cle[:12]})"
+
+
 class RapportMarketing(models.Model):
     """Rapports envoyés au service marketing"""
     
@@ -423,19 +662,34 @@ class RapportMarketing(models.Model):
         ('envoye', 'Envoyé au client'),
     ]
     
+    STATUT_ENVOI_CHOICES = [
+        ('non_envoye', 'Non envoyé'),
+        ('en_file', "En file d'envoi"),
+        ('en_cours', 'Envoi en cours'),
+        ('envoye', 'Envoyé'),
+        ('echec', "Échec de l'envoi"),
+    ]
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     echantillon = models.ForeignKey(Echantillon, on_delete=models.CASCADE, related_name='rapports_marketing')
     code_echantillon = models.CharField(max_length=20)
     client_name = models.CharField(max_length=200)
     file_name = models.CharField(max_length=255)
-    file_data = models.TextField(help_text="Fichier PDF en base64")
-    signed_report_data = models.TextField(blank=True, help_text="Rapport HTML signé en base64")
+    fichier = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, related_name='+', help_text="Fichier PDF")
+    rapport_signe = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='+', help_text="Rapport signé")
     avis_directeur_snertp = models.TextField(blank=True)
     signature_directeur_snertp = models.TextField(blank=True, help_text="Signature en base64")
     statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='en_attente')
     email_client = models.EmailField(blank=True)
     date_envoi_marketing = models.DateTimeField(auto_now_add=True)
     date_envoi_client = models.DateTimeField(blank=True, null=True)
+    
+    # Suivi de l'envoi par email (file Celery)
+    statut_envoi = models.CharField(max_length=20, choices=STATUT_ENVOI_CHOICES, default='non_envoye')
+    tentatives_envoi = models.PositiveSmallIntegerField(default=0)
+    erreur_envoi = models.TextField(blank=True)
+    date_demande_envoi = models.DateTimeField(blank=True, null=True)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -473,7 +727,7 @@ class WorkflowValidation(models.Model):
     
     # Fichiers
     file_name = models.CharField(max_length=255)
-    file_data = models.TextField(help_text="Fichier en base64")
+    fichier = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, related_name='+')
     
     # Étape actuelle
     etape_actuelle = models.CharField(max_length=30, choices=ETAPE_CHOICES)
@@ -527,6 +781,7 @@ class WorkflowValidation(models.Model):
         indexes = [
             models.Index(fields=['etape_actuelle', 'statut']),
             models.Index(fields=['code_echantillon']),
+            models.Index(fields=['updated_at']),
         ]
     
     def __str__(self):
@@ -643,6 +898,7 @@ class ActionLog(models.Model):
             models.Index(fields=['echantillon_id']),
             models.Index(fields=['essai_id']),
             models.Index(fields=['success', 'created_at']),
+            models.Index(fields=['created_at', 'id']),
         ]
     
     def __str__(self):
@@ -770,9 +1026,9 @@ class RapportValidation(models.Model):
     
     # Fichier rapport
     file_name = models.CharField(max_length=255)
-    file_data = models.TextField()  # Base64 ou URL
+    fichier = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, related_name='+')  # PDF ou URL
     original_file_name = models.CharField(max_length=255, blank=True)
-    original_file_data = models.TextField(blank=True)
+    fichier_original = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
     
     # Dates
     date_envoi = models.DateTimeField(auto_now_add=True)
@@ -907,7 +1163,7 @@ class RapportArchive(models.Model):
     code_echantillon = models.CharField(max_length=20)
     client_name = models.CharField(max_length=200)
     file_name = models.CharField(max_length=255)
-    file_data = models.TextField(help_text="Fichier en base64")
+    fichier = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, related_name='+')
     
     # Qui a envoyé
     envoye_par = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='rapports_archives_envoyes')
@@ -0,0 +1,158 @@
+"""
+Pagination pour l'API REST
+"""
+
+import base64
+import binascii
+import json
+import uuid
+
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class PaginationOptionnelle(PageNumberPagination):
+    """
+    Pagination activée uniquement si le client passe ?page= ou ?page_size=
+
+    Les actions personnalisées renvoient historiquement des listes complètes;
+    cette classe permet de paginer sans casser les clients existants.
+    """
+
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (self.page_query_param not in request.query_params
+                and self.page_size_query_param not in request.query_params):
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+def paginer(request, queryset, construire, view=None):
+    """
+    Pagine (si demandé) puis construit la réponse
+
+    Args:
+        construire: Fonction recevant les lignes de la page (ou toutes les
+                    lignes) et retournant la liste sérialisée
+    """
+    paginator = PaginationOptionnelle()
+    page = paginator.paginate_queryset(queryset, request, view=view)
+    if page is None:
+        return Response(construire(list(queryset)))
+    return paginator.get_paginated_response(construire(page))
+
+
+class PaginationCurseur(PageNumberPagination):
+    """
+    Pagination par curseur (keyset) sur (created_at, id), activée par ?cursor=
+
+    Sans ?cursor=, la pagination par numéro de page est conservée. Avec
+    ?cursor= (vide pour la première page), chaque page est lue par une
+    condition sur (created_at, id) sans OFFSET ni COUNT(*): les pages profondes
+    coûtent autant que la première et les curseurs restent stables quand des
+    lignes sont insérées. Le total exact est remplacé par une estimation
+    (en-tête X-Total-Count-Estimate).
+
+    Seul le tri par défaut (-created_at) ou created_at est paginé par curseur;
+    pour tout autre tri, la pagination par numéro de page s'applique.
+    """
+
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.curseur_actif = False
+        if self.cursor_query_param not in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+
+        ordre = list(queryset.query.order_by or queryset.model._meta.ordering)
+        if not ordre or ordre[0] not in ('-created_at', 'created_at'):
+            return super().paginate_queryset(queryset, request, view)
+
+        self.curseur_actif = True
+        self.request = request
+        self.decroissant = ordre[0] == '-created_at'
+        page_size = self.get_page_size(request)
+        self.estimation = estimer_nombre(queryset)
+
+        position = self.decoder_curseur(request.query_params[self.cursor_query_param])
+        if position:
+            created_at, pk = position
+            if self.decroissant:
+                queryset = queryset.filter(
+                    Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk),
+                    created_at__lte=created_at
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk),
+                    created_at__gte=created_at
+                )
+
+        signe = '-' if self.decroissant else ''
+        lignes = list(queryset.order_by(f'{signe}created_at', f'{signe}pk')[:page_size + 1])
+        self.suivant = None
+        if len(lignes) > page_size:
+            lignes = lignes[:page_size]
+            self.suivant = self.encoder_curseur(lignes[-1])
+        return lignes
+
+    def get_paginated_response(self, data):
+        if not self.curseur_actif:
+            return super().get_paginated_response(data)
+        suivant = None
+        if self.suivant:
+            suivant = replace_query_param(
+                self.request.build_absolute_uri(), self.cursor_query_param, self.suivant
+            )
+        return Response(
+            {'next': suivant, 'results': data},
+            headers={'X-Total-Count-Estimate': str(self.estimation)}
+        )
+
+    @staticmethod
+    def encoder_curseur(ligne):
+        if isinstance(ligne, dict):
+            created_at, pk = ligne['created_at'], ligne['id']
+        else:
+            created_at, pk = ligne.created_at, ligne.pk
+        brut = f'{created_at.isoformat()}|{pk}'
+        return base64.urlsafe_b64encode(brut.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decoder_curseur(curseur):
+        """Retourne (created_at, pk) ou None pour la première page"""
+        if not curseur:
+            return None
+        try:
+            brut = base64.urlsafe_b64decode(curseur + '=' * (-len(curseur) % 4)).decode()
+            created_at, pk = brut.split('|')
+            created_at = parse_datetime(created_at)
+            pk = uuid.UUID(pk)
+        except (ValueError, UnicodeDecodeError, binascii.Error):
+            raise NotFound('Curseur invalide')
+        if created_at is None:
+            raise NotFound('Curseur invalide')
+        return created_at, pk
+
+
+def estimer_nombre(queryset):
+    """
+    Nombre de lignes estimé par le planificateur PostgreSQL (sans COUNT(*))
+
+    Sur les autres moteurs, retombe sur un comptage exact.
+    """
+    connexion = connections[queryset.db]
+    if connexion.vendor != 'postgresql':
+        return queryset.count()
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
@@ -0,0 +1,173 @@
+"""
+Photos des échantillons et des clients
+À l'envoi, un worker Celery redresse la photo selon son orientation EXIF et la
+recompresse en JPEG. Les miniatures sont générées à la première demande puis
+gardées sur le stockage de médias; les listes ne renvoient que leurs URLs
+"""
+
+import io
+import os
+import uuid
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+# Côté le plus long de la photo conservée (pixels)
+DIMENSION_MAX = 2560
+
+# Côté le plus long de chaque miniature
+TAILLES_MINIATURES = {
+    'mini': 128,
+    'liste': 640,
+    'grand': 1600,
+}
+
+# Miniature utilisée par les listes
+MINIATURE_LISTE = 'liste'
+
+QUALITE_JPEG = 82
+
+# En dessous de cette taille, un JPEG déjà droit et aux bonnes dimensions est gardé tel quel
+TAILLE_SANS_RECOMPRESSION = 500 * 1024
+
+# Dossiers des photos (upload_to), les seuls dont on sert des miniatures
+MODELES_PHOTO = {
+    'echantillons/': 'core.Echantillon',
+    'clients/': 'core.Client',
+}
+
+TAG_ORIENTATION = 0x0112
+
+
+class PhotoInvalide(ValueError):
+    """Levée quand le fichier n'est pas une image lisible"""
+
+
+def _ouvrir(nom):
+    """Image redressée selon son orientation EXIF"""
+    try:
+        with default_storage.open(nom, 'rb') as fichier:
+            image = Image.open(fichier)
+            image.load()
+    except (UnidentifiedImageError, OSError) as e:
+        raise PhotoInvalide(str(e))
+    return ImageOps.exif_transpose(image)
+
+
+def _jpeg(image, dimension):
+    """Octets JPEG de l'image réduite à dimension pixels au plus (côté le plus long)"""
+    image = image.copy()
+    image.thumbnail((dimension, dimension), Image.Resampling.LANCZOS)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        fond = Image.new('RGB', image.size, 'white')
+        fond.paste(image, mask=image.getchannel('A'))
+        image = fond
+    elif image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    sortie = io.BytesIO()
+    image.save(sortie, 'JPEG', quality=QUALITE_JPEG, optimize=True, progressive=True)
+    return sortie.getvalue()
+
+
+def _deja_optimisee(nom):
+    """JPEG léger, sans rotation EXIF et déjà aux bonnes dimensions"""
+    if default_storage.size(nom) > TAILLE_SANS_RECOMPRESSION:
+        return False
+    with default_storage.open(nom, 'rb') as fichier:
+        image = Image.open(fichier)
+        return (
+            image.format == 'JPEG'
+            and image.getexif().get(TAG_ORIENTATION, 1) == 1
+            and max(image.size) <= DIMENSION_MAX
+        )
+
+
+def chemin_miniature(nom, taille):
+    return f'miniatures/{taille}/{nom}.jpg'
+
+
+def supprimer_miniatures(nom):
+    for taille in TAILLES_MINIATURES:
+        default_storage.delete(chemin_miniature(nom, taille))
+
+
+def normaliser(modele, pk):
+    """
+    Redresse et recompresse la photo d'un objet
+
+    La photo n'est remplacée que si elle n'a pas changé pendant le
+    traitement; l'ancien fichier et ses miniatures sont alors supprimés.
+    Le nouveau fichier porte un nom jamais utilisé (les miniatures sont
+    servies comme immuables) et updated_at est avancé pour que les clients
+    rechargent l'objet et ses URLs.
+
+    Args:
+        modele: Label du modèle ('core.Echantillon', 'core.Client')
+
+    Returns:
+        Nom du nouveau fichier, ou None si rien n'a été modifié
+    """
+    Modele = apps.get_model(modele)
+    nom = Modele.objects.filter(pk=pk).values_list('photo', flat=True).first()
+    if not nom or _deja_optimisee(nom):
+        return None
+
+    octets = _jpeg(_ouvrir(nom), DIMENSION_MAX)
+    nouveau = default_storage.save(f'{os.path.splitext(nom)[0]}-{uuid.uuid4().hex[:8]}.jpg', ContentFile(octets))
+    if not Modele.objects.filter(pk=pk, photo=nom).update(photo=nouveau, updated_at=timezone.now()):
+        default_storage.delete(nouveau)
+        return None
+
+    default_storage.delete(nom)
+    supprimer_miniatures(nom)
+    return nouveau
+
+
+def photo_connue(nom):
+    """La photo est celle d'un échantillon ou d'un client (pas un autre média)"""
+    if '..' in nom.split('/'):
+        return False
+    for dossier, modele in MODELES_PHOTO.items():
+        if nom.startswith(dossier):
+            return apps.get_model(modele).objects.filter(photo=nom).exists()
+    return False
+
+
+def miniature(nom, taille):
+    """
+    Chemin de la miniature d'une photo, générée à la première demande
+
+    Raises:
+        PhotoInvalide: la photo n'est pas lisible
+        FileNotFoundError: la photo n'existe plus
+    """
+    chemin = chemin_miniature(nom, taille)
+    if default_storage.exists(chemin):
+        return chemin
+
+    octets = _jpeg(_ouvrir(nom), TAILLES_MINIATURES[taille])
+    enregistre = default_storage.save(chemin, ContentFile(octets))
+    if enregistre != chemin:
+        # Générée en parallèle par une autre requête: on garde la première
+        default_storage.delete(enregistre)
+    return chemin
+
+
+def url_miniature(nom, taille=MINIATURE_LISTE, request=None):
+    if not nom:
+        return None
+    url = f"{reverse('miniature-detail', args=[nom])}?taille={taille}"
+    return request.build_absolute_uri(url) if request else url
+
+
+def urls_miniatures(nom, request=None):
+    if not nom:
+        return None
+    return {taille: url_miniature(nom, taille, request) for taille in TAILLES_MINIATURES}
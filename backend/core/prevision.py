@@ -0,0 +1,252 @@
+"""
+Prévision de charge du laboratoire
+Projette l'occupation par type d'essai et par jour sur les prochaines semaines
+en combinant les envois planifiés, les essais en cours et une prévision
+saisonnière des arrivées ajustée sur l'historique des réceptions
+"""
+
+from datetime import timedelta
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Essai, CapaciteLaboratoire
+from .utils import DUREES_ESSAIS, CAPACITES_PAR_JOUR, CHAMPS_DATE_ENVOI, est_weekend, est_jour_ferie
+
+
+TYPES_ESSAIS = ['AG', 'Proctor', 'CBR', 'Oedometre', 'Cisaillement']
+
+# Durée de vie du cache de prévision (secondes)
+DUREE_CACHE_PREVISION = 300
+
+# Profondeur de l'historique utilisé pour la saisonnalité (jours)
+HISTORIQUE_JOURS = 365
+
+
+def _ajouter_intervalles(occupation, indices_types, debuts, durees):
+    """Ajoute 1 sur [debut, debut + duree) par ligne via un tableau de différences"""
+    nombre_jours = occupation.shape[1]
+    debuts = np.clip(debuts, 0, nombre_jours)
+    fins = np.clip(debuts + durees, 0, nombre_jours)
+    differences = np.zeros((occupation.shape[0], nombre_jours + 1))
+    np.add.at(differences, (indices_types, debuts), 1)
+    np.add.at(differences, (indices_types, fins), -1)
+    occupation += np.cumsum(differences, axis=1)[:, :nombre_jours]
+
+
+def charger_capacites():
+    """Retourne les capacités quotidiennes et simultanées par type (tableaux alignés sur TYPES_ESSAIS)"""
+    quotidiennes = np.array([CAPACITES_PAR_JOUR.get(t, 1) for t in TYPES_ESSAIS], dtype=float)
+    simultanees = np.full(len(TYPES_ESSAIS), np.nan)
+    durees = np.array([DUREES_ESSAIS.get(t, 5) for t in TYPES_ESSAIS])
+
+    for type_essai, quotidienne, simultanee, duree in CapaciteLaboratoire.objects.values_list(
+        'type_essai', 'capacite_quotidienne', 'capacite_simultanee', 'duree_standard_jours'
+    ):
+        if type_essai in TYPES_ESSAIS:
+            indice = TYPES_ESSAIS.index(type_essai)
+            quotidiennes[indice] = quotidienne
+            simultanees[indice] = simultanee if simultanee else np.nan
+            # Une durée nulle ne compterait aucun jour d'occupation
+            durees[indice] = max(1, duree)
+
+    return quotidiennes, simultanees, durees
+
+
+def ajuster_saisonnalite(date_reference):
+    """
+    Ajuste un modèle jour de semaine × mois sur les réceptions passées
+
+    Returns:
+        (base, facteurs_mois): base[type, jour_semaine] = arrivées moyennes par
+        jour ouvrable, facteurs_mois[type, mois - 1] = coefficient saisonnier
+    """
+    debut = date_reference - timedelta(days=HISTORIQUE_JOURS)
+    lignes = Essai.objects.filter(
+        date_reception__gte=debut,
+        date_reception__lt=date_reference,
+        type__in=TYPES_ESSAIS
+    ).values_list('type', 'date_reception').annotate(nombre=Count('id')).order_by()
+
+    # Série quotidienne dense sur l'historique
+    nombre_jours = (date_reference - debut).days
+    jours = [debut + timedelta(days=i) for i in range(nombre_jours)]
+    ouvrables = np.array([not est_weekend(j) and not est_jour_ferie(j) for j in jours])
+    jours_semaine = np.array([j.weekday() for j in jours])
+    mois = np.array([j.month - 1 for j in jours])
+
+    series = np.zeros((len(TYPES_ESSAIS), nombre_jours))
+    for type_essai, jour, nombre in lignes:
+        series[TYPES_ESSAIS.index(type_essai), (jour - debut).days] += nombre
+
+    base = np.zeros((len(TYPES_ESSAIS), 7))
+    for jour_semaine in range(7):
+        masque = ouvrables & (jours_semaine == jour_semaine)
+        if masque.any():
+            base[:, jour_semaine] = series[:, masque].mean(axis=1)
+
+    moyenne_globale = series[:, ouvrables].mean(axis=1, keepdims=True) if ouvrables.any() else np.zeros((len(TYPES_ESSAIS), 1))
+    facteurs_mois = np.ones((len(TYPES_ESSAIS), 12))
+    for m in range(12):
+        masque = ouvrables & (mois == m)
+        if masque.any():
+            moyenne_mois = series[:, masque].mean(axis=1, keepdims=True)
+            facteurs_mois[:, m] = np.divide(
+                moyenne_mois, moyenne_globale,
+                out=np.ones_like(moyenne_mois), where=moyenne_globale > 0
+            )[:, 0]
+
+    return base, facteurs_mois
+
+
+def charger_demarrages_planifies(date_debut, nombre_jours):
+    """
+    Retourne les démarrages connus (indices de type, décalages en jours)
+
+    Priorité des sources pour un essai en attente: affectation du planning
+    actif, puis date d'envoi planifiée de l'échantillon, puis date de réception.
+    """
+    from scheduler.models import AffectationEssai
+
+    date_fin = date_debut + timedelta(days=nombre_jours)
+    affectations = dict(AffectationEssai.objects.filter(
+        planning__statut='active',
+        essai__statut='attente',
+    ).values_list('essai_id', 'date_debut_planifiee'))
+
+    essais = Essai.objects.filter(statut='attente', type__in=TYPES_ESSAIS).values_list(
+        'id', 'type', 'date_reception', *[f'echantillon__{champ}' for champ in CHAMPS_DATE_ENVOI.values()]
+    )
+
+    indices_types, decalages = [], []
+    for essai_id, type_essai, date_reception, *dates_envoi in essais:
+        date_prevue = (
+            affectations.get(essai_id)
+            or dates_envoi[list(CHAMPS_DATE_ENVOI).index(type_essai)]
+            or date_reception
+        )
+        if not date_prevue or date_prevue >= date_fin:
+            continue
+        indices_types.append(TYPES_ESSAIS.index(type_essai))
+        # Un envoi en retard démarre au plus tôt aujourd'hui
+        decalages.append(max(0, (date_prevue - date_debut).days))
+
+    return np.array(indices_types, dtype=int), np.array(decalages, dtype=int)
+
+
+def charger_essais_en_cours(date_debut, durees):
+    """Retourne les essais en cours (indices de type, décalage de début, durée restante)"""
+    essais = Essai.objects.filter(statut='en_cours', type__in=TYPES_ESSAIS).values_list(
+        'type', 'date_debut', 'duree_estimee'
+    )
+
+    indices_types, decalages, restants = [], [], []
+    for type_essai, date_debut_essai, duree_estimee in essais:
+        indice = TYPES_ESSAIS.index(type_essai)
+        duree = duree_estimee or durees[indice]
+        ecoule = (date_debut - date_debut_essai).days if date_debut_essai else 0
+        indices_types.append(indice)
+        decalages.append(0)
+        # Un essai dépassant sa durée estimée occupe encore au moins la journée
+        restants.append(max(1, duree - ecoule))
+
+    return np.array(indices_types, dtype=int), np.array(decalages, dtype=int), np.array(restants, dtype=int)
+
+
+def prevoir_charge(semaines=4, date_debut=None):
+    """
+    Projette la charge par type d'essai et par jour
+
+    Returns:
+        Dict sérialisable avec, par type, les démarrages et l'occupation jour
+        par jour, leurs taux de saturation et un résumé hebdomadaire
+    """
+    date_debut = date_debut or timezone.now().date()
+    nombre_jours = semaines * 7
+    jours = [date_debut + timedelta(days=i) for i in range(nombre_jours)]
+    ouvrables = np.array([not est_weekend(j) and not est_jour_ferie(j) for j in jours])
+
+    quotidiennes, simultanees, durees = charger_capacites()
+    nombre_types = len(TYPES_ESSAIS)
+
+    # Démarrages connus (planning actif / dates d'envoi)
+    types_planifies, decalages_planifies = charger_demarrages_planifies(date_debut, nombre_jours)
+    demarrages_connus = np.zeros((nombre_types, nombre_jours))
+    np.add.at(demarrages_connus, (types_planifies, decalages_planifies), 1)
+
+    # Arrivées prévues: modèle saisonnier, diminué des démarrages déjà connus
+    base, facteurs_mois = ajuster_saisonnalite(date_debut)
+    jours_semaine = np.array([j.weekday() for j in jours])
+    mois = np.array([j.month - 1 for j in jours])
+    attendues = base[:, jours_semaine] * facteurs_mois[:, mois] * ouvrables
+    demarrages_prevus = np.maximum(attendues - demarrages_connus, 0)
+
+    demarrages = demarrages_connus + demarrages_prevus
+
+    # Occupation simultanée: en cours + connus + prévus, chacun sur sa durée
+    occupation = np.zeros((nombre_types, nombre_jours))
+    types_en_cours, decalages_en_cours, restants = charger_essais_en_cours(date_debut, durees)
+    if len(types_en_cours):
+        _ajouter_intervalles(occupation, types_en_cours, decalages_en_cours, restants)
+    if len(types_planifies):
+        _ajouter_intervalles(occupation, types_planifies, decalages_planifies, durees[types_planifies])
+    for indice in range(nombre_types):
+        fenetre = np.ones(durees[indice])
+        occupation[indice] += np.convolve(demarrages_prevus[indice], fenetre)[:nombre_jours]
+
+    # Capacité quotidienne nulle (type fermé): saturé dès qu'un démarrage est attendu
+    taux_demarrages = np.divide(
+        demarrages, quotidiennes[:, None],
+        out=np.where(demarrages > 0, 1.0, 0.0), where=quotidiennes[:, None] > 0
+    )
+    with np.errstate(invalid='ignore', divide='ignore'):
+        taux_occupation = occupation / simultanees[:, None]
+    taux = np.fmax(taux_demarrages, taux_occupation)
+
+    par_type = {}
+    for indice, type_essai in enumerate(TYPES_ESSAIS):
+        par_type[type_essai] = {
+            'capacite_quotidienne': int(quotidiennes[indice]),
+            'capacite_simultanee': None if np.isnan(simultanees[indice]) else int(simultanees[indice]),
+            'demarrages_planifies': demarrages_connus[indice].astype(int).tolist(),
+            'demarrages_prevus': np.round(demarrages_prevus[indice], 2).tolist(),
+            'occupation': np.round(occupation[indice], 2).tolist(),
+            'taux_saturation': np.round(taux[indice], 3).tolist(),
+            'semaines': [
+                {
+                    'debut': jours[s * 7].strftime('%Y-%m-%d'),
+                    'demarrages': round(float(demarrages[indice, s * 7:(s + 1) * 7].sum()), 1),
+                    'taux_max': round(float(taux[indice, s * 7:(s + 1) * 7].max()), 3),
+                }
+                for s in range(semaines)
+            ],
+        }
+
+    lignes_saturees, colonnes_saturees = np.nonzero(taux >= 1)
+    return {
+        'date_debut': date_debut.strftime('%Y-%m-%d'),
+        'jours': [j.strftime('%Y-%m-%d') for j in jours],
+        'ouvrables': ouvrables.tolist(),
+        'par_type': par_type,
+        'saturations': [
+            {
+                'type_essai': TYPES_ESSAIS[ligne],
+                'date': jours[colonne].strftime('%Y-%m-%d'),
+                'taux': round(float(taux[ligne, colonne]), 3),
+            }
+            for ligne, colonne in zip(lignes_saturees, colonnes_saturees)
+        ],
+        'genere_le': timezone.now().isoformat(),
+    }
+
+
+def prevoir_charge_cache(semaines=4):
+    """Prévision de charge mise en cache quelques minutes"""
+    cle = f"prevision_charge:{timezone.now().date()}:{semaines}"
+    prevision = cache.get(cle)
+    if prevision is None:
+        prevision = prevoir_charge(semaines)
+        cache.set(cle, prevision, DUREE_CACHE_PREVISION)
+    return prevision
@@ -0,0 +1,170 @@
+"""
+Regroupement des échantillons par client
+Les dashboards de suivi sont agrégés en SQL (une ligne par client); seules les
+lignes de la page demandée sont complétées en Python
+"""
+
+from django.db.models import Count, Max, Min, OuterRef, Q, Subquery
+
+from .utils import predire_dates_retour
+
+
+SANS_CLIENT = 'Sans client'
+
+
+def _format_date(valeur):
+    return valeur.strftime('%d/%m/%Y') if valeur else '-'
+
+
+def filtrer_periode(queryset, date_debut=None, date_fin=None):
+    """Restreint les échantillons à une période de réception"""
+    if date_debut:
+        queryset = queryset.filter(date_reception__gte=date_debut)
+    if date_fin:
+        queryset = queryset.filter(date_reception__lte=date_fin)
+    return queryset
+
+
+def grouper_par_client(queryset, **agregats):
+    """
+    Une ligne par client: nom, nombre d'échantillons et agrégats demandés
+
+    Les clients sont ordonnés par échantillon le plus récent, comme
+    l'étaient les regroupements Python.
+    """
+    return queryset.order_by().values('client__nom').annotate(
+        nombre_echantillons=Count('id'),
+        dernier_echantillon=Max('created_at'),
+        **agregats
+    ).order_by('-dernier_echantillon', 'client__nom')
+
+
+def essais_types_recents(queryset):
+    """Types d'essais de l'échantillon le plus récent du client (sous-requête)"""
+    return Subquery(
+        queryset.filter(client__nom=OuterRef('client__nom'))
+        .order_by('-created_at')
+        .values('essais_types')[:1]
+    )
+
+
+def _predictions(lignes):
+    """Prédictions de retour en lot pour les lignes (une seule mesure de charge)"""
+    return predire_dates_retour([ligne['essais_types'] for ligne in lignes]) if lignes else []
+
+
+def echantillons_par_client(queryset):
+    """
+    Échantillons groupés par client
+
+    Returns:
+        (lignes, construire) pour core.pagination.paginer
+    """
+    lignes = grouper_par_client(queryset)
+
+    def construire(page):
+        noms = [ligne['client__nom'] for ligne in page]
+        echantillons = {nom: [] for nom in noms}
+        for echantillon in queryset.filter(client__nom__in=noms).values(
+            'id', 'code', 'date_reception', 'statut', 'essais_types',
+            'date_retour_predite', 'client__nom'
+        ):
+            echantillons[echantillon.pop('client__nom')].append({
+                **echantillon,
+                'id': str(echantillon['id']),
+                'essais_types': echantillon['essais_types'] or [],
+            })
+
+        return [
+            {
+                'client_nom': ligne['client__nom'] or SANS_CLIENT,
+                'echantillons': echantillons[ligne['client__nom']],
+                'nombre_echantillons': ligne['nombre_echantillons'],
+            }
+            for ligne in page
+        ]
+
+    return lignes, construire
+
+
+def dashboard_traitement(queryset):
+    """Dashboard du traitement: réception, passage en traitement, retour client"""
+    lignes = grouper_par_client(
+        queryset,
+        date_reception=Min('date_reception'),
+        en_traitement=Count('id', filter=Q(statut='traitement')),
+        date_retour=Max('date_retour_predite'),
+    )
+
+    def construire(page):
+        return [
+            {
+                'clientName': ligne['client__nom'] or SANS_CLIENT,
+                'nombreEchantillons': ligne['nombre_echantillons'],
+                'dateReception': _format_date(ligne['date_reception']),
+                'dateTraitement': 'En traitement' if ligne['en_traitement'] else '-',
+                'dateRetourClient': ligne['date_retour'] or '-',
+            }
+            for ligne in page
+        ]
+
+    return lignes, construire
+
+
+def dashboard_chef_projet(queryset):
+    """Dashboard du chef de projet: date de traitement = envoi au chef de projet"""
+    lignes = grouper_par_client(
+        queryset,
+        date_reception=Min('date_reception'),
+        date_traitement=Min('date_envoi_chef_projet'),
+        essais_types=essais_types_recents(queryset),
+    )
+
+    def construire(page):
+        return [
+            {
+                'clientName': ligne['client__nom'] or SANS_CLIENT,
+                'nombreEchantillons': ligne['nombre_echantillons'],
+                'dateReception': _format_date(ligne['date_reception']),
+                'dateTraitement': _format_date(ligne['date_traitement']),
+                'dateRetourClient': prediction['date_retour'],
+            }
+            for ligne, prediction in zip(page, _predictions(page))
+        ]
+
+    return lignes, construire
+
+
+def dashboard_directeur_technique(queryset):
+    """Dashboard du directeur technique: toutes les dates du circuit de validation"""
+    lignes = grouper_par_client(
+        queryset,
+        date_reception=Min('date_reception'),
+        date_traitement=Min('date_envoi_chef_projet'),
+        date_chef_projet=Min('date_envoi_chef_service'),
+        date_chef_service=Min('date_envoi_directeur_technique'),
+        date_retour=Max('date_retour_predite'),
+        essais_types=essais_types_recents(queryset),
+    )
+
+    def construire(page):
+        # Prédiction seulement pour les clients sans date de retour enregistrée
+        sans_date = [ligne for ligne in page if not ligne['date_retour']]
+        predictions = {
+            ligne['client__nom']: prediction['date_retour']
+            for ligne, prediction in zip(sans_date, _predictions(sans_date))
+        }
+        return [
+            {
+                'clientName': ligne['client__nom'] or SANS_CLIENT,
+                'nombreEchantillons': ligne['nombre_echantillons'],
+                'dateReception': _format_date(ligne['date_reception']),
+                'dateTraitement': _format_date(ligne['date_traitement']),
+                'dateChefProjet': _format_date(ligne['date_chef_projet']),
+                'dateChefService': _format_date(ligne['date_chef_service']),
+                'dateRetourClient': ligne['date_retour'] or predictions[ligne['client__nom']],
+            }
+            for ligne in page
+        ]
+
+    return lignes, construire
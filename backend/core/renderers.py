@@ -0,0 +1,36 @@
+"""
+Rendu JSON rapide pour l'API REST
+orjson sérialise nativement UUID, dates et datetimes; les autres types
+(Decimal, timedelta, chaînes paresseuses...) passent par l'encodeur de DRF.
+Sans orjson, le rendu standard de DRF est utilisé
+"""
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """Renderer JSON basé sur orjson (repli sur JSONRenderer si indisponible)"""
+
+    options = (
+        orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS if orjson else 0
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if data is None:
+            return b''
+
+        options = self.options
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context):
+            options |= orjson.OPT_INDENT_2
+
+        return orjson.dumps(data, default=JSONEncoder().default, option=options)
@@ -0,0 +1,264 @@
+"""
+Génération des rapports PDF côté serveur
+Le rapport est construit à partir de l'échantillon, du client et des
+résultats d'essais. Chaque rendu est indexé par l'empreinte de ses entrées:
+tant qu'elles ne changent pas, le PDF déjà stocké est réutilisé. La signature
+est apposée en surimpression sur un PDF existant, sans refaire le rendu
+"""
+
+import hashlib
+import io
+import json
+from xml.sax.saxutils import escape
+
+from PIL import Image
+from pypdf import PdfReader, PdfWriter
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from . import blobs
+from .models import Echantillon, RenduRapport
+
+
+# À incrémenter quand la mise en page change: invalide tous les rendus
+VERSION_GABARIT = '1'
+
+
+class SignatureInvalide(ValueError):
+    """Levée quand la signature reçue n'est pas une image"""
+
+
+def donnees_rapport(echantillon):
+    """Entrées du rendu (tout ce qui apparaît dans le PDF)"""
+    client = echantillon.client
+    return {
+        'echantillon': {
+            'code': echantillon.code,
+            'nature': echantillon.get_nature_display(),
+            'profondeur': f'{echantillon.profondeur_debut} - {echantillon.profondeur_fin} m',
+            'sondage': echantillon.get_sondage_display(),
+            'numero_sondage': echantillon.numero_sondage,
+            'nappe': echantillon.nappe,
+            'date_reception': echantillon.date_reception,
+            'chef_projet': echantillon.chef_projet,
+        },
+        'client': {
+            'nom': client.nom,
+            'code': client.code,
+            'projet': client.projet,
+            'contact': client.contact,
+        },
+        'essais': [
+            {
+                'type': essai.get_type_display(),
+                'section': essai.get_section_display(),
+                'statut': essai.get_statut_display(),
+                'date_debut': essai.date_debut,
+                'date_fin': essai.date_fin,
+                'operateur': essai.operateur,
+                'resultats': essai.resultats or {},
+                'commentaires': essai.commentaires,
+            }
+            for essai in echantillon.essais.order_by('type', 'created_at')
+        ],
+    }
+
+
+def _empreinte(*parties):
+    contenu = '|'.join([VERSION_GABARIT, *parties])
+    return hashlib.sha256(contenu.encode()).hexdigest()
+
+
+def cle_rapport(donnees):
+    return _empreinte('rapport', json.dumps(donnees, sort_keys=True, default=str))
+
+
+def cle_signature(sha256_pdf, signature):
+    return _empreinte('signe', sha256_pdf, hashlib.sha256(signature.encode()).hexdigest())
+
+
+def _valeur(valeur):
+    """Texte d'une valeur, échappé pour les Paragraph de reportlab"""
+    if isinstance(valeur, (dict, list)):
+        valeur = json.dumps(valeur, ensure_ascii=False, default=str)
+    return '-' if valeur in (None, '') else escape(str(valeur))
+
+
+def _tableau(lignes, largeurs):
+    tableau = Table(lignes, colWidths=largeurs)
+    tableau.setStyle(TableStyle([
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#E8EEF5')),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ]))
+    return tableau
+
+
+def construire_pdf(donnees):
+    """Rend le rapport en PDF (octets)"""
+    styles = getSampleStyleSheet()
+    sortie = io.BytesIO()
+    document = SimpleDocTemplate(
+        sortie, pagesize=A4, title=f"Rapport d'essais {donnees['echantillon']['code']}",
+        leftMargin=2 * cm, rightMargin=2 * cm, topMargin=2 * cm, bottomMargin=4 * cm,
+        invariant=True,
+    )
+
+    echantillon, client = donnees['echantillon'], donnees['client']
+    elements = [
+        Paragraph("SNERTP - Centre National d'Essais et de Recherches des Travaux Publics", styles['Heading3']),
+        Paragraph(f"Rapport d'essais - Échantillon {_valeur(echantillon['code'])}", styles['Title']),
+        _tableau([
+            ['Client', _valeur(client['nom'])],
+            ['Projet', _valeur(client['projet'])],
+            ['Nature', _valeur(echantillon['nature'])],
+            ['Profondeur', _valeur(echantillon['profondeur'])],
+            ['Sondage', _valeur(f"{echantillon['sondage']} {echantillon['numero_sondage']}".strip())],
+            ['Nappe', _valeur(echantillon['nappe'])],
+            ['Date de réception', _valeur(echantillon['date_reception'])],
+            ['Chef de projet', _valeur(echantillon['chef_projet'])],
+        ], [5 * cm, 12 * cm]),
+    ]
+
+    for essai in donnees['essais']:
+        elements += [
+            Spacer(1, 0.5 * cm),
+            Paragraph(f"{_valeur(essai['type'])} ({_valeur(essai['section'])}) - {_valeur(essai['statut'])}", styles['Heading2']),
+            Paragraph(
+                f"Du {_valeur(essai['date_debut'])} au {_valeur(essai['date_fin'])}, opérateur: {_valeur(essai['operateur'])}",
+                styles['Normal']
+            ),
+        ]
+        resultats = essai['resultats']
+        if isinstance(resultats, dict) and resultats:
+            elements.append(_tableau(
+                [[str(cle), Paragraph(_valeur(valeur), styles['Normal'])] for cle, valeur in resultats.items()],
+                [6 * cm, 11 * cm]
+            ))
+        elif resultats:
+            elements.append(Paragraph(_valeur(resultats), styles['Normal']))
+        if essai['commentaires']:
+            elements.append(Paragraph(f"Commentaires: {_valeur(essai['commentaires'])}", styles['Italic']))
+
+    document.build(elements)
+    return sortie.getvalue()
+
+
+def verifier_signature(signature):
+    """
+    Vérifie que la signature (base64 / data URL) est une image, avant de
+    mettre son apposition en file
+
+    Raises:
+        SignatureInvalide
+    """
+    if not isinstance(signature, str):
+        raise SignatureInvalide('La signature doit être une image en base64 ou une data URL')
+    try:
+        image, type_mime = blobs.decoder(signature)
+    except blobs.ContenuInvalide:
+        raise SignatureInvalide('Signature invalide: ni base64 ni data URL')
+    if type_mime == blobs.TYPE_URL:
+        raise SignatureInvalide("La signature doit être l'image elle-même, pas un lien")
+    try:
+        Image.open(io.BytesIO(image)).verify()
+    except Exception:
+        raise SignatureInvalide("La signature n'est pas une image lisible")
+
+
+def apposer_signature(pdf, signature):
+    """
+    Surimprime la signature (image en base64 / data URL) en bas de la dernière page
+
+    Returns:
+        Octets du PDF signé
+    """
+    image, _ = blobs.decoder(signature)
+    lecteur = PdfReader(io.BytesIO(pdf))
+    derniere = lecteur.pages[-1]
+    largeur, hauteur = float(derniere.mediabox.width), float(derniere.mediabox.height)
+
+    calque = io.BytesIO()
+    dessin = canvas.Canvas(calque, pagesize=(largeur, hauteur))
+    dessin.setFont('Helvetica', 9)
+    dessin.drawString(largeur - 8 * cm, 3.4 * cm, 'Le Directeur SNERTP')
+    dessin.drawImage(
+        ImageReader(io.BytesIO(image)), largeur - 8 * cm, 1 * cm,
+        width=6 * cm, height=2.2 * cm, preserveAspectRatio=True, mask='auto'
+    )
+    dessin.save()
+
+    ecrivain = PdfWriter(clone_from=lecteur)
+    ecrivain.pages[-1].merge_page(PdfReader(calque).pages[0])
+    sortie = io.BytesIO()
+    ecrivain.write(sortie)
+    return sortie.getvalue()
+
+
+def rendu_en_cache(echantillon, signature=None):
+    """Rendu déjà stocké pour l'état actuel de l'échantillon, sinon None"""
+    rendu = RenduRapport.objects.select_related('fichier').filter(cle=cle_rapport(donnees_rapport(echantillon))).first()
+    if rendu is None or not signature:
+        return rendu
+    return RenduRapport.objects.select_related('fichier').filter(cle=cle_signature(rendu.fichier_id, signature)).first()
+
+
+def _enregistrer(cle, type_rendu, echantillon, pdf, source=None):
+    rendu, _ = RenduRapport.objects.get_or_create(
+        cle=cle,
+        defaults={
+            'type': type_rendu,
+            'echantillon': echantillon,
+            'fichier': blobs.stocker_octets(pdf, 'application/pdf'),
+            'source': source,
+        }
+    )
+    return rendu
+
+
+def rendre_rapport(echantillon):
+    """Rendu du rapport de l'échantillon, refait seulement si ses entrées ont changé"""
+    donnees = donnees_rapport(echantillon)
+    cle = cle_rapport(donnees)
+    rendu = RenduRapport.objects.select_related('fichier').filter(cle=cle).first()
+    if rendu is None:
+        rendu = _enregistrer(cle, 'rapport', echantillon, construire_pdf(donnees))
+    return rendu
+
+
+def original(blob):
+    """PDF non signé dont blob est la version signée, sinon blob lui-même"""
+    rendu = RenduRapport.objects.select_related('source').filter(
+        type='signe', fichier=blob, source__isnull=False
+    ).first()
+    return rendu.source if rendu else blob
+
+
+def signer_pdf(blob, signature, echantillon):
+    """
+    Version signée d'un PDF stocké, réutilisée si déjà produite avec la même signature
+
+    Un PDF déjà signé est re-signé à partir de son original: les signatures
+    ne s'empilent pas.
+    """
+    blob = original(blob)
+    cle = cle_signature(blob.sha256, signature)
+    rendu = RenduRapport.objects.select_related('fichier').filter(cle=cle).first()
+    if rendu is None:
+        rendu = _enregistrer(cle, 'signe', echantillon, apposer_signature(blobs.lire(blob), signature), blob)
+    return rendu
+
+
+def generer(echantillon_id, signature=None):
+    """Rendu (et signature éventuelle) du rapport d'un échantillon; retourne le Blob du PDF"""
+    echantillon = Echantillon.objects.select_related('client').get(pk=echantillon_id)
+    rendu = rendre_rapport(echantillon)
+    if signature:
+        rendu = signer_pdf(rendu.fichier, signature, echantillon)
+    return rendu.fichier
@@ -2,10 +2,169 @@
 Helper pour la reprogrammation automatique des échantillons retardés
 """
 from datetime import timedelta
+from django.db import transaction
+from django.db.models import Case, Q, Value, When
 from django.utils import timezone
-from core.models import Echantillon, TacheProgrammee
+from core.models import Echantillon, Essai, TacheProgrammee
+from core.calendrier_capacite import calendrier_capacite
+from core.utils import (
+    DUREES_ESSAIS, CHAMPS_DATE_ENVOI, est_weekend, est_jour_ferie, ajouter_jours_ouvrables
+)
 
-def reprogrammer_echantillon_retarde(echantillon_id, jours_retard):
+# Jours de traitement après le dernier essai
+DELAI_TRAITEMENT = 2
+
+# Fenêtre de recherche d'une date d'envoi libre (jours calendaires)
+HORIZON_REPROGRAMMATION = 90
+
+# Délai par défaut avant le premier envoi reprogrammé (jours calendaires)
+JOURS_RETARD_DEFAUT = 4
+
+
+def _premier_jour_ouvrable(date):
+    while est_weekend(date) or est_jour_ferie(date):
+        date += timedelta(days=1)
+    return date
+
+
+def _places_restantes(date_debut, date_fin, exclus):
+    """
+    Retourne {(type_essai, date): places} sur la fenêtre (None = illimité)
+
+    Les places tiennent compte des créneaux occupés et des envois déjà
+    planifiés par les autres échantillons encore en stockage.
+    """
+    places = {
+        (type_essai, jour['date']): cellule['capacite_restante']
+        for jour in calendrier_capacite(date_debut, date_fin)
+        for type_essai, cellule in jour['capacites'].items()
+    }
+
+    filtre_fenetre = Q()
+    for champ in CHAMPS_DATE_ENVOI.values():
+        filtre_fenetre |= Q(**{f'{champ}__gte': date_debut, f'{champ}__lte': date_fin})
+
+    planifies = Echantillon.objects.filter(filtre_fenetre, statut='stockage').exclude(
+        id__in=exclus
+    ).values_list(*CHAMPS_DATE_ENVOI.values())
+
+    for dates in planifies:
+        for type_essai, date_envoi in zip(CHAMPS_DATE_ENVOI, dates):
+            cle = (type_essai, date_envoi)
+            if places.get(cle) is not None:
+                places[cle] = max(0, places[cle] - 1)
+
+    return places
+
+
+def reprogrammer_echantillons(echantillon_ids, jours_retard=JOURS_RETARD_DEFAUT):
+    """
+    Reprogramme un ensemble d'échantillons retardés en une transaction
+
+    - Calcule pour chaque type d'essai en attente la première date d'envoi
+      ouvrable disposant de capacité, à partir d'aujourd'hui + jours_retard
+    - Répartit les échantillons sur les jours suivants quand un jour est plein
+      (urgents d'abord, puis les plus anciens)
+    - Met à jour les dates d'envoi, de retour prédite et de fin estimée (un
+      échantillon reprogrammé n'est plus en retard), remplace les tâches
+      d'envoi programmées, le tout en écritures groupées
+
+    Returns:
+        Liste de dicts {'echantillon_id', 'code', 'dates_envoi', 'nouvelle_date_envoi', 'nouvelle_date_retour'}
+    """
+    echantillons = list(
+        Echantillon.objects.filter(id__in=echantillon_ids).order_by(
+            Case(When(priorite='urgente', then=Value(0)), default=Value(1)), 'created_at'
+        )
+    )
+    if not echantillons:
+        return []
+
+    ids = [e.id for e in echantillons]
+
+    # Essais encore à envoyer, par échantillon
+    essais_attente = {}
+    avec_essais = set()
+    for essai_id, echantillon_id, type_essai, statut in Essai.objects.filter(
+        echantillon_id__in=ids
+    ).values_list('id', 'echantillon_id', 'type', 'statut'):
+        avec_essais.add(echantillon_id)
+        if statut == 'attente':
+            essais_attente.setdefault(echantillon_id, []).append((essai_id, type_essai))
+
+    date_depart = _premier_jour_ouvrable(timezone.now().date() + timedelta(days=int(jours_retard)))
+    date_limite = date_depart + timedelta(days=HORIZON_REPROGRAMMATION)
+    places = _places_restantes(date_depart, date_limite, ids)
+
+    resultats = []
+    taches = []
+    for echantillon in echantillons:
+        essais = essais_attente.get(echantillon.id, [])
+        # Sans essais créés, on se base sur les types demandés
+        types = [t for _, t in essais] if echantillon.id in avec_essais else (echantillon.essais_types or [])
+        types = [t for t in dict.fromkeys(types) if t in CHAMPS_DATE_ENVOI]
+
+        dates_envoi = {}
+        for type_essai in types:
+            jour = date_depart
+            while jour < date_limite:
+                restant = places.get((type_essai, jour))
+                if restant is None or restant > 0:
+                    break
+                jour = _premier_jour_ouvrable(jour + timedelta(days=1))
+            if places.get((type_essai, jour)):
+                places[(type_essai, jour)] -= 1
+            dates_envoi[type_essai] = jour
+            setattr(echantillon, CHAMPS_DATE_ENVOI[type_essai], jour)
+
+        if dates_envoi:
+            # Retour = fin de l'essai le plus tardif + traitement (jours ouvrables)
+            fin_essais = max(
+                ajouter_jours_ouvrables(jour, DUREES_ESSAIS.get(type_essai, 0))
+                for type_essai, jour in dates_envoi.items()
+            )
+            echantillon.date_retour_predite = ajouter_jours_ouvrables(fin_essais, DELAI_TRAITEMENT)
+            echantillon.date_fin_estimee = echantillon.date_retour_predite
+
+        for essai_id, type_essai in essais:
+            taches.append(TacheProgrammee(
+                type_tache='envoi_essai',
+                date_execution=timezone.make_aware(
+                    timezone.datetime.combine(dates_envoi[type_essai], timezone.datetime.min.time())
+                ),
+                echantillon_id=echantillon.id,
+                essai_id=essai_id,
+                statut='en_attente'
+            ))
+
+        resultats.append({
+            'echantillon_id': str(echantillon.id),
+            'code': echantillon.code,
+            'dates_envoi': dates_envoi,
+            'nouvelle_date_envoi': min(dates_envoi.values()) if dates_envoi else date_depart,
+            'nouvelle_date_retour': echantillon.date_retour_predite,
+        })
+
+    # bulk_update n'applique pas auto_now: updated_at est posé pour les ETags et /api/sync/
+    maintenant = timezone.now()
+    for echantillon in echantillons:
+        echantillon.updated_at = maintenant
+
+    with transaction.atomic():
+        Echantillon.objects.bulk_update(
+            echantillons, [*CHAMPS_DATE_ENVOI.values(), 'date_retour_predite', 'date_fin_estimee', 'updated_at'],
+            batch_size=500
+        )
+        # Les anciennes tâches d'envoi sont remplacées par les nouvelles
+        TacheProgrammee.objects.filter(
+            echantillon_id__in=ids, type_tache='envoi_essai', statut='en_attente'
+        ).update(statut='annulee')
+        TacheProgrammee.objects.bulk_create(taches, batch_size=500)
+
+    return resultats
+
+
+def reprogrammer_echantillon_retarde(echantillon_id, jours_retard=JOURS_RETARD_DEFAUT):
     """
     Reprogramme automatiquement un échantillon retardé
     - Calcule la nouvelle date d'envoi
@@ -13,55 +172,24 @@ def reprogrammer_echantillon_retarde(echantillon_id, jours_retard):
     - Met à jour la date de retour prédite
     """
     try:
-        echantillon = Echantillon.objects.get(id=echantillon_id)
-        
-        # Calculer la nouvelle date d'envoi
-        nouvelle_date_envoi = timezone.now().date() + timedelta(days=jours_retard)
-        
-        # Mettre à jour les dates d'envoi selon les types d'essais
-        durees = {'AG': 5, 'Proctor': 5, 'CBR': 9, 'Oedometre': 18, 'Cisaillement': 4}
-        
-        if 'AG' in (echantillon.essais_types or []):
-            echantillon.date_envoi_ag = nouvelle_date_envoi
-        if 'Proctor' in (echantillon.essais_types or []):
-            echantillon.date_envoi_proctor = nouvelle_date_envoi
-        if 'CBR' in (echantillon.essais_types or []):
-            echantillon.date_envoi_cbr = nouvelle_date_envoi
-        if 'Oedometre' in (echantillon.essais_types or []):
-            echantillon.date_envoi_oedometre = nouvelle_date_envoi
-        if 'Cisaillement' in (echantillon.essais_types or []):
-            echantillon.date_envoi_cisaillement = nouvelle_date_envoi
-        
-        # Recalculer la date de retour prédite
-        duree_max = max([durees.get(essai, 0) for essai in (echantillon.essais_types or [])] or [0])
-        echantillon.date_retour_predite = nouvelle_date_envoi + timedelta(days=duree_max + 2)
-        
-        # Créer une tâche programmée pour l'envoi automatique
-        TacheProgrammee.objects.create(
-            type_tache='envoi_essai',
-            date_execution=timezone.make_aware(
-                timezone.datetime.combine(nouvelle_date_envoi, timezone.datetime.min.time())
-            ),
-            echantillon=echantillon,
-            statut='en_attente'
-        )
-        
-        echantillon.save()
-        
-        return {
-            'success': True,
-            'nouvelle_date_envoi': nouvelle_date_envoi,
-            'nouvelle_date_retour': echantillon.date_retour_predite,
-            'message': f'Échantillon reprogrammé avec succès pour le {nouvelle_date_envoi}'
-        }
-        
-    except Echantillon.DoesNotExist:
+        resultats = reprogrammer_echantillons([echantillon_id], jours_retard)
+    except Exception as e:
         return {
             'success': False,
-            'error': 'Échantillon non trouvé'
+            'error': str(e)
         }
-    except Exception as e:
+
+    if not resultats:
         return {
             'success': False,
-            'error': str(e)
+            'error': 'Échantillon non trouvé'
         }
+
+    resultat = resultats[0]
+    return {
+        'success': True,
+        'nouvelle_date_envoi': resultat['nouvelle_date_envoi'],
+        'nouvelle_date_retour': resultat['nouvelle_date_retour'],
+        'dates_envoi': resultat['dates_envoi'],
+        'message': f"Échantillon reprogrammé avec succès pour le {resultat['nouvelle_date_envoi']}"
+    }
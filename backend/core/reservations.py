@@ -0,0 +1,169 @@
+"""
+Réservations atomiques de capacité
+Chaque créneau (type d'essai, date) porte deux compteurs mis à jour par des
+incréments conditionnels: deux envois simultanés ne peuvent pas dépasser la
+capacité quotidienne
+"""
+
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import CapaciteLaboratoire, CreneauCapacite, ReservationCapacite, Essai
+
+
+# Durée de validité d'une réservation temporaire (brouillon d'envoi)
+DUREE_RESERVATION = timedelta(minutes=15)
+
+
+class CapaciteAtteinte(Exception):
+    """Levée quand un créneau n'a plus de place"""
+
+    def __init__(self, type_essai, date):
+        self.type_essai = type_essai
+        self.date = date
+        super().__init__(f"Capacité atteinte pour {type_essai} le {date.strftime('%d/%m/%Y')}")
+
+
+def _capacite(type_essai):
+    return CapaciteLaboratoire.objects.filter(type_essai=type_essai).values_list(
+        'capacite_quotidienne', flat=True
+    ).first()
+
+
+def _incrementer(type_essai, date, champ, quantite):
+    """Incrémente un compteur du créneau si la capacité le permet (sinon CapaciteAtteinte)"""
+    CreneauCapacite.objects.get_or_create(type_essai=type_essai, date=date)
+    creneau = CreneauCapacite.objects.filter(type_essai=type_essai, date=date)
+
+    capacite = _capacite(type_essai)
+    if capacite is not None:
+        # Condition évaluée par la base dans le même UPDATE que l'incrément
+        creneau = creneau.filter(utilise__lte=capacite - quantite - F('reserve'))
+
+    if not creneau.update(**{champ: F(champ) + quantite}):
+        raise CapaciteAtteinte(type_essai, date)
+
+
+def _decrementer(type_essai, date, champ, quantite):
+    CreneauCapacite.objects.filter(
+        type_essai=type_essai, date=date, **{f'{champ}__gte': quantite}
+    ).update(**{champ: F(champ) - quantite})
+
+
+def reserver(type_essai, date, quantite=1, user=None, duree=DUREE_RESERVATION):
+    """Pose une réservation temporaire sur un créneau"""
+    with transaction.atomic():
+        _incrementer(type_essai, date, 'reserve', quantite)
+        return ReservationCapacite.objects.create(
+            type_essai=type_essai,
+            date=date,
+            quantite=quantite,
+            expire_le=timezone.now() + duree,
+            created_by=user
+        )
+
+
+def liberer(reservation, statut='liberee'):
+    """Libère une réservation active et rend ses places restantes au créneau"""
+    with transaction.atomic():
+        reservation = ReservationCapacite.objects.select_for_update().get(pk=reservation.pk)
+        if reservation.statut != 'active':
+            return False
+
+        _decrementer(reservation.type_essai, reservation.date, 'reserve', reservation.quantite)
+        reservation.statut = statut
+        reservation.save(update_fields=['statut'])
+    return True
+
+
+def occuper(type_essai, date, reservation_id=None, essai=None):
+    """
+    Consomme une place du créneau pour un essai
+
+    Une place d'une réservation active, non expirée, sur le même créneau est
+    convertie (l'essai est ajouté à ceux de la réservation); sinon la place
+    est prise directement si la capacité le permet.
+    """
+    if reservation_id:
+        try:
+            convertie = ReservationCapacite.objects.filter(
+                pk=reservation_id, statut='active', expire_le__gt=timezone.now(),
+                type_essai=type_essai, date=date, quantite__gte=1
+            ).update(quantite=F('quantite') - 1)
+        except ValidationError:
+            # Identifiant mal formé: traité comme une réservation absente
+            convertie = 0
+        if convertie:
+            if essai is not None:
+                ReservationCapacite.essais.through.objects.create(reservationcapacite_id=reservation_id, essai_id=essai.pk)
+            ReservationCapacite.objects.filter(pk=reservation_id, quantite=0).update(statut='confirmee')
+            CreneauCapacite.objects.filter(type_essai=type_essai, date=date).update(
+                reserve=F('reserve') - 1, utilise=F('utilise') + 1
+            )
+            return
+
+    _incrementer(type_essai, date, 'utilise', 1)
+
+
+def deplacer_essai(essai, nouveau_type, nouvelle_date, reservation_id=None):
+    """
+    Met à jour l'occupation quand le type ou la date de réception d'un essai change
+
+    Doit être appelé dans la transaction qui enregistre l'essai.
+    """
+    ancien = (essai.type, essai.date_reception)
+    nouveau = (nouveau_type, nouvelle_date)
+    if ancien == nouveau:
+        return
+
+    if nouvelle_date:
+        occuper(nouveau_type, nouvelle_date, reservation_id, essai)
+    if essai.date_reception:
+        _decrementer(essai.type, essai.date_reception, 'utilise', 1)
+
+
+def liberer_reservations_expirees():
+    """Expire les réservations dépassées; retourne le nombre libéré"""
+    expirees = ReservationCapacite.objects.filter(
+        statut='active', expire_le__lt=timezone.now()
+    )
+    return sum(liberer(reservation, statut='expiree') for reservation in expirees)
+
+
+def resynchroniser_creneaux(date_debut, date_fin):
+    """Recalcule les compteurs 'utilise' depuis les essais (corrige toute dérive)"""
+    with transaction.atomic():
+        # Verrouiller les créneaux avant de compter pour ne pas écraser un envoi concurrent
+        creneaux = list(CreneauCapacite.objects.select_for_update().filter(
+            date__gte=date_debut, date__lte=date_fin
+        ))
+        comptes = {
+            (type_essai, jour): nombre
+            for type_essai, jour, nombre in Essai.objects.filter(
+                date_reception__gte=date_debut,
+                date_reception__lte=date_fin
+            ).values_list('type', 'date_reception').annotate(nombre=Count('id')).order_by()
+        }
+
+        existants = set()
+        a_corriger = []
+        for creneau in creneaux:
+            existants.add((creneau.type_essai, creneau.date))
+            attendu = comptes.get((creneau.type_essai, creneau.date), 0)
+            if creneau.utilise != attendu:
+                creneau.utilise = attendu
+                a_corriger.append(creneau)
+        CreneauCapacite.objects.bulk_update(a_corriger, ['utilise'])
+
+        manquants = [
+            CreneauCapacite(type_essai=type_essai, date=jour, utilise=nombre)
+            for (type_essai, jour), nombre in comptes.items()
+            if (type_essai, jour) not in existants
+        ]
+        CreneauCapacite.objects.bulk_create(manquants, ignore_conflicts=True)
+
+    return len(a_corriger) + len(manquants)
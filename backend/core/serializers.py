@@ -1,10 +1,28 @@
 from django.contrib.auth import get_user_model
-from .models import Client, ActionLog, WorkflowValidation, DataStorage, EssaiData, PlanificationData, RapportValidation, RapportArchive, Echantillon, Essai, Notification, ValidationHistory, Rapport, PlanificationEssai, CapaciteLaboratoire, RapportMarketing, WorkflowValidation
+from .models import Client, ActionLog, WorkflowValidation, DataStorage, EssaiData, PlanificationData, RapportValidation, RapportArchive, Echantillon, Essai, Notification, ValidationHistory, Rapport, PlanificationEssai, CapaciteLaboratoire, RapportMarketing, WorkflowValidation, ReservationCapacite, ResultatCalcule
 from rest_framework import serializers
 
+from . import blobs
+from .photos import MINIATURE_LISTE, url_miniature, urls_miniatures
+from .telechargement import url_telechargement
+
 User = get_user_model()
 
 
+class MiniaturesPhotoField(serializers.ReadOnlyField):
+    """URLs des miniatures de la photo, par taille (mini, liste, grand)"""
+    
+    def to_representation(self, photo):
+        return urls_miniatures(photo.name if photo else None, self.context.get('request'))
+
+
+class MiniaturePhotoField(MiniaturesPhotoField):
+    """URL de la miniature de liste, à la place de la photo en taille réelle"""
+    
+    def to_representation(self, photo):
+        return url_miniature(photo.name if photo else None, MINIATURE_LISTE, self.context.get('request'))
+
+
 class UserSerializer(serializers.ModelSerializer):
     """Serializer pour les utilisateurs"""
     
@@ -32,12 +50,13 @@ class ClientSerializer(serializers.ModelSerializer):
     """Serializer pour les clients"""
     
     echantillons_count = serializers.SerializerMethodField()
+    photo_miniatures = MiniaturesPhotoField(source='photo')
     
     class Meta:
         model = Client
         fields = [
             'id', 'code', 'nom', 'contact', 'projet', 'email', 
-            'telephone', 'photo', 'created_at', 'updated_at',
+            'telephone', 'photo', 'photo_miniatures', 'created_at', 'updated_at',
             'echantillons_count'
         ]
         read_only_fields = ['id', 'code', 'created_at', 'updated_at']
@@ -46,7 +65,48 @@ class ClientSerializer(serializers.ModelSerializer):
         return obj.echantillons.count()
 
 
-class EssaiSerializer(serializers.ModelSerializer):
+class ClientListSerializer(ClientSerializer):
+    """Clients en liste: miniature à la place de la photo"""
+    
+    photo = MiniaturePhotoField()
+
+
+def champs_demandes(request):
+    """
+    Champs demandés par ?fields=a,b complétés par ?expand=c
+    
+    Returns:
+        Liste ordonnée de noms, ou None si la requête ne restreint pas les champs
+    """
+    if request is None or request.method != 'GET' or not request.query_params.get('fields'):
+        return None
+    champs = {}
+    for param in ('fields', 'expand'):
+        champs.update(dict.fromkeys(c.strip() for c in request.query_params.get(param, '').split(',') if c.strip()))
+    return list(champs)
+
+
+class ChampsDynamiquesMixin:
+    """
+    Restreint la représentation aux champs demandés (?fields= / ?expand=)
+    
+    Ne s'applique qu'au serializer de premier niveau: les serializers imbriqués
+    (essais d'un échantillon) gardent tous leurs champs.
+    """
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        premier_niveau = self.root is self or (
+            self.parent is self.root and isinstance(self.root, serializers.ListSerializer)
+        )
+        champs = champs_demandes(self.context.get('request')) if premier_niveau else None
+        if champs is not None:
+            for nom in set(fields) - set(champs):
+                fields.pop(nom)
+        return fields
+
+
+class EssaiSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     """Serializer pour les essais"""
     
     echantillon_code = serializers.CharField(source='echantillon.code', read_only=True)
@@ -67,7 +127,15 @@ class EssaiSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 
-class EchantillonSerializer(serializers.ModelSerializer):
+class ResultatCalculeSerializer(serializers.ModelSerializer):
+    echantillon_code = serializers.CharField(source='essai.echantillon.code', read_only=True)
+    
+    class Meta:
+        model = ResultatCalcule
+        fields = '__all__'
+
+
+class EchantillonSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     """Serializer pour les échantillons"""
     
     client_nom = serializers.CharField(source='client.nom', read_only=True)
@@ -81,13 +149,14 @@ class EchantillonSerializer(serializers.ModelSerializer):
     )
     statut_display = serializers.CharField(source='get_statut_display', read_only=True)
     priorite_display = serializers.CharField(source='get_priorite_display', read_only=True)
+    photo_miniatures = MiniaturesPhotoField(source='photo')
     
     class Meta:
         model = Echantillon
         fields = [
             'id', 'code', 'client', 'client_nom', 'client_code',
             'nature', 'profondeur_debut', 'profondeur_fin', 'sondage',
-            'nappe', 'qr_code', 'photo', 'date_reception', 'date_envoi_essais', 'date_fin_estimee',
+            'nappe', 'qr_code', 'photo', 'photo_miniatures', 'date_reception', 'date_envoi_essais', 'date_fin_estimee',
             'statut', 'statut_display', 'priorite', 'priorite_display',
             'chef_projet', 'essais', 'essais_types', 'created_at', 'updated_at',
             'date_envoi_ag', 'date_envoi_proctor', 'date_envoi_cbr', 'date_envoi_oedometre', 'date_envoi_cisaillement',
@@ -120,7 +189,18 @@ class EchantillonSerializer(serializers.ModelSerializer):
         return echantillon
 
 
-class EchantillonListSerializer(serializers.ModelSerializer):
+class EchantillonSyncSerializer(EchantillonSerializer):
+    """Échantillon sans essais imbriqués (synchronisés séparément par /api/sync/)"""
+    
+    essais = None
+    essais_types = serializers.JSONField(read_only=True)
+    photo = MiniaturePhotoField()
+    
+    class Meta(EchantillonSerializer.Meta):
+        fields = [champ for champ in EchantillonSerializer.Meta.fields if champ != 'essais']
+
+
+class EchantillonListSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     """Serializer simplifié pour les listes d'échantillons"""
     
     client_nom = serializers.CharField(source='client.nom', read_only=True)
@@ -132,22 +212,27 @@ class EchantillonListSerializer(serializers.ModelSerializer):
     essais = EssaiSerializer(many=True, read_only=True)
     essais_count = serializers.SerializerMethodField()
     essais_types = serializers.SerializerMethodField()
+    photo = MiniaturePhotoField()
+    photo_miniatures = MiniaturesPhotoField(source='photo')
     
     class Meta:
         model = Echantillon
         fields = [
             'id', 'code', 'client_nom', 'client_code', 'client_contact', 'client_projet', 'client_email', 'client_telephone',
-            'nature', 'profondeur_debut', 'profondeur_fin', 'sondage', 'nappe', 'qr_code', 'photo', 'statut', 
+            'nature', 'profondeur_debut', 'profondeur_fin', 'sondage', 'nappe', 'qr_code', 'photo', 'photo_miniatures', 'statut', 
             'priorite', 'chef_projet', 'date_reception', 'date_envoi_essais', 'essais', 'essais_count', 'essais_types',
             'date_envoi_ag', 'date_envoi_proctor', 'date_envoi_cbr', 'date_envoi_oedometre', 'date_envoi_cisaillement',
             'date_retour_predite'
         ]
     
     def get_essais_count(self, obj):
+        # Annoté par EchantillonViewSet.get_queryset en liste
+        if hasattr(obj, 'nombre_essais'):
+            return obj.nombre_essais
         return obj.essais.count()
     
     def get_essais_types(self, obj):
-        return obj.essais_types if hasattr(obj, 'essais_types') and obj.essais_types else list(obj.essais.values_list('type', flat=True))
+        return obj.essais_types if hasattr(obj, 'essais_types') and obj.essais_types else [essai.type for essai in obj.essais.all()]
 
 
 class NotificationSerializer(serializers.ModelSerializer):
@@ -161,9 +246,9 @@ class NotificationSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'type', 'title', 'message', 'module',
             'action_required', 'read', 'echantillon', 'echantillon_code',
-            'essai', 'essai_type', 'created_at', 'read_at'
+            'essai', 'essai_type', 'created_at', 'updated_at', 'read_at'
         ]
-        read_only_fields = ['id', 'created_at', 'read_at']
+        read_only_fields = ['id', 'created_at', 'updated_at', 'read_at']
 
 
 class ValidationHistorySerializer(serializers.ModelSerializer):
@@ -234,6 +319,18 @@ class CapaciteLaboratoireSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 
+class ReservationCapaciteSerializer(serializers.ModelSerializer):
+    """Serializer pour les réservations temporaires de capacité"""
+    
+    class Meta:
+        model = ReservationCapacite
+        fields = [
+            'id', 'type_essai', 'date', 'quantite', 'statut',
+            'expire_le', 'essais', 'created_by', 'created_at'
+        ]
+        read_only_fields = fields
+
+
 class DashboardStatsSerializer(serializers.Serializer):
     """Serializer pour les statistiques du dashboard"""
     
@@ -247,21 +344,90 @@ class DashboardStatsSerializer(serializers.Serializer):
     clients_actifs = serializers.IntegerField()
     delai_moyen_traitement = serializers.FloatField()
     taux_respect_delais = serializers.FloatField()
+    genere_le = serializers.DateTimeField()
+
+
+class FichierBlobField(serializers.Field):
+    """
+    Fichier stocké dans un Blob, échangé comme l'ancienne colonne base64
+
+    En écriture: base64, data URL ou URL; en lecture: la même forme
+    (null si aucun fichier).
+    """
+
+    def __init__(self, **kwargs):
+        self.allow_blank = kwargs.pop('allow_blank', False)
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str):
+            raise serializers.ValidationError('Chaîne base64, data URL ou URL attendue')
+        if not data:
+            if not self.allow_blank:
+                raise serializers.ValidationError('Ce champ ne peut être vide.')
+            return None
+        try:
+            return blobs.stocker(data)
+        except blobs.ContenuInvalide:
+            raise serializers.ValidationError('Contenu base64 invalide')
+
+    def to_representation(self, blob):
+        return blobs.representation(blob)
+
+
+class UrlBlobField(serializers.ReadOnlyField):
+    """
+    URL de téléchargement (en flux) du blob référencé par source (clé sha256)
+
+    L'URL est signée: utilisable directement dans un iframe ou un onglet.
+    """
+
+    def to_representation(self, sha256):
+        if not sha256:
+            return None
+        return url_telechargement(sha256, self.context.get('request'))
 
 
 class RapportMarketingSerializer(serializers.ModelSerializer):
     """Serializer pour les rapports marketing"""
     
+    file_data = FichierBlobField(source='fichier')
+    signed_report_data = FichierBlobField(source='rapport_signe', required=False, allow_null=True, allow_blank=True)
+    file_url = UrlBlobField(source='fichier_id')
+    signed_report_url = UrlBlobField(source='rapport_signe_id')
+    
     class Meta:
         model = RapportMarketing
         fields = [
             'id', 'echantillon', 'code_echantillon', 'client_name',
-            'file_name', 'file_data', 'signed_report_data',
+            'file_name', 'file_data', 'signed_report_data', 'file_url', 'signed_report_url',
             'avis_directeur_snertp', 'signature_directeur_snertp',
             'statut', 'email_client', 'date_envoi_marketing',
-            'date_envoi_client', 'created_at', 'updated_at'
+            'date_envoi_client', 'statut_envoi', 'tentatives_envoi', 'erreur_envoi',
+            'date_demande_envoi', 'created_at', 'updated_at'
+        ]
+        read_only_fields = [
+            'id', 'created_at', 'updated_at', 'date_envoi_marketing',
+            'statut_envoi', 'tentatives_envoi', 'erreur_envoi', 'date_demande_envoi'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at', 'date_envoi_marketing']
+
+
+class FichiersListeMixin(serializers.Serializer):
+    """
+    Version liste d'un serializer de rapport
+
+    Le contenu des fichiers n'est pas lu: file_data (et ses variantes) devient
+    l'URL signée de téléchargement, que l'interface ouvre comme avant, et
+    has_file / file_size décrivent le fichier. Les signatures sont remplacées
+    par has_signature; le détail de l'objet renvoie toujours les contenus.
+    """
+
+    has_file = serializers.SerializerMethodField()
+    file_size = serializers.IntegerField(source='fichier.taille', read_only=True)
+    has_signature = serializers.BooleanField(read_only=True)
+
+    def get_has_file(self, obj):
+        return obj.fichier_id is not None
 
 
 class WorkflowValidationSerializer(serializers.ModelSerializer):
@@ -269,10 +435,12 @@ class WorkflowValidationSerializer(serializers.ModelSerializer):
     
     etape_actuelle_display = serializers.CharField(source='get_etape_actuelle_display', read_only=True)
     statut_display = serializers.CharField(source='get_statut_display', read_only=True)
+    file_data = FichierBlobField(source='fichier')
+    file_url = UrlBlobField(source='fichier_id')
     
     class Meta:
         model = WorkflowValidation
-        fields = '__all__'
+        exclude = ['fichier']
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 
@@ -334,9 +502,14 @@ class DataStorageSerializer(serializers.ModelSerializer):
 
 
 class RapportValidationSerializer(serializers.ModelSerializer):
+    file_data = FichierBlobField(source='fichier')
+    original_file_data = FichierBlobField(source='fichier_original', required=False, allow_null=True, allow_blank=True)
+    file_url = UrlBlobField(source='fichier_id')
+    original_file_url = UrlBlobField(source='fichier_original_id')
+    
     class Meta:
         model = RapportValidation
-        fields = '__all__'
+        exclude = ['fichier', 'fichier_original']
 
 
 class EssaiDataSerializer(serializers.ModelSerializer):
@@ -352,19 +525,54 @@ class PlanificationDataSerializer(serializers.ModelSerializer):
 
 
 class WorkflowValidationSerializer(serializers.ModelSerializer):
+    file_data = FichierBlobField(source='fichier')
+    file_url = UrlBlobField(source='fichier_id')
+    
     class Meta:
         model = WorkflowValidation
-        fields = '__all__'
+        exclude = ['fichier']
 
 
 class RapportArchiveSerializer(serializers.ModelSerializer):
     envoye_par_nom = serializers.SerializerMethodField()
+    file_data = FichierBlobField(source='fichier')
+    file_url = UrlBlobField(source='fichier_id')
     
     class Meta:
         model = RapportArchive
-        fields = '__all__'
+        exclude = ['fichier']
     
     def get_envoye_par_nom(self, obj):
         if obj.envoye_par:
             return f"{obj.envoye_par.first_name} {obj.envoye_par.last_name}"
         return "-"
+
+
+class RapportMarketingListSerializer(FichiersListeMixin, RapportMarketingSerializer):
+    file_data = UrlBlobField(source='fichier_id')
+    signed_report_data = UrlBlobField(source='rapport_signe_id')
+
+    class Meta(RapportMarketingSerializer.Meta):
+        fields = [
+            champ for champ in RapportMarketingSerializer.Meta.fields if champ != 'signature_directeur_snertp'
+        ] + ['has_file', 'file_size', 'has_signature']
+
+
+class WorkflowValidationListSerializer(FichiersListeMixin, WorkflowValidationSerializer):
+    file_data = UrlBlobField(source='fichier_id')
+
+    class Meta(WorkflowValidationSerializer.Meta):
+        exclude = ['fichier', 'signature_directeur_snertp']
+
+
+class RapportValidationListSerializer(FichiersListeMixin, RapportValidationSerializer):
+    file_data = UrlBlobField(source='fichier_id')
+    original_file_data = UrlBlobField(source='fichier_original_id')
+
+    class Meta(RapportValidationSerializer.Meta):
+        exclude = ['fichier', 'fichier_original', 'signature_directeur_snertp']
+
+
+class RapportArchiveListSerializer(FichiersListeMixin, RapportArchiveSerializer):
+    file_data = UrlBlobField(source='fichier_id')
+    has_signature = None
@@ -0,0 +1,121 @@
+"""
+Signaux du module core
+Les suppressions des objets synchronisés laissent une trace (Suppression)
+pour que /api/sync/ puisse les propager aux clients; les références vers les
+blobs de fichiers sont comptées à l'enregistrement et à la suppression; une
+nouvelle photo est confiée à un worker pour être redressée et recompressée;
+les grandeurs géotechniques sont recalculées quand les résultats d'un essai
+changent
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .blobs import CHAMPS_BLOB, referencer
+from .models import Client, Echantillon, Essai, WorkflowValidation, Notification, Suppression
+
+
+# Nom de collection de /api/sync/ par modèle synchronisé
+MODELES_SYNCHRONISES = {
+    Echantillon: 'echantillons',
+    Essai: 'essais',
+    WorkflowValidation: 'workflows',
+    Notification: 'notifications',
+}
+
+
+@receiver(post_delete, sender=Echantillon)
+@receiver(post_delete, sender=Essai)
+@receiver(post_delete, sender=WorkflowValidation)
+@receiver(post_delete, sender=Notification)
+def tracer_suppression(sender, instance, **kwargs):
+    """Enregistre la suppression (y compris les suppressions en cascade)"""
+    Suppression.objects.create(
+        modele=MODELES_SYNCHRONISES[sender],
+        objet_id=instance.pk,
+        user_id=instance.user_id if sender is Notification else None
+    )
+
+
+def _blobs(instance):
+    """Blobs référencés par les champs chargés (les champs différés sont ignorés)"""
+    return {
+        champ: instance.__dict__[f'{champ}_id']
+        for champ in CHAMPS_BLOB[type(instance)]
+        if f'{champ}_id' in instance.__dict__
+    }
+
+
+def memoriser_blobs(sender, instance, **kwargs):
+    """Mémorise les blobs référencés au chargement, pour détecter les remplacements"""
+    instance._blobs_initiaux = _blobs(instance)
+
+
+def compter_references_blobs(sender, instance, created, **kwargs):
+    """Référence les nouveaux blobs et libère ceux qui ont été remplacés"""
+    apres = _blobs(instance)
+    for champ, nouveau in apres.items():
+        if created:
+            referencer([nouveau], 1)
+        elif champ in instance._blobs_initiaux and instance._blobs_initiaux[champ] != nouveau:
+            referencer([nouveau], 1)
+            referencer([instance._blobs_initiaux[champ]], -1)
+    instance._blobs_initiaux = apres
+
+
+def liberer_blobs(sender, instance, **kwargs):
+    referencer(_blobs(instance).values(), -1)
+
+
+for modele in CHAMPS_BLOB:
+    post_init.connect(memoriser_blobs, sender=modele)
+    post_save.connect(compter_references_blobs, sender=modele)
+    post_delete.connect(liberer_blobs, sender=modele)
+
+
+def _photo(instance):
+    """Nom de la photo chargée (None si le champ est différé)"""
+    if 'photo' not in instance.__dict__:
+        return None
+    photo = instance.__dict__['photo']
+    return getattr(photo, 'name', photo) or ''
+
+
+def memoriser_photo(sender, instance, **kwargs):
+    instance._photo_initiale = _photo(instance)
+
+
+def traiter_nouvelle_photo(sender, instance, created, **kwargs):
+    """Normalise la photo en arrière-plan quand elle vient d'être envoyée"""
+    from .tasks import normaliser_photo
+
+    photo = _photo(instance)
+    if photo and (created or photo != instance._photo_initiale):
+        modele, pk = sender._meta.label, str(instance.pk)
+        transaction.on_commit(lambda: normaliser_photo.delay(modele, pk))
+    instance._photo_initiale = photo
+
+
+for modele in (Echantillon, Client):
+    post_init.connect(memoriser_photo, sender=modele)
+    post_save.connect(traiter_nouvelle_photo, sender=modele)
+
+
+def memoriser_resultats(sender, instance, **kwargs):
+    """Résultats chargés (None si le champ est différé), pour ne recalculer qu'en cas de changement"""
+    instance._resultats_initiaux = instance.__dict__.get('resultats')
+
+
+def recalculer_resultats(sender, instance, created, **kwargs):
+    from .calculs_geotechniques import enregistrer
+
+    if 'resultats' not in instance.__dict__:
+        return
+    if created or instance.resultats != instance._resultats_initiaux:
+        enregistrer([(instance.pk, instance.type, instance.resultats)])
+    instance._resultats_initiaux = instance.resultats
+
+
+post_init.connect(memoriser_resultats, sender=Essai)
+post_save.connect(recalculer_resultats, sender=Essai)
@@ -0,0 +1,105 @@
+"""
+Statistiques globales du dashboard
+Les compteurs sont calculés en deux agrégats conditionnels et servis depuis un
+instantané rafraîchi périodiquement par Celery
+"""
+
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Echantillon, Essai, StatistiquesDashboard
+
+
+STATUTS_EN_COURS = ['stockage', 'essais', 'decodification', 'traitement', 'validation']
+
+# Délai au-delà duquel un échantillon validé est compté hors délai
+DELAI_MAX_JOURS = 30
+
+# Âge maximal d'un instantané avant recalcul à la demande
+DUREE_VALIDITE_STATS = timedelta(minutes=10)
+
+# Durée de vie de la copie en cache mémoire (secondes)
+DUREE_CACHE_STATS = 60
+
+CLE_CACHE_STATS = 'dashboard_stats:global'
+
+
+def calculer_stats_dashboard():
+    """Calcule les statistiques globales (une requête échantillons, une requête essais)"""
+    fini = Q(statut='valide', date_fin_estimee__isnull=False)
+
+    echantillons = Echantillon.objects.annotate(
+        delai=ExpressionWrapper(
+            F('date_fin_estimee') - TruncDate('created_at'), output_field=DurationField()
+        )
+    ).aggregate(
+        total=Count('id'),
+        en_cours=Count('id', filter=Q(statut__in=STATUTS_EN_COURS)),
+        termines=Count('id', filter=Q(statut='valide')),
+        urgents=Count('id', filter=Q(priorite='urgente')),
+        clients_actifs=Count(
+            'client', distinct=True,
+            filter=Q(created_at__gte=timezone.now() - timedelta(days=30))
+        ),
+        finis=Count('id', filter=fini),
+        respectes=Count('id', filter=fini & Q(delai__lte=timedelta(days=DELAI_MAX_JOURS))),
+        delai_moyen=Avg('delai', filter=fini),
+    )
+
+    essais = Essai.objects.aggregate(
+        en_attente=Count('id', filter=Q(statut='attente')),
+        en_cours=Count('id', filter=Q(statut='en_cours')),
+        termines=Count('id', filter=Q(statut='termine')),
+    )
+
+    delai_moyen = echantillons['delai_moyen']
+    finis = echantillons['finis']
+
+    return {
+        'total_echantillons': echantillons['total'],
+        'echantillons_en_cours': echantillons['en_cours'],
+        'echantillons_termines': echantillons['termines'],
+        'echantillons_urgents': echantillons['urgents'],
+        'essais_en_attente': essais['en_attente'],
+        'essais_en_cours': essais['en_cours'],
+        'essais_termines': essais['termines'],
+        'clients_actifs': echantillons['clients_actifs'],
+        'delai_moyen_traitement': round(delai_moyen.total_seconds() / 86400, 2) if delai_moyen else 0,
+        'taux_respect_delais': round(echantillons['respectes'] / finis * 100, 2) if finis else 0,
+    }
+
+
+def rafraichir_stats_dashboard():
+    """Recalcule et enregistre l'instantané; retourne les statistiques avec genere_le"""
+    genere_le = timezone.now()
+    donnees = calculer_stats_dashboard()
+    StatistiquesDashboard.objects.update_or_create(
+        cle='global', defaults={'donnees': donnees, 'genere_le': genere_le}
+    )
+    stats = {**donnees, 'genere_le': genere_le}
+    cache.set(CLE_CACHE_STATS, stats, DUREE_CACHE_STATS)
+    return stats
+
+
+def stats_dashboard():
+    """
+    Retourne le dernier instantané des statistiques
+
+    Lu depuis le cache mémoire, sinon depuis la table; recalculé seulement
+    s'il est absent ou plus vieux que DUREE_VALIDITE_STATS.
+    """
+    stats = cache.get(CLE_CACHE_STATS)
+    if stats is not None:
+        return stats
+
+    instantane = StatistiquesDashboard.objects.filter(cle='global').first()
+    if instantane is None or instantane.genere_le < timezone.now() - DUREE_VALIDITE_STATS:
+        return rafraichir_stats_dashboard()
+
+    stats = {**instantane.donnees, 'genere_le': instantane.genere_le}
+    cache.set(CLE_CACHE_STATS, stats, DUREE_CACHE_STATS)
+    return stats
@@ -0,0 +1,195 @@
+"""
+Synchronisation différentielle pour le front-end
+Un jeton opaque encode l'instant de la dernière synchronisation; seuls les
+objets modifiés (updated_at) ou supprimés (table des suppressions) depuis cet
+instant sont renvoyés. Les lots successifs d'une même synchronisation
+reprennent après la dernière ligne envoyée (curseur updated_at, pk)
+"""
+
+import base64
+import binascii
+import json
+from datetime import timedelta
+
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Echantillon, Essai, WorkflowValidation, Notification, Suppression
+from .serializers import (
+    EchantillonSyncSerializer, EssaiSerializer, WorkflowValidationListSerializer, NotificationSerializer
+)
+
+
+# Nombre maximal d'objets par collection et par appel
+LIMITE_SYNC = 500
+
+# Recouvrement entre deux synchronisations: couvre les transactions encore
+# en cours au moment de l'appel (les objets renvoyés deux fois sont idempotents)
+MARGE_SYNC = timedelta(seconds=5)
+
+# Durée de conservation des suppressions; au-delà, le client repart de zéro
+RETENTION_SUPPRESSIONS = timedelta(days=30)
+
+
+class JetonInvalide(Exception):
+    """Levée quand le jeton de synchronisation ne peut pas être décodé"""
+
+
+def encoder_jeton(depuis, complet=False, origine=None, curseurs=None):
+    """
+    Jeton opaque d'une synchronisation
+
+    Args:
+        depuis: Instant de référence des changements (None: état complet)
+        complet: La synchronisation en cours renvoie l'état complet
+        origine: Début de la synchronisation en cours (lots successifs): le
+                 jeton final repart de cet instant
+        curseurs: {collection: [updated_at, pk] de la dernière ligne envoyée,
+                   ou None si la collection est terminée}
+    """
+    etat = {
+        'depuis': depuis.isoformat() if depuis else None,
+        'complet': complet,
+        'origine': origine.isoformat() if origine else None,
+        'curseurs': {
+            cle: [curseur[0].isoformat(), curseur[1]] if curseur else None
+            for cle, curseur in (curseurs or {}).items()
+        },
+    }
+    return base64.urlsafe_b64encode(json.dumps(etat, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def _instant(valeur):
+    instant = parse_datetime(valeur)
+    if instant is None:
+        raise ValueError(valeur)
+    return instant
+
+
+def decoder_jeton(jeton):
+    """État {depuis, complet, origine, curseurs} d'un jeton"""
+    try:
+        contenu = base64.urlsafe_b64decode(jeton + '=' * (-len(jeton) % 4)).decode()
+        if not contenu.startswith('{'):
+            # Jetons antérieurs: un simple instant
+            return {'depuis': _instant(contenu), 'complet': False, 'origine': None, 'curseurs': {}}
+        etat = json.loads(contenu)
+        if not etat['complet'] and not etat['depuis']:
+            raise ValueError(contenu)
+        return {
+            'depuis': _instant(etat['depuis']) if etat['depuis'] else None,
+            'complet': bool(etat['complet']),
+            'origine': _instant(etat['origine']) if etat['origine'] else None,
+            'curseurs': {
+                cle: [_instant(curseur[0]), str(curseur[1])] if curseur else None
+                for cle, curseur in etat['curseurs'].items()
+            },
+        }
+    except (ValueError, TypeError, KeyError, IndexError, AttributeError, UnicodeDecodeError, binascii.Error):
+        raise JetonInvalide(jeton)
+
+
+def _collections(user):
+    """
+    (nom, queryset, serializer) des collections synchronisées pour un utilisateur
+
+    Les workflows sont sérialisés comme dans les listes: lien de
+    téléchargement du PDF et has_signature, sans contenu de fichier.
+    """
+    workflows = WorkflowValidation.objects.select_related('fichier').defer('signature_directeur_snertp').annotate(
+        has_signature=ExpressionWrapper(~Q(signature_directeur_snertp=''), output_field=BooleanField())
+    )
+    return [
+        ('echantillons', Echantillon.objects.select_related('client'), EchantillonSyncSerializer),
+        ('essais', Essai.objects.select_related('echantillon'), EssaiSerializer),
+        ('workflows', workflows, WorkflowValidationListSerializer),
+        ('notifications', Notification.objects.select_related('echantillon', 'essai').filter(user=user), NotificationSerializer),
+    ]
+
+
+def _par_lot(queryset, champ, curseur):
+    """
+    Lit au plus LIMITE_SYNC lignes triées sur (champ, pk), après le curseur
+
+    Returns:
+        (lignes, curseur): curseur [instant, pk] de la dernière ligne si le
+        lot est tronqué, sinon None
+    """
+    if curseur:
+        instant, pk = curseur
+        queryset = queryset.filter(Q(**{f'{champ}__gt': instant}) | Q(**{champ: instant, 'pk__gt': pk}))
+    lignes = list(queryset.order_by(champ, 'pk')[:LIMITE_SYNC + 1])
+    if len(lignes) <= LIMITE_SYNC:
+        return lignes, None
+
+    lignes = lignes[:LIMITE_SYNC]
+    derniere = lignes[-1]
+    return lignes, [getattr(derniere, champ), str(derniere.pk)]
+
+
+def changements(user, jeton=None, request=None):
+    """
+    Objets créés, modifiés ou supprimés depuis le jeton
+
+    Sans jeton (ou avec un jeton plus ancien que la rétention des
+    suppressions), renvoie l'état complet avec complet=True: le client doit
+    alors remplacer ses données locales. La rétention est comparée au début de
+    la synchronisation, pas aux lots intermédiaires.
+
+    Args:
+        request: Requête en cours, pour des liens de téléchargement absolus
+
+    Returns:
+        Dict {jeton, complet, a_suivre, <collection>: {modifies, supprimes}}.
+        Si a_suivre, le client rappelle immédiatement avec le nouveau jeton.
+    """
+    debut = timezone.now()
+    etat = decoder_jeton(jeton) if jeton else {'depuis': None, 'complet': True, 'origine': None, 'curseurs': {}}
+    depuis, complet, curseurs = etat['depuis'], etat['complet'], etat['curseurs']
+    if not complet and depuis < debut - RETENTION_SUPPRESSIONS:
+        # Suppressions purgées depuis: on repart de zéro
+        depuis, complet, curseurs = None, True, {}
+    if not curseurs:
+        # Début d'une synchronisation (premier lot)
+        origine = debut - MARGE_SYNC
+    else:
+        origine = etat['origine'] or debut - MARGE_SYNC
+
+    resultat = {'complet': complet}
+    suivants = {}
+    for nom, queryset, serializer_class in _collections(user):
+        objets, supprimes = [], []
+        if curseurs.get(nom, True) is not None:
+            if not complet:
+                queryset = queryset.filter(updated_at__gt=depuis)
+            objets, suivants[nom] = _par_lot(queryset, 'updated_at', curseurs.get(nom))
+
+        cle = f'{nom}:supprimes'
+        if not complet and curseurs.get(cle, True) is not None:
+            suppressions = Suppression.objects.filter(modele=nom, supprime_le__gt=depuis)
+            if nom == 'notifications':
+                suppressions = suppressions.filter(user_id=user.pk)
+            suppressions, suivants[cle] = _par_lot(suppressions, 'supprime_le', curseurs.get(cle))
+            supprimes = [str(suppression.objet_id) for suppression in suppressions]
+
+        resultat[nom] = {
+            'modifies': serializer_class(objets, many=True, context={'request': request}).data,
+            'supprimes': supprimes,
+        }
+
+    # Les collections terminées le restent jusqu'à la fin de la synchronisation
+    curseurs = {**curseurs, **suivants}
+    resultat['a_suivre'] = any(curseur is not None for curseur in curseurs.values())
+    if resultat['a_suivre']:
+        resultat['jeton'] = encoder_jeton(depuis, complet, origine, curseurs)
+    else:
+        # Synchronisation terminée: la suivante reprend à son début (recouvrement idempotent)
+        resultat['jeton'] = encoder_jeton(origine)
+    return resultat
+
+
+def purger_suppressions():
+    """Supprime les traces plus anciennes que la rétention; retourne le nombre purgé"""
+    limite = timezone.now() - RETENTION_SUPPRESSIONS
+    return Suppression.objects.filter(supprime_le__lt=limite).delete()[0]
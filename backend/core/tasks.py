@@ -0,0 +1,175 @@
+"""
+Tâches Celery pour le module core
+"""
+
+from celery import shared_task
+from django.utils import timezone
+from datetime import timedelta
+
+from .blobs import recompter_references, purger_orphelins
+from .envoi_rapports import DELAI_NOUVELLE_TENTATIVE, TENTATIVES_MAX, envoyer_lot, relancer_envois_bloques
+from .reservations import liberer_reservations_expirees, resynchroniser_creneaux
+from .statistiques import rafraichir_stats_dashboard
+from .synchronisation import purger_suppressions
+
+
+@shared_task
+def liberer_reservations_capacite_expirees():
+    """
+    Tâche périodique pour rendre au calendrier les réservations expirées
+    """
+    nombre = liberer_reservations_expirees()
+    return f"{nombre} réservations expirées libérées"
+
+
+@shared_task
+def resynchroniser_creneaux_capacite():
+    """
+    Tâche quotidienne pour recaler les créneaux d'occupation sur les essais
+    """
+    today = timezone.now().date()
+    nombre = resynchroniser_creneaux(today - timedelta(days=30), today + timedelta(days=180))
+    return f"{nombre} créneaux corrigés"
+
+
+@shared_task
+def rafraichir_statistiques_dashboard():
+    """
+    Tâche périodique pour recalculer l'instantané des statistiques du dashboard
+    """
+    stats = rafraichir_stats_dashboard()
+    return f"Statistiques recalculées ({stats['total_echantillons']} échantillons)"
+
+
+@shared_task
+def purger_suppressions_synchronisation():
+    """
+    Tâche quotidienne pour supprimer les traces de suppression expirées
+    """
+    nombre = purger_suppressions()
+    return f"{nombre} traces de suppression purgées"
+
+
+@shared_task
+def nettoyer_blobs():
+    """
+    Tâche quotidienne pour recaler les compteurs de références des fichiers
+    et supprimer les fichiers qui ne sont plus référencés
+    """
+    corriges = recompter_references()
+    supprimes = purger_orphelins()
+    return f"{corriges} compteurs corrigés, {supprimes} fichiers supprimés"
+
+
+@shared_task(bind=True, max_retries=TENTATIVES_MAX - 1)
+def envoyer_rapports_clients(self, ids):
+    """
+    Tâche d'envoi d'un lot de rapports aux clients
+
+    Les envois en échec sont réessayés avec un délai qui double à chaque
+    tentative; seuls les rapports restés en file sont rejoués.
+    """
+    envoyes, a_reessayer = envoyer_lot(ids)
+    if a_reessayer:
+        raise self.retry(args=[a_reessayer], countdown=DELAI_NOUVELLE_TENTATIVE * 2 ** self.request.retries)
+    return f"{envoyes} rapports envoyés"
+
+
+@shared_task
+def relancer_envois_rapports():
+    """
+    Tâche périodique pour reprendre les envois de rapports restés sans tâche
+    """
+    relances, interrompus = relancer_envois_bloques()
+    return f"{relances} envois relancés, {interrompus} envois interrompus"
+
+
+@shared_task
+def generer_rapport_pdf(echantillon_id, signature=None):
+    """
+    Tâche de rendu du rapport PDF d'un échantillon (signé si une signature est fournie)
+    """
+    from .rendu_rapports import generer
+    blob = generer(echantillon_id, signature)
+    return {'sha256': blob.sha256, 'taille': blob.taille}
+
+
+@shared_task
+def signer_rapport_workflow(workflow_id, signature):
+    """
+    Tâche de surimpression de la signature sur le PDF d'un workflow
+    """
+    from .blobs import referencer
+    from .models import WorkflowValidation
+    from .rendu_rapports import signer_pdf
+    workflow = WorkflowValidation.objects.select_related('fichier', 'echantillon').get(pk=workflow_id)
+    rendu = signer_pdf(workflow.fichier, signature, workflow.echantillon)
+    # Seules ces colonnes sont écrites (les modifications faites pendant le
+    # rendu sont conservées), et seulement si le fichier signé est encore
+    # celui du workflow
+    modifies = WorkflowValidation.objects.filter(pk=workflow_id, fichier_id=workflow.fichier_id).update(
+        fichier=rendu.fichier, signature_directeur_snertp=signature, updated_at=timezone.now()
+    )
+    if not modifies:
+        return {'error': 'Fichier du workflow remplacé pendant la signature'}
+    # update() ne passe pas par les signaux de comptage des références
+    if rendu.fichier_id != workflow.fichier_id:
+        referencer([rendu.fichier_id], 1)
+        referencer([workflow.fichier_id], -1)
+    return {'sha256': rendu.fichier_id, 'taille': rendu.fichier.taille}
+
+
+@shared_task
+def generer_etiquettes(ids):
+    """
+    Tâche de production de la planche d'étiquettes d'un lot d'échantillons
+    """
+    from .etiquettes import generer_planche
+    blob = generer_planche(ids)
+    return {'sha256': blob.sha256, 'taille': blob.taille}
+
+
+@shared_task
+def normaliser_photo(modele, pk):
+    """
+    Tâche de redressement (orientation EXIF) et de recompression d'une photo
+    """
+    from .photos import PhotoInvalide, normaliser
+    try:
+        nouveau = normaliser(modele, pk)
+    except (PhotoInvalide, FileNotFoundError) as e:
+        return f"Photo ignorée: {e}"
+    return f"Photo normalisée: {nouveau}" if nouveau else "Photo inchangée"
+
+
+@shared_task(bind=True)
+def importer_fichiers_essais(self, essai_ids):
+    """
+    Tâche de lecture des fichiers de mesures déposés (progression: PROGRESS, traites/total)
+    """
+    from .calculs_geotechniques import recalculer
+    from .import_essais import importer
+    from .models import Essai
+    rapports = []
+    for traites, essai_id in enumerate(essai_ids, start=1):
+        rapports.append(importer(essai_id))
+        self.update_state(state='PROGRESS', meta={'traites': traites, 'total': len(essai_ids)})
+    recalculer(Essai.objects.filter(pk__in=essai_ids))
+    return {
+        'importes': sum(1 for rapport in rapports if rapport['statut'] == 'importe'),
+        'fichiers': rapports,
+    }
+
+
+@shared_task
+def recalculer_resultats_essais(tous=False, type_essai=None):
+    """
+    Tâche de recalcul des grandeurs géotechniques (par défaut: essais calculés
+    avec une version antérieure des formules ou jamais calculés)
+    """
+    from .calculs_geotechniques import a_recalculer, recalculer
+    from .models import Essai
+    essais = Essai.objects.all() if tous else a_recalculer()
+    if type_essai:
+        essais = essais.filter(type=type_essai)
+    return f"{recalculer(essais)} résultats calculés"
@@ -0,0 +1,228 @@
+"""
+Téléchargement des fichiers de rapports
+Le fichier est lu par morceaux depuis le stockage (jamais chargé en entier en
+mémoire), avec prise en charge des requêtes conditionnelles (ETag = empreinte
+SHA-256 du contenu) et des requêtes partielles (Range). Les listes ne
+renvoient que des liens de téléchargement
+"""
+
+import re
+
+from django.conf import settings
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.urls import reverse
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import (
+    content_disposition_header, http_date, parse_etags, parse_http_date_safe, quote_etag,
+    url_has_allowed_host_and_scheme,
+)
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from .blobs import TYPE_URL, jeton_telechargement, lire
+
+
+TAILLE_MORCEAU = 64 * 1024
+
+re_range = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def url_telechargement(sha256, request=None):
+    """URL signée de /api/blobs/<sha256>/, utilisable sans en-tête Authorization"""
+    url = f"{reverse('blob-detail', args=[sha256])}?jeton={jeton_telechargement(sha256)}"
+    return request.build_absolute_uri(url) if request else url
+
+
+def lien_autorise(url, request):
+    """
+    Lien externe vers lequel on peut rediriger: chemin relatif, même origine
+    que l'API ou domaine de DOMAINES_FICHIERS_EXTERNES
+    """
+    return url_has_allowed_host_and_scheme(
+        url,
+        allowed_hosts={request.get_host(), *settings.DOMAINES_FICHIERS_EXTERNES},
+        require_https=request.is_secure(),
+    )
+
+
+def _intervalle(entete, taille):
+    """
+    Interprète un en-tête Range à un seul intervalle
+
+    Returns:
+        (debut, fin) inclusifs, None si l'en-tête est absent ou non géré
+        (réponse complète), ou False s'il n'est pas satisfiable (416)
+    """
+    correspondance = re_range.match(entete.replace(' ', ''))
+    if not correspondance or correspondance.groups() == ('', ''):
+        return None
+
+    debut, fin = correspondance.groups()
+    if not debut:
+        # bytes=-N: les N derniers octets
+        longueur = int(fin)
+        if longueur == 0:
+            return False
+        return max(taille - longueur, 0), taille - 1
+
+    debut = int(debut)
+    fin = min(int(fin), taille - 1) if fin else taille - 1
+    if debut >= taille or debut > fin:
+        return False
+    return debut, fin
+
+
+def _morceaux(fichier, debut, longueur):
+    """Itère sur longueur octets du fichier à partir de debut, puis le ferme"""
+    try:
+        fichier.seek(debut)
+        while longueur > 0:
+            morceau = fichier.read(min(TAILLE_MORCEAU, longueur))
+            if not morceau:
+                break
+            longueur -= len(morceau)
+            yield morceau
+    finally:
+        fichier.close()
+
+
+def _range_applicable(request, etag, last_modified):
+    """If-Range: l'intervalle ne s'applique que si la version du client est la bonne"""
+    condition = request.META.get('HTTP_IF_RANGE')
+    if not condition:
+        return True
+    if condition.startswith(('"', 'W/')):
+        return etag in parse_etags(condition)
+    date = parse_http_date_safe(condition)
+    return date is not None and date == last_modified
+
+
+def reponse_fichier(request, blob, nom=None, attachment=False, immuable=False):
+    """
+    Réponse de téléchargement d'un blob
+
+    Args:
+        nom: Nom du fichier proposé au navigateur (défaut: empreinte)
+        attachment: Forcer le téléchargement plutôt que l'affichage
+        immuable: L'URL désigne toujours ce contenu (URL par empreinte): la
+                  réponse est gardée en cache sans revalidation. Sinon (URL
+                  d'un rapport dont le fichier peut être remplacé) le
+                  navigateur revalide par If-None-Match.
+    """
+    etag = quote_etag(blob.sha256)
+    last_modified = int(blob.created_at.timestamp())
+    nom = nom or blob.sha256
+
+    reponse = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if reponse is None:
+        intervalle = None
+        entete = request.META.get('HTTP_RANGE')
+        if entete and request.method in ('GET', 'HEAD') and _range_applicable(request, etag, last_modified):
+            intervalle = _intervalle(entete, blob.taille)
+
+        if intervalle is False:
+            reponse = HttpResponse(status=416)
+            reponse['Content-Range'] = f'bytes */{blob.taille}'
+        elif intervalle is not None:
+            debut, fin = intervalle
+            reponse = StreamingHttpResponse(
+                _morceaux(blob.fichier.open('rb'), debut, fin - debut + 1),
+                status=206,
+                content_type=blob.type_mime or 'application/octet-stream',
+            )
+            reponse['Content-Range'] = f'bytes {debut}-{fin}/{blob.taille}'
+            reponse['Content-Length'] = str(fin - debut + 1)
+            reponse['Content-Disposition'] = content_disposition_header(attachment, nom)
+        else:
+            reponse = FileResponse(
+                blob.fichier.open('rb'),
+                content_type=blob.type_mime or 'application/octet-stream',
+                as_attachment=attachment,
+                filename=nom,
+            )
+            reponse.block_size = TAILLE_MORCEAU
+
+    reponse['Accept-Ranges'] = 'bytes'
+    reponse['ETag'] = etag
+    reponse['Last-Modified'] = http_date(last_modified)
+    if immuable:
+        patch_cache_control(reponse, private=True, max_age=31536000, immutable=True)
+    else:
+        patch_cache_control(reponse, private=True, no_cache=True)
+    return reponse
+
+
+class TelechargementMixin:
+    """
+    Ajoute GET <objet>/telecharger/?version=... à un ViewSet
+
+    fichiers_telechargeables associe chaque version au champ Blob et au champ
+    portant le nom du fichier; la version '' est celle par défaut.
+    """
+
+    fichiers_telechargeables = {'': ('fichier', 'file_name')}
+
+    @action(detail=True, methods=['get'])
+    def telecharger(self, request, pk=None):
+        """Télécharge le fichier du rapport en flux (?version=, ?attachment=1)"""
+        version = request.query_params.get('version', '')
+        if version not in self.fichiers_telechargeables:
+            return Response(
+                {'error': 'Version de fichier inconnue'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        champ, champ_nom = self.fichiers_telechargeables[version]
+        objet = self.get_object()
+        blob = getattr(objet, champ)
+        if blob is None:
+            return Response(
+                {'error': 'Aucun fichier'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        if blob.type_mime == TYPE_URL:
+            # Rapport stocké sous forme de lien externe: redirection seulement
+            # vers un domaine connu, sinon le lien est renvoyé sans être suivi
+            url = lire(blob).decode()
+            if lien_autorise(url, request):
+                return HttpResponseRedirect(url)
+            return Response({'url': url})
+
+        return reponse_fichier(
+            request, blob,
+            nom=getattr(objet, champ_nom) or None,
+            attachment=request.query_params.get('attachment') in ('1', 'true'),
+        )
+
+
+class ListeAlegeeMixin:
+    """
+    Listes de rapports sans contenu de fichier ni signature
+
+    Pour les actions de actions_liste, le serializer de liste renvoie des liens
+    de téléchargement et la colonne de signature n'est pas lue (has_signature
+    est calculé en SQL). Les autres actions (détail, mises à jour) sont
+    inchangées.
+    """
+
+    actions_liste = ('list',)
+    serializer_liste_class = None
+    champ_signature = 'signature_directeur_snertp'
+
+    def en_liste(self):
+        return self.action in self.actions_liste
+
+    def get_serializer_class(self):
+        if self.en_liste():
+            return self.serializer_liste_class
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.en_liste() and self.champ_signature:
+            queryset = queryset.defer(self.champ_signature).annotate(has_signature=ExpressionWrapper(
+                ~Q(**{self.champ_signature: ''}), output_field=BooleanField()
+            ))
+        return queryset
@@ -0,0 +1,946 @@
+"""
+Tests du module core
+
+python manage.py test --settings=config.settings_test
+"""
+
+import base64
+import gzip
+import io
+import json
+import uuid
+import zipfile
+from decimal import Decimal
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from datetime import date, timedelta
+from unittest import mock
+
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import blobs, calculs_geotechniques, envoi_rapports, middleware_compression, photos, prevision, renderers, rendu_rapports, reservations, synchronisation, tasks, telechargement
+from .models import (
+    CapaciteLaboratoire, Client, CreneauCapacite, Echantillon, Essai, PlanificationEssai, RapportArchive,
+    RapportMarketing, RapportValidation, ReservationCapacite, ResultatCalcule, TacheProgrammee, User,
+    WorkflowValidation
+)
+
+
+@receiver(connection_created)
+def json_contains_sqlite(sender, connection, **kwargs):
+    """
+    Équivalent de jsonb @> pour les tests sous SQLite (lookup
+    essais_types__contains des dashboards de section), limité aux listes
+    """
+    if connection.vendor != 'sqlite':
+        return
+    connection.features.supports_json_field_contains = True
+    connection.connection.create_function(
+        'JSON_CONTAINS', 2,
+        lambda valeur, cherche: valeur is not None and all(x in json.loads(valeur) for x in json.loads(cherche))
+    )
+
+
+# Résultats saisis à la main par l'interface, sans tableau de mesures
+SAISIES_PAR_TYPE = {
+    'AG': {'pourcent_inf_2mm': 60, 'pourcent_inf_80um': '12,5', 'coefficient_uniformite': 8},
+    'Proctor': {'teneur_eau_opt': 11.2, 'densite_opt': 1.95},
+    'CBR': {'cbr_95': 35, 'gonflement': 0.4},
+    'Oedometre': {'cc': 0.3, 'cs': 0.05, 'gp': 120},
+    'Cisaillement': {'cohesion': 20, 'phi': 30},
+}
+
+
+class CalculsSaisiesTests(TestCase):
+    """Les essais dont les résultats sont saisis (sans mesures) gardent leurs valeurs"""
+
+    def test_calcul_par_type(self):
+        for type_essai, saisies in SAISIES_PAR_TYPE.items():
+            with self.subTest(type=type_essai):
+                lignes = calculs_geotechniques.calculer([(1, type_essai, saisies)])
+                self.assertEqual(len(lignes), 1)
+                ligne = lignes[0]
+                self.assertEqual(ligne.source, 'saisie')
+                for champ, cle in calculs_geotechniques.SAISIES[type_essai].items():
+                    self.assertAlmostEqual(getattr(ligne, champ), calculs_geotechniques._nombre(saisies[cle]))
+
+    def test_lot_mixte(self):
+        """Un lot où aucun essai n'a deux points de mesure (matrices d'une colonne)"""
+        essais = [(rang, type_essai, saisies) for rang, (type_essai, saisies) in enumerate(SAISIES_PAR_TYPE.items())]
+        essais += [(10, 'Oedometre', {'mesures': [{'contrainte': 10, 'e': 0.9}]}), (11, 'CBR', None)]
+        lignes = calculs_geotechniques.calculer(essais)
+        self.assertEqual(sorted(ligne.essai_id for ligne in lignes), list(range(len(SAISIES_PAR_TYPE))))
+
+    def test_enregistrement_a_la_sauvegarde(self):
+        user = User.objects.create_user(username='operateur', password='x', role='operateur_route')
+        client = Client.objects.create(
+            nom='ACME', projet='Route', contact='Contact', telephone='000', email='acme@snertp.bj', created_by=user
+        )
+        echantillon = Echantillon.objects.create(
+            client=client, nature=Echantillon.NATURE_CHOICES[0][0], profondeur_debut=0, profondeur_fin=1,
+            sondage=Echantillon.SONDAGE_CHOICES[0][0], essais_types=list(SAISIES_PAR_TYPE)
+        )
+        for type_essai, saisies in SAISIES_PAR_TYPE.items():
+            with self.subTest(type=type_essai):
+                essai = Essai.objects.create(echantillon=echantillon, type=type_essai, duree_estimee=5)
+                essai.resultats = saisies
+                essai.save()
+                resultat = ResultatCalcule.objects.get(essai=essai)
+                self.assertEqual(resultat.source, 'saisie')
+
+
+class DonneesMixin:
+    """Utilisateur authentifié, client et échantillons avec leurs essais"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='responsable', password='x', email='responsable@snertp.bj', role='responsable_materiaux'
+        )
+        self.client_labo = Client.objects.create(
+            nom='ACME', projet='Route', contact='Contact', telephone='000', email='acme@snertp.bj',
+            created_by=self.user
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def creer_echantillons(self, nombre, types=('AG', 'CBR', 'Oedometre')):
+        echantillons = []
+        for rang in range(nombre):
+            echantillon = Echantillon.objects.create(
+                client=self.client_labo, nature=Echantillon.NATURE_CHOICES[0][0],
+                profondeur_debut=0, profondeur_fin=1, sondage=Echantillon.SONDAGE_CHOICES[0][0],
+                essais_types=list(types)
+            )
+            for type_essai in types:
+                Essai.objects.create(
+                    echantillon=echantillon, type=type_essai, duree_estimee=5,
+                    priorite='urgente' if rang % 3 == 0 else 'normale'
+                )
+            echantillons.append(echantillon)
+        return echantillons
+
+
+class BudgetRequetesTests(DonneesMixin, TestCase):
+    """Le nombre de requêtes des listes ne dépend pas du nombre d'échantillons"""
+
+    def verifier_budget(self, url, budget):
+        for nombre in (3, 12):
+            with self.subTest(url=url, echantillons=nombre):
+                Echantillon.objects.all().delete()
+                self.creer_echantillons(nombre)
+                Essai.objects.update(date_reception='2026-01-05')
+                with self.assertNumQueries(budget):
+                    response = self.api.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_dashboard_route(self):
+        self.verifier_budget('/api/echantillons/dashboard_route/', 2)
+
+    def test_dashboard_meca(self):
+        self.verifier_budget('/api/echantillons/dashboard_meca/', 2)
+
+    def test_dashboard_route_pagine(self):
+        self.verifier_budget('/api/echantillons/dashboard_route/?page=1&page_size=5', 3)
+
+    def test_essais_route_envoyes(self):
+        self.verifier_budget('/api/echantillons/with_essais_route_envoyes/', 2)
+
+    def test_liste_projetee(self):
+        self.verifier_budget('/api/echantillons/?fields=id,code,statut,essais&page_size=5', 4)
+
+    def test_dashboard_prioritaires_en_tete(self):
+        self.creer_echantillons(4)
+        lignes = self.api.get('/api/echantillons/dashboard_route/').json()
+        self.assertEqual([ligne['prioritaire'] for ligne in lignes], [True, True, False, False])
+        self.assertEqual(len(lignes[0]['essais']), 3)
+
+
+class ParametresInvalidesTests(DonneesMixin, TestCase):
+    """Les paramètres bien formés mais impossibles donnent 400, pas 500"""
+
+    def test_since_impossible(self):
+        response = self.api.get('/api/echantillons/with_essais_route_envoyes/?since=2026-13-01T00:00')
+        self.assertEqual(response.status_code, 400)
+
+    def test_client_analyses(self):
+        response = self.api.get('/api/resultats-calcules/analyses/?metrique=indice_cbr&client=abc')
+        self.assertEqual(response.status_code, 400)
+
+    def test_etiquettes(self):
+        corps = (
+            {'ids': 12},
+            {'ids': 'abc'},
+            {'ids': ['pas-un-uuid']},
+            {'client': str(self.client_labo.pk), 'date_reception': '2026-13-01'},
+        )
+        for donnees in corps:
+            with self.subTest(donnees=donnees):
+                response = self.api.post('/api/echantillons/etiquettes/', donnees, format='json')
+                self.assertEqual(response.status_code, 400)
+
+        echantillon, = self.creer_echantillons(1, types=('AG',))
+        response = self.api.post('/api/echantillons/etiquettes/', {'ids': [str(echantillon.pk)]}, format='json')
+        self.assertEqual(response.status_code, 202)
+
+
+class ConditionnelTests(DonneesMixin, TestCase):
+    """Les ETags des listes d'échantillons suivent les essais imbriqués"""
+
+    def test_modification_essai(self):
+        self.creer_echantillons(2)
+        for url in ('/api/echantillons/', '/api/echantillons/by_statut/'):
+            with self.subTest(url=url):
+                etag = self.api.get(url)['ETag']
+                self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+                essai = Essai.objects.first()
+                essai.statut = 'en_cours'
+                essai.save()
+                response = self.api.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_suppression_essai(self):
+        self.creer_echantillons(2)
+        etag = self.api.get('/api/echantillons/')['ETag']
+        Essai.objects.filter(pk=Essai.objects.first().pk).delete()
+        self.assertEqual(self.api.get('/api/echantillons/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class SynchronisationTests(DonneesMixin, TestCase):
+    """Synchronisation complète par lots puis différentielle"""
+
+    def synchroniser(self, jeton=None):
+        lots = []
+        while True:
+            reponse = synchronisation.changements(self.user, jeton)
+            lots.append(reponse)
+            jeton = reponse['jeton']
+            if not reponse['a_suivre']:
+                return lots, jeton
+            self.assertLess(len(lots), 20, 'La synchronisation ne se termine pas')
+
+    @mock.patch.object(synchronisation, 'LIMITE_SYNC', 4)
+    def test_complete_par_lots_anciens(self):
+        self.creer_echantillons(10, types=('AG',))
+        # Lignes plus anciennes que la rétention des suppressions, plusieurs au même instant
+        ancien = timezone.now() - timedelta(days=60)
+        Echantillon.objects.update(updated_at=ancien)
+        Essai.objects.update(updated_at=ancien)
+
+        lots, jeton = self.synchroniser()
+        self.assertTrue(all(lot['complet'] for lot in lots))
+        recus = [objet['id'] for lot in lots for objet in lot['echantillons']['modifies']]
+        self.assertEqual(len(recus), 10)
+        self.assertEqual(len(set(recus)), 10)
+
+        lots, _ = self.synchroniser(jeton)
+        self.assertEqual(len(lots), 1)
+        self.assertFalse(lots[0]['complet'])
+        self.assertEqual(lots[0]['echantillons']['modifies'], [])
+
+    @mock.patch.object(synchronisation, 'LIMITE_SYNC', 4)
+    def test_differentielle(self):
+        echantillons = self.creer_echantillons(3)
+        _, jeton = self.synchroniser()
+        supprime = str(echantillons[0].pk)
+        echantillons[0].delete()
+        for essai in Essai.objects.all()[:6]:
+            essai.save()
+
+        lots, _ = self.synchroniser(jeton)
+        self.assertFalse(lots[0]['complet'])
+        essais = {objet['id'] for lot in lots for objet in lot['essais']['modifies']}
+        self.assertEqual(len(essais), 6)
+        supprimes = {identifiant for lot in lots for identifiant in lot['echantillons']['supprimes']}
+        self.assertEqual(supprimes, {supprime})
+        self.assertEqual(len({identifiant for lot in lots for identifiant in lot['essais']['supprimes']}), 3)
+
+    def test_workflows_sans_contenu(self):
+        echantillon, = self.creer_echantillons(1, types=())
+        WorkflowValidation.objects.create(
+            echantillon=echantillon, code_echantillon=echantillon.code, client_name='ACME', file_name='rapport.pdf',
+            fichier=blobs.stocker_octets(b'%PDF-1.4 rapport', 'application/pdf'), etape_actuelle='traitement',
+            signature_directeur_snertp='data:image/png;base64,iVBORw0KGgo='
+        )
+        workflow, = self.api.get('/api/sync/').json()['workflows']['modifies']
+        self.assertTrue(workflow['has_file'])
+        self.assertTrue(workflow['has_signature'])
+        self.assertTrue(workflow['file_data'].startswith('http://testserver/api/blobs/'))
+        self.assertNotIn('signature_directeur_snertp', workflow)
+
+    def test_jeton_expire(self):
+        _, jeton = self.synchroniser()
+        ancien = synchronisation.encoder_jeton(timezone.now() - timedelta(days=40))
+        self.assertTrue(synchronisation.changements(self.user, ancien)['complet'])
+        self.assertFalse(synchronisation.changements(self.user, jeton)['complet'])
+
+    def test_jeton_invalide(self):
+        for jeton in ('xyz', synchronisation.encoder_jeton(None), 'eyJkZXB1aXMiOm51bGx9'):
+            with self.subTest(jeton=jeton), self.assertRaises(synchronisation.JetonInvalide):
+                synchronisation.changements(self.user, jeton)
+
+
+class DecodageBlobsTests(TestCase):
+    """Distinction entre URL, data URL et base64 brut"""
+
+    def test_base64_commencant_par_une_barre(self):
+        jpeg = b'\xff\xd8\xff\xe0\x00\x10JFIF'
+        contenu = base64.b64encode(jpeg).decode()
+        self.assertTrue(contenu.startswith('/9j/'))
+        self.assertEqual(blobs.decoder(contenu), (jpeg, ''))
+
+    def test_urls(self):
+        for url in ('https://exemple.bj/rapport.pdf', '/api/blobs/abc/', '/media/blobs/ab/abc'):
+            with self.subTest(url=url):
+                self.assertEqual(blobs.decoder(url), (url.encode(), blobs.TYPE_URL))
+
+    def test_data_url(self):
+        self.assertEqual(blobs.decoder('data:application/pdf;base64,JVBERi0='), (b'%PDF-', 'application/pdf'))
+
+
+class EnvoiRapportsTests(DonneesMixin, TestCase):
+    """Un rapport n'est envoyé qu'une fois, même par des tâches concurrentes"""
+
+    def setUp(self):
+        super().setUp()
+        echantillon, = self.creer_echantillons(1, types=('AG',))
+        self.rapport = RapportMarketing.objects.create(
+            echantillon=echantillon, code_echantillon=echantillon.code, client_name='ACME',
+            file_name='rapport.pdf', email_client='acme@snertp.bj', statut_envoi='en_file'
+        )
+
+    def test_lot_rejoue(self):
+        self.assertEqual(envoi_rapports.envoyer_lot([self.rapport.pk]), (1, []))
+        self.assertEqual(envoi_rapports.envoyer_lot([self.rapport.pk]), (0, []))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_rapport_pris_par_une_autre_tache(self):
+        connexion = envoi_rapports.get_connection
+
+        def prise_concurrente(**kwargs):
+            RapportMarketing.objects.filter(pk=self.rapport.pk).update(statut_envoi='en_cours')
+            return connexion(**kwargs)
+
+        with mock.patch.object(envoi_rapports, 'get_connection', prise_concurrente):
+            self.assertEqual(envoi_rapports.envoyer_lot([self.rapport.pk]), (0, []))
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_pas_de_remise_en_file(self):
+        response = self.api.post(
+            f'/api/rapports-marketing/{self.rapport.pk}/envoyer_client/', {'email_client': 'autre@snertp.bj'}
+        )
+        self.assertEqual(response.status_code, 409)
+        self.rapport.refresh_from_db()
+        self.assertEqual(self.rapport.email_client, 'acme@snertp.bj')
+
+    def test_mise_en_file_concurrente(self):
+        libre, pris = [
+            RapportMarketing.objects.create(
+                echantillon=self.rapport.echantillon, code_echantillon=self.rapport.code_echantillon,
+                client_name='ACME', file_name='rapport.pdf', email_client='acme@snertp.bj'
+            ) for _ in range(2)
+        ]
+        # Mis en file par une autre requête après la lecture des rapports
+        RapportMarketing.objects.filter(pk=pris.pk).update(statut_envoi='en_file')
+        with mock.patch.object(envoi_rapports, '_planifier') as planifier:
+            self.assertEqual(envoi_rapports.mettre_en_file([libre, pris], 'autre@snertp.bj'), 1)
+        planifier.assert_called_once_with([libre.pk])
+        pris.refresh_from_db()
+        self.assertEqual(pris.email_client, 'acme@snertp.bj')
+
+    def test_relance_des_envois_bloques(self):
+        ancien = timezone.now() - envoi_rapports.DELAI_BLOCAGE * 2
+        interrompu = RapportMarketing.objects.create(
+            echantillon=self.rapport.echantillon, code_echantillon=self.rapport.code_echantillon,
+            client_name='ACME', file_name='rapport.pdf', email_client='acme@snertp.bj', statut_envoi='en_cours'
+        )
+        RapportMarketing.objects.update(updated_at=ancien)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(envoi_rapports.relancer_envois_bloques(), (1, 1))
+        self.assertEqual(len(mail.outbox), 1)
+        self.rapport.refresh_from_db()
+        interrompu.refresh_from_db()
+        self.assertEqual(self.rapport.statut_envoi, 'envoye')
+        self.assertEqual(interrompu.statut_envoi, 'echec')
+
+
+def signature_png(couleur):
+    sortie = io.BytesIO()
+    Image.new('RGB', (40, 16), couleur).save(sortie, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(sortie.getvalue()).decode()
+
+
+class SignatureRapportsTests(DonneesMixin, TestCase):
+    """Signature vérifiée avant la mise en file, jamais apposée deux fois"""
+
+    def setUp(self):
+        super().setUp()
+        self.echantillon, = self.creer_echantillons(1, types=('AG',))
+
+    def creer_workflow(self, fichier):
+        return WorkflowValidation.objects.create(
+            echantillon=self.echantillon, code_echantillon=self.echantillon.code, client_name='ACME',
+            file_name='rapport.pdf', fichier=fichier, etape_actuelle='directeur_snertp'
+        )
+
+    def test_signature_invalide(self):
+        for signature in ('pas du base64 !', '/api/blobs/abc/', base64.b64encode(b'texte').decode()):
+            with self.subTest(signature=signature):
+                response = self.api.post(
+                    f'/api/echantillons/{self.echantillon.pk}/rapport_pdf/', {'signature': signature}, format='json'
+                )
+                self.assertEqual(response.status_code, 400)
+
+    def test_fichier_du_workflow_en_lien(self):
+        workflow = self.creer_workflow(blobs.stocker('https://exemple.bj/rapport.pdf'))
+        response = self.api.post(
+            f'/api/workflows/{workflow.pk}/signer_pdf/', {'signature': signature_png('black')}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('lien', response.json()['error'])
+
+    def test_modifications_concurrentes_conservees(self):
+        pdf = rendu_rapports.generer(self.echantillon.pk)
+        workflow = self.creer_workflow(pdf)
+        signer = rendu_rapports.signer_pdf
+
+        def signer_pendant_une_modification(*args):
+            WorkflowValidation.objects.filter(pk=workflow.pk).update(etape_actuelle='marketing')
+            return signer(*args)
+
+        with mock.patch.object(rendu_rapports, 'signer_pdf', signer_pendant_une_modification):
+            resultat = tasks.signer_rapport_workflow(str(workflow.pk), signature_png('black'))
+        workflow.refresh_from_db()
+        self.assertEqual(workflow.etape_actuelle, 'marketing')
+        self.assertEqual(workflow.fichier_id, resultat['sha256'])
+        self.assertEqual(workflow.signature_directeur_snertp, signature_png('black'))
+        # Compteurs de références tenus à jour malgré update()
+        self.assertEqual(blobs.recompter_references(), 0)
+
+    def test_fichier_remplace_pendant_la_signature(self):
+        workflow = self.creer_workflow(rendu_rapports.generer(self.echantillon.pk))
+        signer = rendu_rapports.signer_pdf
+        remplacant = blobs.stocker_octets(b'%PDF-1.4 remplacant', 'application/pdf')
+
+        def signer_pendant_un_remplacement(*args):
+            WorkflowValidation.objects.filter(pk=workflow.pk).update(fichier=remplacant)
+            return signer(*args)
+
+        with mock.patch.object(rendu_rapports, 'signer_pdf', signer_pendant_un_remplacement):
+            resultat = tasks.signer_rapport_workflow(str(workflow.pk), signature_png('black'))
+        self.assertIn('error', resultat)
+        workflow.refresh_from_db()
+        self.assertEqual(workflow.fichier_id, remplacant.sha256)
+        self.assertEqual(workflow.signature_directeur_snertp, '')
+
+    def test_nouvelle_signature_sur_l_original(self):
+        pdf = rendu_rapports.generer(self.echantillon.pk)
+        premiere = rendu_rapports.signer_pdf(pdf, signature_png('black'), self.echantillon)
+        seconde = rendu_rapports.signer_pdf(premiere.fichier, signature_png('blue'), self.echantillon)
+        self.assertEqual(seconde.source_id, pdf.sha256)
+        self.assertEqual(seconde.cle, rendu_rapports.cle_signature(pdf.sha256, signature_png('blue')))
+
+
+class PhotosTests(DonneesMixin, TestCase):
+    """La photo normalisée change de nom et d'updated_at"""
+
+    def test_normaliser(self):
+        sortie = io.BytesIO()
+        Image.new('RGB', (64, 64), 'green').save(sortie, 'PNG')
+        nom = default_storage.save('clients/photo.png', ContentFile(sortie.getvalue()))
+        ancien = timezone.now() - timedelta(days=1)
+        Client.objects.filter(pk=self.client_labo.pk).update(photo=nom, updated_at=ancien)
+
+        nouveau = photos.normaliser('core.Client', self.client_labo.pk)
+
+        self.client_labo.refresh_from_db()
+        self.assertEqual(self.client_labo.photo.name, nouveau)
+        self.assertNotEqual(nouveau, 'clients/photo.jpg')
+        self.assertGreater(self.client_labo.updated_at, ancien)
+        self.assertFalse(default_storage.exists(nom))
+
+
+class CalendrierCapaciteTests(DonneesMixin, TestCase):
+    """Calendrier de capacité par jour et type d'essai"""
+
+    def setUp(self):
+        super().setUp()
+        CapaciteLaboratoire.objects.create(type_essai='CBR', capacite_quotidienne=5, duree_standard_jours=5)
+
+    def test_calendrier(self):
+        CreneauCapacite.objects.create(type_essai='CBR', date='2026-01-06', utilise=3, reserve=2)
+        with self.assertNumQueries(2):
+            response = self.api.get('/api/capacites/calendrier/?mois=2026-01&type_essai=CBR')
+        jours = {jour['date']: jour['capacites']['CBR'] for jour in response.json()['jours']}
+        self.assertEqual(len(jours), 31)
+        self.assertEqual(jours['2026-01-06']['capacite_restante'], 0)
+        self.assertFalse(jours['2026-01-06']['disponible'])
+        self.assertEqual(jours['2026-01-07']['capacite_restante'], 5)
+
+    def test_capacites_disponibles_compte_les_planifications(self):
+        essais = [essai for echantillon in self.creer_echantillons(2, types=('CBR',)) for essai in echantillon.essais.all()]
+        for essai, capacite_utilisee in zip(essais, (1, 3)):
+            PlanificationEssai.objects.create(
+                essai=essai, date_planifiee='2026-01-06', date_fin_planifiee='2026-01-10',
+                capacite_utilisee=capacite_utilisee
+            )
+        response = self.api.get('/api/capacites/capacites_disponibles/?date=2026-01-06')
+        self.assertEqual(response.json()['CBR'], {
+            'capacite_totale': 5, 'capacite_utilisee': 2, 'capacite_disponible': 3,
+        })
+
+
+class ReservationsCapaciteTests(DonneesMixin, TestCase):
+    """Les places d'un créneau ne dépassent jamais la capacité quotidienne"""
+
+    def setUp(self):
+        super().setUp()
+        CapaciteLaboratoire.objects.create(type_essai='CBR', capacite_quotidienne=2, duree_standard_jours=5)
+        self.echantillon, = self.creer_echantillons(1, types=())
+        self.jour = timezone.now().date() + timedelta(days=7)
+
+    def creer_essai(self, url='/api/essais/', **donnees):
+        return self.api.post(url, {
+            'echantillon': str(self.echantillon.pk), 'type': 'CBR', 'section': 'route',
+            'date_reception': self.jour.isoformat(), 'duree_estimee': 5, **donnees,
+        }, format='json')
+
+    def creneau(self):
+        return CreneauCapacite.objects.values_list('utilise', 'reserve').get(type_essai='CBR', date=self.jour)
+
+    def test_refus_quand_le_creneau_est_plein(self):
+        self.assertEqual(self.creer_essai().status_code, 201)
+        reservations.reserver('CBR', self.jour)
+        self.assertEqual(self.creer_essai().status_code, 409)
+        with self.assertRaises(reservations.CapaciteAtteinte):
+            reservations.reserver('CBR', self.jour)
+        self.assertEqual(self.creneau(), (1, 1))
+        self.assertEqual(Essai.objects.filter(type='CBR').count(), 1)
+
+    def test_creation_avec_fichier(self):
+        self.assertEqual(self.creer_essai('/api/essais/create_with_file/').status_code, 201)
+        self.assertEqual(self.creneau(), (1, 0))
+
+    def test_reservation_de_plusieurs_places(self):
+        reservation = reservations.reserver('CBR', self.jour, quantite=2)
+        for _ in range(2):
+            response = self.creer_essai(reservation_id=str(reservation.pk))
+            self.assertEqual(response.status_code, 201)
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.statut, 'confirmee')
+        self.assertEqual(reservation.essais.count(), 2)
+        self.assertEqual(self.creneau(), (2, 0))
+
+    def test_reservation_expiree_non_convertie(self):
+        reservation = reservations.reserver('CBR', self.jour)
+        ReservationCapacite.objects.filter(pk=reservation.pk).update(expire_le=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.creer_essai(reservation_id=str(reservation.pk)).status_code, 201)
+        self.assertEqual(self.creneau(), (1, 1))
+        self.assertFalse(reservation.essais.exists())
+
+
+class PrevisionChargeTests(DonneesMixin, TestCase):
+    """Projection de la charge par type d'essai"""
+
+    lundi = date(2026, 1, 5)
+
+    def test_occupation_et_type_ferme(self):
+        CapaciteLaboratoire.objects.create(
+            type_essai='CBR', capacite_quotidienne=0, capacite_simultanee=0, duree_standard_jours=0
+        )
+        self.creer_echantillons(1, types=('AG', 'CBR'))
+        Essai.objects.filter(type='CBR').update(date_reception=self.lundi)
+        Essai.objects.filter(type='AG').update(
+            statut='en_cours', date_debut=self.lundi - timedelta(days=2), duree_estimee=3
+        )
+
+        prevision_charge = prevision.prevoir_charge(1, self.lundi)
+
+        self.assertEqual(prevision_charge['par_type']['AG']['occupation'][:2], [1, 0])
+        cbr = prevision_charge['par_type']['CBR']
+        self.assertEqual(cbr['demarrages_planifies'][0], 1)
+        self.assertEqual(cbr['occupation'][:2], [1, 0])
+        self.assertIn({'type_essai': 'CBR', 'date': '2026-01-05', 'taux': 1.0}, prevision_charge['saturations'])
+
+
+class ReprogrammationTests(DonneesMixin, TestCase):
+    """Reprogrammation groupée des échantillons en retard"""
+
+    def test_reprogrammes_une_seule_fois(self):
+        from scheduler.tasks import reprogrammer_echantillons_retardes
+
+        self.creer_echantillons(2, types=('AG',))
+        Echantillon.objects.update(date_fin_estimee=timezone.now().date() - timedelta(days=3))
+
+        self.assertEqual(reprogrammer_echantillons_retardes(), 'Reprogrammé 2 échantillons en retard')
+        self.assertFalse(Echantillon.objects.filter(date_fin_estimee__lt=timezone.now().date()).exists())
+        self.assertEqual(reprogrammer_echantillons_retardes(), 'Reprogrammé 0 échantillons en retard')
+        self.assertEqual(TacheProgrammee.objects.filter(statut='en_attente').count(), 2)
+        self.assertFalse(TacheProgrammee.objects.filter(statut='annulee').exists())
+
+    def test_urgents_d_abord(self):
+        from .reprogrammation_helper import reprogrammer_echantillons
+
+        CapaciteLaboratoire.objects.create(type_essai='AG', capacite_quotidienne=1, duree_standard_jours=5)
+        normal, urgent = self.creer_echantillons(2, types=('AG',))
+        Echantillon.objects.filter(pk=urgent.pk).update(priorite='urgente')
+        dates = {
+            resultat['code']: resultat['dates_envoi']['AG']
+            for resultat in reprogrammer_echantillons([normal.pk, urgent.pk])
+        }
+        self.assertLess(dates[urgent.code], dates[normal.code])
+
+
+class TraitementGroupesTests(DonneesMixin, TestCase):
+    """Échantillons en traitement groupés par client, en agrégats"""
+
+    url = '/api/echantillons/traitement_groupes_par_client/'
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def preparer(self, nombre):
+        Echantillon.objects.all().delete()
+        echantillons = self.creer_echantillons(nombre, types=('AG', 'CBR'))
+        Echantillon.objects.update(statut='traitement')
+        Essai.objects.update(statut='termine', statut_validation='accepted', date_fin='2026-01-10')
+        # Le dernier échantillon a un essai encore à valider: il n'est pas listé
+        Essai.objects.filter(echantillon=echantillons[-1], type='CBR').update(statut_validation='pending')
+        return echantillons
+
+    def test_regroupement(self):
+        echantillons = self.preparer(3)
+        Essai.objects.create(
+            echantillon=echantillons[0], type='AG', statut='termine', statut_validation='accepted',
+            date_fin='2026-01-20', operateur='Second passage', date_rejet='2026-01-12', duree_estimee=5
+        )
+        client, = self.api.get(self.url).json()
+        self.assertEqual(client['echantillonsEnTraitement'], 3)
+        self.assertEqual(client['totalEchantillonsClient'], 3)
+        self.assertTrue(client['tousEchantillonsPrets'])
+        self.assertEqual(len(client['echantillons']), 2)
+        self.assertEqual(client['totalEssais'], 4)
+        ag, = [
+            essai for echantillon in client['echantillons'] if echantillon['code'] == echantillons[0].code
+            for essai in echantillon['essais'] if essai['essaiType'] == 'AG'
+        ]
+        self.assertEqual((ag['operateur'], ag['estRepris']), ('Second passage', True))
+
+    def test_requetes_et_cache(self):
+        for nombre in (3, 12):
+            with self.subTest(echantillons=nombre):
+                cache.clear()
+                self.preparer(nombre)
+                with self.assertNumQueries(5):
+                    premiere = self.api.get(self.url).json()
+                with self.assertNumQueries(2):
+                    self.assertEqual(self.api.get(self.url).json(), premiere)
+
+        Essai.objects.filter(type='CBR').update(statut_validation='accepted', updated_at=timezone.now())
+        self.assertEqual(len(self.api.get(self.url).json()[0]['echantillons']), 12)
+
+
+class RegroupementClientsTests(DonneesMixin, TestCase):
+    """Dashboards par client agrégés en SQL"""
+
+    def setUp(self):
+        super().setUp()
+        self.autre_client = Client.objects.create(
+            nom='BTP Sud', projet='Pont', contact='Contact', telephone='000', created_by=self.user
+        )
+        for client, date_reception, statut in (
+            (self.client_labo, '2026-01-05', 'traitement'),
+            (self.client_labo, '2026-01-12', 'stockage'),
+            (self.autre_client, '2026-02-02', 'stockage'),
+        ):
+            Echantillon.objects.create(
+                client=client, nature=Echantillon.NATURE_CHOICES[0][0], profondeur_debut=0,
+                profondeur_fin=1, sondage=Echantillon.SONDAGE_CHOICES[0][0], essais_types=['AG'],
+                date_reception=date_reception, statut=statut
+            )
+
+    def test_grouped_by_client(self):
+        lignes = self.api.get('/api/echantillons/grouped_by_client/').json()
+        self.assertEqual([ligne['client_nom'] for ligne in lignes], ['BTP Sud', 'ACME'])
+        self.assertEqual([ligne['nombre_echantillons'] for ligne in lignes], [1, 2])
+        self.assertEqual(len(lignes[1]['echantillons']), 2)
+
+    def test_dashboard_traitement_et_periode(self):
+        acme, = self.api.get('/api/echantillons/dashboard_traitement/?date_fin=2026-01-31').json()
+        self.assertEqual(acme['clientName'], 'ACME')
+        self.assertEqual(acme['nombreEchantillons'], 2)
+        self.assertEqual(acme['dateReception'], '05/01/2026')
+        self.assertEqual(acme['dateTraitement'], 'En traitement')
+
+    def test_pagination_et_requetes(self):
+        for url in ('dashboard_chef_projet', 'dashboard_directeur_technique'):
+            with self.subTest(url=url):
+                response = self.api.get(f'/api/echantillons/{url}/?page_size=1')
+                self.assertEqual(response.json()['count'], 2)
+                self.assertEqual(len(response.json()['results']), 1)
+        self.creer_echantillons(10)
+        # COUNT, page des clients, échantillons des clients de la page
+        with self.assertNumQueries(3):
+            self.api.get('/api/echantillons/grouped_by_client/?page_size=1')
+
+    def test_periode_invalide(self):
+        response = self.api.get('/api/echantillons/dashboard_traitement/?date_debut=2026-13-01')
+        self.assertEqual(response.status_code, 400)
+
+
+class ChampsDemandesTests(DonneesMixin, TestCase):
+    """?fields= restreint la représentation de premier niveau"""
+
+    def test_liste_echantillons(self):
+        self.creer_echantillons(2)
+        resultats = self.api.get('/api/echantillons/?fields=id,code').json()['results']
+        self.assertEqual([set(ligne) for ligne in resultats], [{'id', 'code'}] * 2)
+
+        ligne = self.api.get('/api/echantillons/?fields=code&expand=essais').json()['results'][0]
+        self.assertEqual(set(ligne), {'code', 'essais'})
+        self.assertIn('resultats', ligne['essais'][0])
+
+    def test_sans_fields_inchange(self):
+        self.creer_echantillons(1)
+        ligne = self.api.get('/api/echantillons/').json()['results'][0]
+        self.assertLessEqual({'id', 'code', 'client_nom', 'essais', 'essais_count'}, set(ligne))
+        self.assertEqual(ligne['essais_count'], 3)
+
+    def test_liste_essais_sans_colonnes_lourdes(self):
+        self.creer_echantillons(1)
+        Essai.objects.update(resultats={'teneur_en_eau': 12})
+        with CaptureQueriesContext(connection) as requetes:
+            resultats = self.api.get('/api/essais/?fields=id,type').json()['results']
+        self.assertEqual({frozenset(ligne) for ligne in resultats}, {frozenset({'id', 'type'})})
+        self.assertFalse(any('"resultats"' in requete['sql'] for requete in requetes))
+
+
+class PaginationCurseurTests(DonneesMixin, TestCase):
+    """Pages par curseur (created_at, id) stables malgré les insertions"""
+
+    def test_insertion_entre_deux_pages(self):
+        echantillons = self.creer_echantillons(5, types=())
+        attendus = [str(echantillon.pk) for echantillon in reversed(echantillons)]
+
+        premiere = self.api.get('/api/echantillons/?cursor=&page_size=2&fields=id')
+        self.assertEqual([ligne['id'] for ligne in premiere.json()['results']], attendus[:2])
+        self.assertIn('X-Total-Count-Estimate', premiere)
+
+        self.creer_echantillons(1, types=())
+        suite = self.api.get(premiere.json()['next'])
+        self.assertEqual([ligne['id'] for ligne in suite.json()['results']], attendus[2:4])
+        fin = self.api.get(suite.json()['next']).json()
+        self.assertEqual([ligne['id'] for ligne in fin['results']], attendus[4:])
+        self.assertIsNone(fin['next'])
+
+    def test_curseur_invalide(self):
+        self.assertEqual(self.api.get('/api/echantillons/?cursor=xyz').status_code, 404)
+
+    def test_sans_curseur_pages_numerotees(self):
+        self.creer_echantillons(3, types=())
+        response = self.api.get('/api/echantillons/?page_size=2')
+        self.assertEqual(response.json()['count'], 3)
+
+
+class RenduCompressionTests(DonneesMixin, TestCase):
+    """Rendu orjson identique à DRF et compression des grandes réponses"""
+
+    def test_rendu_identique(self):
+        donnees = {
+            'id': uuid.uuid4(), 'date': date(2026, 1, 5), 'instant': timezone.now(),
+            'decimal': Decimal('1.50'), 'duree': timedelta(hours=1), 'texte': 'Échantillon', 'liste': [1, None],
+        }
+        self.assertEqual(
+            json.loads(renderers.ORJSONRenderer().render(donnees)),
+            json.loads(JSONRenderer().render(donnees)),
+        )
+
+    def test_gzip(self):
+        self.creer_echantillons(12)
+        url = '/api/echantillons/dashboard_route/'
+        brut = self.api.get(url)
+        compresse = self.api.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertNotIn('Content-Encoding', brut)
+        self.assertEqual(compresse['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', compresse['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(compresse.content)), brut.json())
+
+    def test_petite_reponse_et_etag(self):
+        petite = self.api.get('/api/echantillons/dashboard_route/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', petite)
+
+        self.creer_echantillons(12)
+        with self.settings(COMPRESSION_TAILLE_MIN=10):
+            reponse = self.api.get('/api/echantillons/?page_size=50', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(reponse['Content-Encoding'], 'gzip')
+        self.assertTrue(reponse['ETag'].startswith('W/'))
+        self.assertEqual(middleware_compression.choisir_encodage('identity'), None)
+
+
+class TelechargementTests(DonneesMixin, TestCase):
+    """Téléchargement des fichiers de rapports en flux"""
+
+    def setUp(self):
+        super().setUp()
+        self.echantillon, = self.creer_echantillons(1, types=('AG',))
+
+    def creer_workflow(self, fichier):
+        return WorkflowValidation.objects.create(
+            echantillon=self.echantillon, code_echantillon=self.echantillon.code, client_name='ACME',
+            file_name='rapport.pdf', fichier=fichier, etape_actuelle='directeur_snertp'
+        )
+
+    def test_lien_externe(self):
+        cas = (
+            ('/media/rapports/rapport.pdf', 302),
+            ('http://testserver/media/rapport.pdf', 302),
+            ('https://fichiers.snertp.bj/rapport.pdf', 302),
+            ('https://ailleurs.example.com/rapport.pdf', 200),
+        )
+        for url, statut in cas:
+            with self.subTest(url=url), self.settings(DOMAINES_FICHIERS_EXTERNES=['fichiers.snertp.bj']):
+                workflow = self.creer_workflow(blobs.stocker(url))
+                response = self.api.get(f'/api/workflows/{workflow.pk}/telecharger/')
+                self.assertEqual(response.status_code, statut)
+                if statut == 302:
+                    self.assertEqual(response['Location'], url)
+                else:
+                    self.assertEqual(response.json(), {'url': url})
+
+    def test_intervalles(self):
+        octets = b'%PDF-1.4 ' + bytes(range(256)) * 4
+        blob = blobs.stocker_octets(octets, 'application/pdf')
+        url = telechargement.url_telechargement(blob.sha256)
+        anonyme = APIClient()
+
+        complet = anonyme.get(url)
+        self.assertEqual(complet.status_code, 200)
+        self.assertEqual(b''.join(complet.streaming_content), octets)
+        self.assertEqual(complet['Accept-Ranges'], 'bytes')
+
+        partiel = anonyme.get(url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(partiel.status_code, 206)
+        self.assertEqual(partiel['Content-Range'], f'bytes 2-5/{len(octets)}')
+        self.assertEqual(b''.join(partiel.streaming_content), octets[2:6])
+
+        fin = anonyme.get(url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(fin.streaming_content), octets[-3:])
+
+        hors = anonyme.get(url, HTTP_RANGE=f'bytes={len(octets)}-')
+        self.assertEqual(hors.status_code, 416)
+        self.assertEqual(hors['Content-Range'], f'bytes */{len(octets)}')
+
+        # If-Range d'une autre version: fichier complet
+        autre = anonyme.get(url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"autre"')
+        self.assertEqual(autre.status_code, 200)
+
+        self.assertEqual(anonyme.get(url.split('?')[0]).status_code, 401)
+
+    def test_revalidation(self):
+        blob = blobs.stocker_octets(b'%PDF-1.4 contenu', 'application/pdf')
+        workflow = self.creer_workflow(blob)
+        url = f'/api/workflows/{workflow.pk}/telecharger/'
+
+        response = self.api.get(url)
+        self.assertEqual(response['ETag'], f'"{blob.sha256}"')
+        self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        workflow.fichier = blobs.stocker_octets(b'%PDF-1.4 nouveau', 'application/pdf')
+        workflow.save()
+        self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+class ListesRapportsTests(DonneesMixin, TestCase):
+    """Les listes de rapports renvoient des liens, jamais le contenu des fichiers"""
+
+    def test_listes_sans_contenu(self):
+        echantillon, = self.creer_echantillons(1, types=('AG',))
+        pdf = b'%PDF-1.4 ' + b'rapport ' * 200
+        fichier = blobs.stocker_octets(pdf, 'application/pdf')
+        signature = signature_png('black')
+        commun = dict(code_echantillon=echantillon.code, client_name='ACME', file_name='rapport.pdf', fichier=fichier)
+        WorkflowValidation.objects.create(
+            echantillon=echantillon, etape_actuelle='directeur_snertp', signature_directeur_snertp=signature, **commun
+        )
+        RapportMarketing.objects.create(
+            echantillon=echantillon, email_client='acme@snertp.bj', rapport_signe=fichier,
+            signature_directeur_snertp=signature, **commun
+        )
+        RapportValidation.objects.create(
+            etape_actuelle='chef_service', fichier_original=fichier, signature_directeur_snertp=signature, **commun
+        )
+        RapportArchive.objects.create(envoye_par=self.user, etape_envoi='client', **commun)
+
+        for url in ('/api/workflows/', '/api/rapports-marketing/', '/api/rapport-validations/', '/api/rapports-archives/'):
+            with self.subTest(url=url):
+                response = self.api.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn(base64.b64encode(pdf).decode()[:40], response.content.decode())
+                self.assertNotIn(signature[30:70], response.content.decode())
+                donnees = response.json()
+                ligne, = donnees['results'] if isinstance(donnees, dict) else donnees
+                self.assertIn(f'/api/blobs/{fichier.sha256}/?jeton=', ligne['file_data'])
+                self.assertTrue(ligne['has_file'])
+                self.assertEqual(ligne['file_size'], len(pdf))
+                self.assertNotIn('signature_directeur_snertp', ligne)
+                if url != '/api/rapports-archives/':
+                    self.assertTrue(ligne['has_signature'])
+
+
+class ImportFichiersEssaisTests(DonneesMixin, TestCase):
+    """Dépôt groupé des exports d'appareils et lecture des mesures dans resultats"""
+
+    def test_import_csv_xlsx_et_archive(self):
+        import openpyxl
+
+        echantillon, = self.creer_echantillons(1)
+        prefixe = echantillon.code.replace('/', '-')
+
+        csv_ag = SimpleUploadedFile(f'{prefixe}_AG.csv', 'tamis;passant\n80;100\n2;45,5\n'.encode('cp1252'))
+        classeur = openpyxl.Workbook()
+        classeur.active.append(['Indice CBR', 12.5])
+        classeur.active.append(['Gonflement', 0.4])
+        sortie = io.BytesIO()
+        classeur.save(sortie)
+        xlsx_cbr = SimpleUploadedFile(f'{prefixe}_CBR.xlsx', sortie.getvalue())
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zip_archive:
+            zip_archive.writestr(f'mesures/{prefixe}_oedometre.csv', 'Cc,0.25\nCs,0.04\n')
+            zip_archive.writestr('__MACOSX/._x.csv', 'ignoré')
+        inconnu = SimpleUploadedFile('sans_code.csv', b'a;1\n')
+
+        response = self.api.post('/api/essais/import_fichiers/', {
+            'fichiers': [csv_ag, xlsx_cbr, inconnu],
+            'archive': SimpleUploadedFile('mesures.zip', archive.getvalue()),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(len(response.json()['deposes']), 3)
+        self.assertEqual([ignore['nom'] for ignore in response.json()['ignores']], ['sans_code.csv'])
+
+        essais = {essai.type: essai for essai in echantillon.essais.all()}
+        self.assertEqual(essais['AG'].resultats['colonnes'], ['tamis', 'passant'])
+        self.assertEqual(essais['AG'].resultats['mesures'], [{'tamis': 80, 'passant': 100}, {'tamis': 2, 'passant': 45.5}])
+        self.assertEqual(essais['CBR'].resultats['Indice CBR'], 12.5)
+        self.assertEqual(essais['Oedometre'].resultats['Cc'], 0.25)
+        self.assertTrue(essais['Oedometre'].fichier.name.startswith('essais/'))
+
+    def test_aucun_essai_reconnu(self):
+        response = self.api.post('/api/essais/import_fichiers/', {
+            'fichiers': [SimpleUploadedFile('sans_code.csv', b'a;1\n')],
+        }, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.json()['ignores']), 1)
@@ -12,7 +12,8 @@ from .views import (
     RapportViewSet, PlanificationEssaiViewSet, CapaciteLaboratoireViewSet,
     RapportMarketingViewSet, WorkflowValidationViewSet, DataStorageViewSet,
     ActionLogViewSet, RapportValidationViewSet, EssaiDataViewSet, 
-    PlanificationDataViewSet, RapportArchiveViewSet
+    PlanificationDataViewSet, RapportArchiveViewSet, SyncViewSet, BlobViewSet, MiniatureViewSet, TacheViewSet,
+    ResultatCalculeViewSet
 )
 
 router = DefaultRouter()
@@ -20,9 +21,11 @@ router.register(r'users', UserViewSet, basename='user')
 router.register(r'clients', ClientViewSet, basename='client')
 router.register(r'echantillons', EchantillonViewSet, basename='echantillon')
 router.register(r'essais', EssaiViewSet, basename='essai')
+router.register(r'resultats-calcules', ResultatCalculeViewSet, basename='resultat-calcule')
 router.register(r'notifications', NotificationViewSet, basename='notification')
 router.register(r'validations', ValidationHistoryViewSet, basename='validation')
 router.register(r'dashboard', DashboardViewSet, basename='dashboard')
+router.register(r'sync', SyncViewSet, basename='sync')
 router.register(r'rapports', RapportViewSet, basename='rapport')
 router.register(r'planifications', PlanificationEssaiViewSet, basename='planification')
 router.register(r'capacites', CapaciteLaboratoireViewSet, basename='capacite')
@@ -34,6 +37,9 @@ router.register(r'rapport-validations', RapportValidationViewSet, basename='rapp
 router.register(r'essai-data', EssaiDataViewSet, basename='essai-data')
 router.register(r'planification-data', PlanificationDataViewSet, basename='planification-data')
 router.register(r'rapports-archives', RapportArchiveViewSet, basename='rapport-archives')
+router.register(r'blobs', BlobViewSet, basename='blob')
+router.register(r'taches', TacheViewSet, basename='tache')
+router.register(r'miniatures', MiniatureViewSet, basename='miniature')
 
 urlpatterns = [
     # JWT Authentication
@@ -30,6 +30,15 @@ DUREES_ESSAIS = {
     'Cisaillement': 4,
 }
 
+# Champ de date d'envoi planifiée de l'échantillon par type d'essai
+CHAMPS_DATE_ENVOI = {
+    'AG': 'date_envoi_ag',
+    'Proctor': 'date_envoi_proctor',
+    'CBR': 'date_envoi_cbr',
+    'Oedometre': 'date_envoi_oedometre',
+    'Cisaillement': 'date_envoi_cisaillement',
+}
+
 # Capacités par type d'essai par jour
 CAPACITES_PAR_JOUR = {
     'AG': 5,
@@ -64,38 +73,50 @@ def ajouter_jours_ouvrables(date_debut, nombre_jours):
 
 
 def compter_echantillons_en_attente():
-    """Compte les échantillons en attente par type d'essai"""
+    """Compte les échantillons en attente par type d'essai (un seul agrégat)"""
+    from django.db.models import Count, Q
     from .models import Echantillon
     
-    compteurs = {
-        'AG': 0,
-        'Proctor': 0,
-        'CBR': 0,
-        'Oedometre': 0,
-        'Cisaillement': 0
-    }
-    
-    echantillons = Echantillon.objects.filter(statut__in=['stockage', 'essais'])
-    
-    for ech in echantillons:
-        essais_types = ech.essais_types or []
-        for type_essai in essais_types:
-            if type_essai in compteurs:
-                compteurs[type_essai] += 1
-    
-    return compteurs
+    return Echantillon.objects.filter(statut__in=['stockage', 'essais']).aggregate(**{
+        type_essai: Count('id', filter=Q(essais_types__contains=[type_essai]))
+        for type_essai in CAPACITES_PAR_JOUR
+    })
 
 
-def calculer_date_envoi_et_retour(echantillon):
+def calculer_date_envoi_et_retour(echantillon, charge=None):
     """
     Calcule la date d'envoi et de retour prédite pour un échantillon
     basé sur les contraintes réelles du laboratoire
-    """
-    aujourd_hui = timezone.now().date()
-    charge = compter_echantillons_en_attente()
     
-    essais_types = echantillon.essais_types or []
+    Args:
+        charge: Charge par type d'essai déjà calculée (évite de la recompter)
+    """
+    if charge is None:
+        charge = compter_echantillons_en_attente()
+    return _predire_dates(echantillon.essais_types or [], charge, timezone.now().date())
+
+
+def predire_dates_retour(listes_essais_types):
+    """
+    Prédit les dates pour plusieurs listes de types d'essais en un seul comptage
     
+    Returns:
+        Liste de prédictions alignée sur listes_essais_types
+    """
+    charge = compter_echantillons_en_attente()
+    aujourd_hui = timezone.now().date()
+    predictions = {}
+    resultats = []
+    for essais_types in listes_essais_types:
+        cle = tuple(essais_types or [])
+        if cle not in predictions:
+            predictions[cle] = _predire_dates(list(cle), charge, aujourd_hui)
+        resultats.append(predictions[cle])
+    return resultats
+
+
+def _predire_dates(essais_types, charge, aujourd_hui):
+    """Prédiction des dates pour une liste de types d'essais et une charge donnée"""
     delai_max_envoi = 0
     duree_essai_plus_long = 0
     details_par_essai = {}
@@ -2,39 +2,70 @@
 Views et ViewSets pour l'API REST
 """
 
+import hashlib
+import json
+import uuid
+
 from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.contrib.auth import get_user_model
-from django.db.models import Count, Q, Avg
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.core.files.storage import default_storage
+from django.core.cache import cache
+from django.urls import reverse
+from celery.result import AsyncResult
+from django.db.models import Count, Q, Avg, Exists, OuterRef, F, Max, Subquery, Window
+from django.db.models.functions import Coalesce, RowNumber
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 from django.utils import timezone
 from datetime import timedelta
-from django.utils.dateparse import parse_date
+from django.utils.dateparse import parse_date, parse_datetime
 from django_filters.rest_framework import DjangoFilterBackend
 
 from .models import (
     Client, Echantillon, Essai, Notification, ValidationHistory, Rapport, 
     PlanificationEssai, CapaciteLaboratoire, TacheProgrammee, RapportMarketing, 
     WorkflowValidation, ActionLog, DataStorage, RapportValidation, EssaiData, 
-    PlanificationData, RapportArchive
+    PlanificationData, RapportArchive, ReservationCapacite, ResultatCalcule, Blob
 )
 from .serializers import (
-    UserSerializer, UserCreateSerializer, ClientSerializer,
+    UserSerializer, UserCreateSerializer, ClientSerializer, ClientListSerializer,
     EchantillonSerializer, EchantillonListSerializer, EssaiSerializer,
     NotificationSerializer, ValidationHistorySerializer, DashboardStatsSerializer,
     RapportSerializer, PlanificationEssaiSerializer, CapaciteLaboratoireSerializer,
-    RapportMarketingSerializer, WorkflowValidationSerializer
+    RapportMarketingSerializer, WorkflowValidationSerializer, ReservationCapaciteSerializer,
+    RapportMarketingListSerializer, WorkflowValidationListSerializer, ResultatCalculeSerializer,
+    champs_demandes
 )
 from .permissions import (
     CanManageClients, CanManageEchantillons, CanManageEssais,
-    IsAdmin, IsValidateur
+    IsAdmin, IsValidateur, IsResponsableMateriaux
 )
 from .utils import (
     calculer_date_envoi_et_retour,
     generer_dates_envoi_par_type,
     compter_echantillons_en_attente
 )
+from .calendrier_capacite import (
+    calendrier_capacite, capacite_du_jour, chercher_prochaine_date,
+    MAX_JOURS_CALENDRIER
+)
+from . import analyses_resultats, blobs, envoi_rapports, etiquettes, import_essais, photos, regroupement_clients, rendu_rapports, reservations, synchronisation
+from .prevision import prevoir_charge_cache
+from .statistiques import stats_dashboard
+from .pagination import paginer, PaginationCurseur
+from .conditionnel import ConditionnelMixin, reponse_conditionnelle
+from .tasks import (
+    generer_etiquettes, generer_rapport_pdf, importer_fichiers_essais, recalculer_resultats_essais,
+    signer_rapport_workflow
+)
+from .telechargement import ListeAlegeeMixin, TelechargementMixin, reponse_fichier, url_telechargement
+from .reservations import CapaciteAtteinte
 
 User = get_user_model()
 
@@ -102,6 +133,11 @@ class ClientViewSet(viewsets.ModelViewSet):
         
         return queryset
     
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return ClientListSerializer
+        return ClientSerializer
+    
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
     
@@ -109,26 +145,168 @@ class ClientViewSet(viewsets.ModelViewSet):
     def echantillons(self, request, pk=None):
         """Retourne les échantillons d'un client"""
         client = self.get_object()
-        echantillons = client.echantillons.all()
-        serializer = EchantillonListSerializer(echantillons, many=True)
+        echantillons = client.echantillons.prefetch_related('essais').annotate(nombre_essais=Count('essais'))
+        serializer = EchantillonListSerializer(echantillons, many=True, context={'request': request})
         return Response(serializer.data)
 
 
-class EchantillonViewSet(viewsets.ModelViewSet):
+# Durée de vie du cache des regroupements par client (secondes); la clé change à chaque modification
+DUREE_CACHE_TRAITEMENT = 600
+
+# Champs projetés pour les listes d'échantillons (équivalent de EchantillonListSerializer)
+CHAMPS_LISTE_ECHANTILLON = [
+    'id', 'code', 'client__nom', 'client__code', 'client__contact', 'client__projet',
+    'client__email', 'client__telephone', 'nature', 'profondeur_debut', 'profondeur_fin',
+    'sondage', 'nappe', 'qr_code', 'photo', 'statut', 'priorite', 'chef_projet',
+    'date_reception', 'date_envoi_essais', 'essais_types', 'date_envoi_ag', 'date_envoi_proctor',
+    'date_envoi_cbr', 'date_envoi_oedometre', 'date_envoi_cisaillement', 'date_retour_predite'
+]
+
+
+def construire_lignes_echantillons(lignes):
+    """
+    Construit les lignes de liste d'échantillons à partir d'une projection values()
+    
+    Les essais de toutes les lignes sont chargés en une seule requête.
+    """
+    essais_par_echantillon = {}
+    essais = Essai.objects.filter(
+        echantillon_id__in=[ligne['id'] for ligne in lignes]
+    ).select_related('echantillon').order_by('-created_at')
+    for essai in essais:
+        essais_par_echantillon.setdefault(essai.echantillon_id, []).append(essai)
+    
+    resultat = []
+    for ligne in lignes:
+        essais = essais_par_echantillon.get(ligne['id'], [])
+        donnees = {}
+        for champ in CHAMPS_LISTE_ECHANTILLON:
+            donnees[champ.replace('__', '_')] = ligne[champ]
+        donnees['profondeur_debut'] = str(ligne['profondeur_debut'])
+        donnees['profondeur_fin'] = str(ligne['profondeur_fin'])
+        donnees['photo'] = photos.url_miniature(ligne['photo'])
+        donnees['photo_miniatures'] = photos.urls_miniatures(ligne['photo'])
+        donnees['essais'] = EssaiSerializer(essais, many=True).data
+        donnees['essais_count'] = len(essais)
+        donnees['essais_types'] = ligne['essais_types'] or [essai.type for essai in essais]
+        for champ in ligne.keys() - set(CHAMPS_LISTE_ECHANTILLON):
+            donnees[champ] = ligne[champ]
+        resultat.append(donnees)
+    
+    return resultat
+
+
+def projection_echantillons(queryset, champs):
+    """
+    Liste d'échantillons réduite aux champs demandés, lue via values()
+    
+    Les essais ne sont chargés (en une requête pour la page) que si 'essais'
+    ou 'essais_types' est demandé.
+    
+    Returns:
+        (lignes, construire): queryset values() à paginer et fonction
+        construisant la réponse à partir des lignes de la page
+    """
+    chemins = {champ.replace('__', '_'): champ for champ in CHAMPS_LISTE_ECHANTILLON}
+    # id et created_at servent aux essais de la page et au curseur de pagination
+    selection = {'id', 'created_at'} | {chemins[nom] for nom in champs if nom in chemins}
+    if 'photo_miniatures' in champs:
+        selection.add('photo')
+    annotations = {}
+    if 'essais_count' in champs:
+        annotations['essais_count'] = Count('essais')
+    # L'agrégat essais_count supprime l'ordre par défaut du modèle: on le rétablit
+    ordre = queryset.query.order_by or Echantillon._meta.ordering
+    lignes = queryset.prefetch_related(None).values(*selection, **annotations).order_by(*ordre)
+    
+    def construire(page):
+        essais_par_echantillon = {}
+        if {'essais', 'essais_types'} & set(champs):
+            essais = Essai.objects.filter(echantillon_id__in=[ligne['id'] for ligne in page])
+            if 'essais' in champs:
+                essais = essais.select_related('echantillon').order_by('-created_at')
+            else:
+                essais = essais.only('id', 'echantillon_id', 'type').order_by('-created_at')
+            for essai in essais:
+                essais_par_echantillon.setdefault(essai.echantillon_id, []).append(essai)
+        
+        resultat = []
+        for ligne in page:
+            essais = essais_par_echantillon.get(ligne['id'], [])
+            donnees = {}
+            for nom in champs:
+                chemin = chemins.get(nom, nom)
+                if chemin in ligne:
+                    donnees[nom] = ligne[chemin]
+            if 'profondeur_debut' in donnees:
+                donnees['profondeur_debut'] = str(donnees['profondeur_debut'])
+            if 'profondeur_fin' in donnees:
+                donnees['profondeur_fin'] = str(donnees['profondeur_fin'])
+            if 'photo' in donnees:
+                donnees['photo'] = photos.url_miniature(donnees['photo'])
+            if 'photo_miniatures' in champs:
+                donnees['photo_miniatures'] = photos.urls_miniatures(ligne['photo'])
+            if 'essais' in champs:
+                donnees['essais'] = EssaiSerializer(essais, many=True).data
+            if 'essais_types' in champs:
+                donnees['essais_types'] = ligne['essais_types'] or [essai.type for essai in essais]
+            resultat.append(donnees)
+        return resultat
+    
+    return lignes, construire
+
+
+class EchantillonViewSet(ConditionnelMixin, viewsets.ModelViewSet):
     """ViewSet pour les échantillons"""
     
     queryset = Echantillon.objects.select_related('client').prefetch_related('essais')
+    pagination_class = PaginationCurseur
     permission_classes = [IsAuthenticated, CanManageEchantillons]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['statut', 'priorite', 'nature', 'sondage', 'code', 'client']
     search_fields = ['code', 'client__nom', 'qr_code', 'chef_projet']
     ordering_fields = ['created_at', 'date_reception', 'priorite']
+    # Les listes imbriquent les essais, dont la modification ne touche pas l'échantillon
+    relations_modification = ('essais',)
     
     def get_serializer_class(self):
         if self.action == 'list':
             return EchantillonListSerializer
         return EchantillonSerializer
     
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            # Sous-requête corrélée plutôt que Count('essais'): pas de GROUP BY,
+            # l'ordre par défaut est conservé et les agrégats de validation l'ignorent
+            queryset = queryset.annotate(nombre_essais=Coalesce(Subquery(
+                Essai.objects.filter(echantillon=OuterRef('pk')).order_by()
+                .values('echantillon').annotate(nombre=Count('pk')).values('nombre')
+            ), 0))
+        return queryset
+    
+    def list(self, request, *args, **kwargs):
+        """
+        Liste des échantillons
+        
+        Avec ?fields=code,statut (et ?expand=essais), la liste est lue par
+        projection values() sans instancier de modèles ni de serializers.
+        """
+        champs = champs_demandes(request)
+        if champs is None:
+            return super().list(request, *args, **kwargs)
+        
+        queryset = self.filter_queryset(Echantillon.objects.all())
+        lignes, construire = projection_echantillons(queryset, champs)
+        
+        def reponse():
+            page = self.paginate_queryset(lignes)
+            if page is not None:
+                return self.get_paginated_response(construire(page))
+            return Response(construire(list(lignes)))
+        
+        return self.conditionnel(request, queryset, reponse)
+    
     def perform_create(self, serializer):
         # Vérifier le délai de 24h pour le client
         client = serializer.validated_data.get('client')
@@ -156,36 +334,40 @@ class EchantillonViewSet(viewsets.ModelViewSet):
         else:
             echantillons = self.get_queryset()
         
-        serializer = self.get_serializer(echantillons, many=True)
-        return Response(serializer.data)
+        return self.conditionnel(
+            request, echantillons,
+            lambda: Response(self.get_serializer(echantillons, many=True).data)
+        )
+    
+    def _groupes_clients(self, request, regroupement):
+        """
+        Réponse d'un regroupement par client (voir core.regroupement_clients)
+        
+        Filtrable par période de réception (?date_debut=&date_fin=, YYYY-MM-DD)
+        et paginée si ?page= ou ?page_size= est fourni.
+        """
+        periode = {}
+        for param in ('date_debut', 'date_fin'):
+            valeur = request.query_params.get(param)
+            if not valeur:
+                continue
+            try:
+                periode[param] = parse_date(valeur)
+            except ValueError:
+                periode[param] = None
+            if periode[param] is None:
+                return Response(
+                    {'error': f'Paramètre {param} invalide (YYYY-MM-DD)'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        echantillons = regroupement_clients.filtrer_periode(Echantillon.objects.all(), **periode)
+        return paginer(request, *regroupement(echantillons), view=self)
     
     @action(detail=False, methods=['get'])
     def grouped_by_client(self, request):
         """Retourne les échantillons groupés par client"""
-        echantillons = self.get_queryset().select_related('client')
-        
-        # Grouper par client
-        clients_data = {}
-        for echantillon in echantillons:
-            client_nom = echantillon.client.nom if echantillon.client else 'Sans client'
-            if client_nom not in clients_data:
-                clients_data[client_nom] = {
-                    'client_nom': client_nom,
-                    'echantillons': [],
-                    'nombre_echantillons': 0
-                }
-            
-            clients_data[client_nom]['echantillons'].append({
-                'id': str(echantillon.id),
-                'code': echantillon.code,
-                'date_reception': echantillon.date_reception,
-                'statut': echantillon.statut,
-                'essais_types': echantillon.essais_types or [],
-                'date_retour_predite': echantillon.date_retour_predite
-            })
-            clients_data[client_nom]['nombre_echantillons'] += 1
-        
-        return Response(list(clients_data.values()))
+        return self._groupes_clients(request, regroupement_clients.echantillons_par_client)
     
     @action(detail=True, methods=['post'])
     def change_statut(self, request, pk=None):
@@ -234,14 +416,15 @@ class EchantillonViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def retarder(self, request, pk=None):
         """Retarder un échantillon et reprogrammer automatiquement"""
-        from .reprogrammation_helper import reprogrammer_echantillon_retarde
+        from .reprogrammation_helper import JOURS_RETARD_DEFAUT, reprogrammer_echantillon_retarde
         
         echantillon = self.get_object()
-        jours_retard = request.data.get('jours_retard', 4)
+        jours_retard = request.data.get('jours_retard', JOURS_RETARD_DEFAUT)
         
         result = reprogrammer_echantillon_retarde(str(echantillon.id), jours_retard)
         
         if result['success']:
+            echantillon.refresh_from_db()
             serializer = self.get_serializer(echantillon)
             return Response({
                 **result,
@@ -250,6 +433,44 @@ class EchantillonViewSet(viewsets.ModelViewSet):
         else:
             return Response(result, status=status.HTTP_400_BAD_REQUEST)
     
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, IsResponsableMateriaux])
+    def reprogrammer(self, request):
+        """
+        Reprogramme un ensemble d'échantillons en répartissant les envois selon la capacité
+        
+        POST /api/echantillons/reprogrammer/
+        {"echantillon_ids": [...], "jours_retard": 4}  // sans ids: tous les échantillons en retard
+        """
+        from .reprogrammation_helper import JOURS_RETARD_DEFAUT, reprogrammer_echantillons
+        from scheduler.tasks import echantillons_en_retard
+        
+        echantillon_ids = request.data.get('echantillon_ids')
+        jours_retard = request.data.get('jours_retard', JOURS_RETARD_DEFAUT)
+        
+        try:
+            jours_retard = int(jours_retard)
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'jours_retard doit être un entier'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if echantillon_ids is None:
+            echantillon_ids = list(echantillons_en_retard().values_list('id', flat=True))
+        
+        try:
+            resultats = reprogrammer_echantillons(echantillon_ids, jours_retard)
+        except DjangoValidationError:
+            return Response(
+                {'error': 'Identifiants d\'échantillons invalides'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response({
+            'count': len(resultats),
+            'resultats': resultats
+        })
+    
     @action(detail=True, methods=['get'])
     def essais(self, request, pk=None):
         """Retourne les essais d'un échantillon"""
@@ -258,6 +479,123 @@ class EchantillonViewSet(viewsets.ModelViewSet):
         serializer = EssaiSerializer(essais, many=True)
         return Response(serializer.data)
     
+    @action(detail=True, methods=['get'])
+    def qr(self, request, pk=None):
+        """
+        Image PNG du QR code de l'échantillon (?taille=<pixels par module>, 2 à 20)
+        
+        Rendue une fois puis gardée sur disque et en mémoire.
+        """
+        try:
+            module = int(request.query_params.get('taille', etiquettes.TAILLE_MODULE))
+        except ValueError:
+            module = None
+        if module not in etiquettes.TAILLES_MODULE:
+            return Response(
+                {'error': 'Taille invalide (2 à 20 pixels par module)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        echantillon = self.get_object()
+        etag = quote_etag(etiquettes.chemin_qr(echantillon.code, echantillon.qr_code, module))
+        reponse = get_conditional_response(request, etag=etag)
+        if reponse is None:
+            reponse = HttpResponse(
+                etiquettes.png_qr(echantillon.code, echantillon.qr_code, module),
+                content_type='image/png'
+            )
+        reponse['ETag'] = etag
+        patch_cache_control(reponse, private=True, max_age=86400)
+        return reponse
+    
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def etiquettes(self, request):
+        """
+        Planche d'étiquettes (PDF A4) d'un lot d'échantillons
+        
+        Body: {"ids": [...]} ou {"client": "<id>", "date_reception": "YYYY-MM-DD"}
+        Si la planche de ce lot existe déjà, elle est renvoyée directement
+        (200); sinon elle est produite par un worker (202, suivi par
+        /api/taches/<tache>/).
+        """
+        ids = request.data.get('ids')
+        client_id = request.data.get('client')
+        
+        if ids is not None:
+            try:
+                if not isinstance(ids, list):
+                    raise ValueError
+                ids = [uuid.UUID(str(pk)) for pk in ids]
+            except ValueError:
+                return Response(
+                    {'error': "ids doit être une liste d'identifiants"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        try:
+            date_reception = parse_date(request.data.get('date_reception') or '')
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'date_reception invalide (YYYY-MM-DD)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if not ids and not (client_id and date_reception):
+            return Response(
+                {'error': 'ids, ou client et date_reception (YYYY-MM-DD), requis'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            if ids:
+                echantillons = Echantillon.objects.filter(pk__in=ids)
+            else:
+                echantillons = Echantillon.objects.filter(client_id=client_id, date_reception=date_reception)
+            donnees = etiquettes.donnees_etiquettes(echantillons)
+        except DjangoValidationError:
+            return Response(
+                {'error': 'Identifiant invalide'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not donnees:
+            return Response(
+                {'error': 'Aucun échantillon trouvé'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        blob = etiquettes.planche_en_cache(donnees)
+        if blob is not None:
+            return Response(reponse_rendu(request, blob))
+        
+        tache = generer_etiquettes.delay([ligne['id'] for ligne in donnees])
+        return Response(reponse_tache(request, tache), status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def rapport_pdf(self, request, pk=None):
+        """
+        Rapport PDF de l'échantillon généré par le serveur
+        
+        Body optionnel: {"signature": "<image base64 / data URL>"}
+        Si le rendu correspondant aux données actuelles existe déjà, il est
+        renvoyé directement (200); sinon il est généré par un worker (202,
+        suivi par /api/taches/<tache>/).
+        """
+        echantillon = self.get_object()
+        signature = request.data.get('signature') or None
+        
+        if signature:
+            try:
+                rendu_rapports.verifier_signature(signature)
+            except rendu_rapports.SignatureInvalide as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        rendu = rendu_rapports.rendu_en_cache(echantillon, signature)
+        if rendu is not None:
+            return Response(reponse_rendu(request, rendu.fichier))
+        
+        tache = generer_rapport_pdf.delay(str(echantillon.pk), signature)
+        return Response(reponse_tache(request, tache), status=status.HTTP_202_ACCEPTED)
+    
     @action(detail=True, methods=['get'])
     def prediction_dates(self, request, pk=None):
         """Retourne la prédiction des dates d'envoi et de retour"""
@@ -265,175 +603,205 @@ class EchantillonViewSet(viewsets.ModelViewSet):
         prediction = calculer_date_envoi_et_retour(echantillon)
         return Response(prediction)
     
-    @action(detail=False, methods=['get'])
-    def dashboard_meca(self, request):
-        """Dashboard pour les essais mécaniques avec ordre strict d'envoi"""
-        echantillons = self.get_queryset().filter(
-            essais_types__overlap=['Oedometre', 'Cisaillement']
-        ).order_by('date_envoi_essais', 'created_at')  # Ordre strict d'envoi
+    def _dashboard_section(self, request, types):
+        """
+        Échantillons d'une section: prioritaires d'abord (essai urgent de la
+        section), puis ordre strict d'envoi; tri et priorité calculés en SQL
         
-        data = []
-        for ech in echantillons:
-            ech_data = EchantillonListSerializer(ech).data
-            
-            # Vérifier la priorité (essais rejetés)
-            essais_prioritaires = ech.essais.filter(
-                type__in=['Oedometre', 'Cisaillement'],
+        Pagination optionnelle avec ?page= / ?page_size=
+        """
+        filtre_types = Q()
+        for type_essai in types:
+            filtre_types |= Q(essais_types__contains=[type_essai])
+        
+        echantillons = Echantillon.objects.filter(filtre_types).annotate(
+            prioritaire=Exists(Essai.objects.filter(
+                echantillon=OuterRef('pk'),
+                type__in=types,
                 priorite='urgente'
-            ).exists()
-            
-            ech_data['prioritaire'] = essais_prioritaires
-            data.append(ech_data)
+            ))
+        ).order_by(
+            '-prioritaire', F('date_envoi_essais').asc(nulls_last=True), 'created_at'
+        ).values(*CHAMPS_LISTE_ECHANTILLON, 'prioritaire')
         
-        # Trier : prioritaires d'abord, puis ordre d'envoi
-        data.sort(key=lambda x: (not x.get('prioritaire', False), x.get('date_envoi_essais', '')))
+        return paginer(request, echantillons, construire_lignes_echantillons, view=self)
+    
+    def _echantillons_avec_essais_envoyes(self, request, types, cle):
+        """
+        Échantillons ayant au moins un essai des types donnés envoyé (date de
+        réception renseignée), avec la liste de ces types dans `cle`
         
-        return Response(data)
+        ?since=<ISO datetime> ne renvoie que les échantillons modifiés (ou dont
+        un essai de la section a été modifié) depuis cette date; l'en-tête
+        X-Server-Time donne la valeur à réutiliser au prochain appel.
+        Pagination optionnelle avec ?page= / ?page_size=
+        """
+        maintenant = timezone.now()
+        essais_envoyes = Essai.objects.filter(
+            echantillon=OuterRef('pk'),
+            type__in=types,
+            date_reception__isnull=False
+        )
+        
+        echantillons = Echantillon.objects.filter(Exists(essais_envoyes))
+        
+        since = request.query_params.get('since')
+        if since:
+            try:
+                date_since = parse_datetime(since)
+            except ValueError:
+                # Bien formée mais impossible (2026-13-01T00:00)
+                date_since = None
+            if not date_since:
+                return Response(
+                    {'error': 'Format de date invalide pour since (ISO 8601)'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if timezone.is_naive(date_since):
+                date_since = timezone.make_aware(date_since)
+            echantillons = echantillons.filter(
+                Q(updated_at__gte=date_since)
+                | Exists(essais_envoyes.filter(updated_at__gte=date_since))
+            )
+        
+        echantillons = echantillons.order_by('-created_at').values(*CHAMPS_LISTE_ECHANTILLON)
+        
+        def construire(lignes):
+            resultat = construire_lignes_echantillons(lignes)
+            for donnees in resultat:
+                # Uniquement les essais de la section envoyés
+                donnees[cle] = [
+                    essai['type'] for essai in donnees['essais']
+                    if essai['type'] in types and essai['date_reception']
+                ]
+            return resultat
+        
+        response = paginer(request, echantillons, construire, view=self)
+        response['X-Server-Time'] = maintenant.isoformat()
+        return response
+    
+    @action(detail=False, methods=['get'])
+    def dashboard_meca(self, request):
+        """Dashboard pour les essais mécaniques avec ordre strict d'envoi"""
+        return self._dashboard_section(request, ['Oedometre', 'Cisaillement'])
     
     @action(detail=False, methods=['get'])
     def with_essais_meca_envoyes(self, request):
         """Retourne les échantillons avec au moins un essai mécanique envoyé"""
-        # Récupérer tous les échantillons
-        echantillons = self.get_queryset()
-        
-        result = []
-        for ech in echantillons:
-            # Vérifier si au moins un essai mécanique a été envoyé
-            essais_meca = ech.essais.filter(
-                type__in=['Oedometre', 'Cisaillement'],
-                date_reception__isnull=False
-            )
-            
-            if essais_meca.exists():
-                ech_data = EchantillonListSerializer(ech).data
-                # Ajouter uniquement les essais mécaniques envoyés
-                ech_data['essais_meca_envoyes'] = list(essais_meca.values_list('type', flat=True))
-                result.append(ech_data)
-        
-        return Response(result)
+        return self._echantillons_avec_essais_envoyes(request, ['Oedometre', 'Cisaillement'], 'essais_meca_envoyes')
     
     @action(detail=False, methods=['get'])
     def dashboard_route(self, request):
         """Dashboard pour les essais route avec ordre strict d'envoi"""
-        echantillons = self.get_queryset().filter(
-            essais_types__overlap=['AG', 'Proctor', 'CBR']
-        ).order_by('date_envoi_essais', 'created_at')  # Ordre strict d'envoi
-        
-        data = []
-        for ech in echantillons:
-            ech_data = EchantillonListSerializer(ech).data
-            
-            # Vérifier la priorité (essais rejetés)
-            essais_prioritaires = ech.essais.filter(
-                type__in=['AG', 'Proctor', 'CBR'],
-                priorite='urgente'
-            ).exists()
-            
-            ech_data['prioritaire'] = essais_prioritaires
-            data.append(ech_data)
-        
-        # Trier : prioritaires d'abord, puis ordre d'envoi
-        data.sort(key=lambda x: (not x.get('prioritaire', False), x.get('date_envoi_essais', '')))
-        
-        return Response(data)
+        return self._dashboard_section(request, ['AG', 'Proctor', 'CBR'])
     
     @action(detail=False, methods=['get'])
     def with_essais_route_envoyes(self, request):
         """Retourne les échantillons avec au moins un essai route envoyé"""
-        # Récupérer tous les échantillons
-        echantillons = self.get_queryset()
-        
-        result = []
-        for ech in echantillons:
-            # Vérifier si au moins un essai route a été envoyé
-            essais_route = ech.essais.filter(
-                type__in=['AG', 'Proctor', 'CBR'],
-                date_reception__isnull=False
-            )
-            
-            if essais_route.exists():
-                ech_data = EchantillonListSerializer(ech).data
-                # Ajouter uniquement les essais route envoyés
-                ech_data['essais_route_envoyes'] = list(essais_route.values_list('type', flat=True))
-                result.append(ech_data)
-        
-        return Response(result)
+        return self._echantillons_avec_essais_envoyes(request, ['AG', 'Proctor', 'CBR'], 'essais_route_envoyes')
     
     @action(detail=False, methods=['get'])
     def traitement_groupes_par_client(self, request):
         """Retourne les échantillons en traitement groupés par client avec flag estRepris"""
-        echantillons = self.get_queryset().filter(statut='traitement').select_related('client').prefetch_related('essais')
-        print(f"\n🔍 TRAITEMENT: {echantillons.count()} échantillons avec statut='traitement'")
+        echantillons = Echantillon.objects.filter(statut='traitement')
+        essais = Essai.objects.filter(echantillon__statut='traitement')
+        
+        # Clé de cache: toute modification d'un échantillon ou d'un essai concerné la change
+        etat_echantillons = Echantillon.objects.aggregate(maj=Max('updated_at'), nombre=Count('id'))
+        etat_essais = essais.aggregate(maj=Max('updated_at'), nombre=Count('id'))
+        cle_cache = 'traitement_groupes_par_client:' + hashlib.md5(':'.join(
+            str(valeur) for valeur in (
+                etat_echantillons['maj'], etat_echantillons['nombre'],
+                etat_essais['maj'], etat_essais['nombre']
+            )
+        ).encode()).hexdigest()
+        resultat = cache.get(cle_cache)
+        if resultat is not None:
+            return Response(resultat)
+        
+        # Essais acceptés vs total par échantillon, en une requête groupée
+        lignes = echantillons.annotate(
+            total_essais=Count('essais'),
+            essais_acceptes=Count('essais', filter=Q(
+                essais__statut='termine', essais__statut_validation='accepted'
+            ))
+        ).order_by('-created_at').values(
+            'id', 'code', 'client_id', 'client_nom', 'chef_projet', 'total_essais', 'essais_acceptes'
+        )
+        lignes = list(lignes)
+        
+        # Nombre total d'échantillons par client (tous statuts confondus)
+        totaux_clients = dict(
+            Echantillon.objects.filter(
+                client_id__in={ligne['client_id'] for ligne in lignes}
+            ).values_list('client_id').annotate(total=Count('id')).order_by()
+        )
+        
+        # Dernier essai accepté de chaque type, pour les échantillons dont tous les essais sont acceptés
+        complets = [ligne['id'] for ligne in lignes if ligne['essais_acceptes'] == ligne['total_essais']]
+        derniers_essais = essais.filter(
+            echantillon_id__in=complets,
+            statut='termine',
+            statut_validation='accepted'
+        ).annotate(
+            rang=Window(
+                expression=RowNumber(),
+                partition_by=[F('echantillon_id'), F('type')],
+                order_by=[F('date_fin').desc(nulls_last=True), F('created_at').desc()]
+            )
+        ).filter(rang=1).order_by('-created_at').values(
+            'echantillon_id', 'type', 'date_reception', 'date_debut', 'date_fin', 'operateur',
+            'resultats', 'commentaires', 'fichier', 'commentaires_validation', 'date_rejet'
+        )
+        
+        essais_par_echantillon = {}
+        for essai in derniers_essais:
+            essais_par_echantillon.setdefault(essai['echantillon_id'], []).append(essai)
         
         clients_data = {}
-        for echantillon in echantillons:
-            print(f"\n📦 {echantillon.code}:")
-            client_key = str(echantillon.client.id) if echantillon.client else 'sans_client'
-            client_nom = echantillon.client_nom or 'Client inconnu'
-            client_id = echantillon.client.id if echantillon.client else None
+        for echantillon in lignes:
+            client_id = echantillon['client_id']
+            client_key = str(client_id) if client_id else 'sans_client'
+            client_nom = echantillon['client_nom'] or 'Client inconnu'
             
             if client_key not in clients_data:
-                # Compter le nombre total d'échantillons du client (tous statuts confondus)
-                total_echantillons_client = 0
-                if client_id:
-                    total_echantillons_client = Echantillon.objects.filter(client_id=client_id).count()
-                
                 clients_data[client_key] = {
-                    'clientId': str(client_id) if client_id else None,  # ← AJOUT du clientId
+                    'clientId': str(client_id) if client_id else None,
                     'clientNom': client_nom,
-                    'chefProjet': echantillon.chef_projet or '-',
+                    'chefProjet': echantillon['chef_projet'] or '-',
                     'echantillons': [],
                     'totalEssais': 0,
-                    'totalEchantillonsClient': total_echantillons_client,
+                    'totalEchantillonsClient': totaux_clients.get(client_id, 0),
                     'echantillonsEnTraitement': 0
                 }
             
             # Incrémenter le compteur d'échantillons en traitement
             clients_data[client_key]['echantillonsEnTraitement'] += 1
             
-            # Récupérer uniquement les essais acceptés
-            essais_acceptes = echantillon.essais.filter(statut='termine', statut_validation='accepted')
-            total_essais = echantillon.essais.count()
-            print(f"  - Total essais: {total_essais}")
-            print(f"  - Essais acceptés: {essais_acceptes.count()}")
-            for e in echantillon.essais.all():
-                print(f"    • {e.type}: statut={e.statut}, validation={e.statut_validation}")
-            
-            # Vérifier que TOUS les essais sont acceptés
-            if essais_acceptes.count() != total_essais:
-                print(f"  ❌ Ignoré: tous les essais ne sont pas acceptés")
-                continue
-            
-            # Garder seulement le dernier essai de chaque type
-            essais_uniques = {}
-            for essai in essais_acceptes:
-                if essai.type not in essais_uniques or essai.date_fin > essais_uniques[essai.type].date_fin:
-                    essais_uniques[essai.type] = essai
-            
-            print(f"  - Essais uniques retenus: {len(essais_uniques)}")
-            
-            essais_list = []
-            for essai in essais_uniques.values():
-                essais_list.append({
-                    'echantillonCode': echantillon.code,
-                    'essaiType': essai.type,
-                    'dateReception': str(essai.date_reception) if essai.date_reception else '-',
-                    'dateDebut': str(essai.date_debut) if essai.date_debut else '-',
-                    'dateFin': str(essai.date_fin) if essai.date_fin else '-',
-                    'operateur': essai.operateur or '-',
-                    'resultats': essai.resultats or {},
-                    'commentaires': essai.commentaires or '-',
-                    'fichier': essai.fichier.url if essai.fichier else '-',
-                    'validationComment': essai.commentaires_validation or '-',
-                    'validationDate': str(essai.date_validation) if hasattr(essai, 'date_validation') and essai.date_validation else '-',
-                    'dateRejet': str(essai.date_rejet) if essai.date_rejet else None,
-                    'estRepris': bool(essai.date_rejet)  # Flag calculé côté serveur
-                })
+            essais_list = [
+                {
+                    'echantillonCode': echantillon['code'],
+                    'essaiType': essai['type'],
+                    'dateReception': str(essai['date_reception']) if essai['date_reception'] else '-',
+                    'dateDebut': str(essai['date_debut']) if essai['date_debut'] else '-',
+                    'dateFin': str(essai['date_fin']) if essai['date_fin'] else '-',
+                    'operateur': essai['operateur'] or '-',
+                    'resultats': essai['resultats'] or {},
+                    'commentaires': essai['commentaires'] or '-',
+                    'fichier': default_storage.url(essai['fichier']) if essai['fichier'] else '-',
+                    'validationComment': essai['commentaires_validation'] or '-',
+                    # Le modèle Essai ne stocke pas de date de validation
+                    'validationDate': '-',
+                    'dateRejet': str(essai['date_rejet']) if essai['date_rejet'] else None,
+                    'estRepris': bool(essai['date_rejet'])  # Flag calculé côté serveur
+                }
+                for essai in essais_par_echantillon.get(echantillon['id'], [])
+            ]
             
             if essais_list:
                 clients_data[client_key]['echantillons'].append({
-                    'code': echantillon.code,
-                    'chefProjet': echantillon.chef_projet or '-',
+                    'code': echantillon['code'],
+                    'chefProjet': echantillon['chef_projet'] or '-',
                     'clientNom': client_nom,
                     'essais': essais_list
                 })
@@ -445,143 +813,84 @@ class EchantillonViewSet(viewsets.ModelViewSet):
                 client_data['echantillonsEnTraitement'] == client_data['totalEchantillonsClient']
             )
         
-        return Response(list(clients_data.values()))
+        resultat = list(clients_data.values())
+        cache.set(cle_cache, resultat, DUREE_CACHE_TRAITEMENT)
+        return Response(resultat)
     
     @action(detail=False, methods=['get'])
     def dashboard_traitement(self, request):
         """Dashboard pour le traitement groupé par client"""
-        echantillons = self.get_queryset().select_related('client')
-        
-        clients_data = {}
-        for echantillon in echantillons:
-            client_nom = echantillon.client.nom if echantillon.client else 'Sans client'
-            if client_nom not in clients_data:
-                clients_data[client_nom] = {
-                    'client_nom': client_nom,
-                    'echantillons': [],
-                    'nombre_echantillons': 0
-                }
-            
-            clients_data[client_nom]['echantillons'].append({
-                'id': str(echantillon.id),
-                'code': echantillon.code,
-                'date_reception': echantillon.date_reception,
-                'statut': echantillon.statut,
-                'essais_types': echantillon.essais_types or [],
-                'date_retour_predite': echantillon.date_retour_predite
-            })
-            clients_data[client_nom]['nombre_echantillons'] += 1
-        
-        result = []
-        for client_data in clients_data.values():
-            echantillons_list = client_data['echantillons']
-            date_reception = echantillons_list[0]['date_reception'] if echantillons_list else None
-            
-            date_traitement = '-'
-            ech_with_traitement = next((e for e in echantillons_list if e['statut'] == 'traitement'), None)
-            if ech_with_traitement:
-                date_traitement = 'En traitement'
-            
-            date_retour_client = '-'
-            ech_with_date = next((e for e in echantillons_list if e.get('date_retour_predite')), None)
-            if ech_with_date and ech_with_date['date_retour_predite']:
-                date_retour_client = ech_with_date['date_retour_predite']
-            
-            result.append({
-                'clientName': client_data['client_nom'],
-                'nombreEchantillons': client_data['nombre_echantillons'],
-                'dateReception': date_reception.strftime('%d/%m/%Y') if date_reception else '-',
-                'dateTraitement': date_traitement,
-                'dateRetourClient': date_retour_client
-            })
-        
-        return Response(result)
+        return self._groupes_clients(request, regroupement_clients.dashboard_traitement)
     
     @action(detail=False, methods=['get'])
     def dashboard_chef_projet(self, request):
         """Dashboard pour chef de projet avec date traitement = envoi vers chef projet"""
-        echantillons = self.get_queryset().select_related('client')
-        
-        clients_data = {}
-        for echantillon in echantillons:
-            client_nom = echantillon.client.nom if echantillon.client else 'Sans client'
-            if client_nom not in clients_data:
-                clients_data[client_nom] = []
-            clients_data[client_nom].append(echantillon)
-        
-        result = []
-        for client_nom, echs in clients_data.items():
-            date_reception = echs[0].date_reception if echs else None
-            date_traitement = echs[0].date_envoi_chef_projet.strftime('%d/%m/%Y') if echs and echs[0].date_envoi_chef_projet else '-'
-            date_retour_client = '-'
-            
-            if echs:
-                prediction = calculer_date_envoi_et_retour(echs[0])
-                date_retour_client = prediction['date_retour']
-            
-            result.append({
-                'clientName': client_nom,
-                'nombreEchantillons': len(echs),
-                'dateReception': date_reception.strftime('%d/%m/%Y') if date_reception else '-',
-                'dateTraitement': date_traitement,
-                'dateRetourClient': date_retour_client
-            })
-        
-        return Response(result)
+        return self._groupes_clients(request, regroupement_clients.dashboard_chef_projet)
     
     @action(detail=False, methods=['get'])
     def dashboard_directeur_technique(self, request):
         """Dashboard pour directeur technique avec toutes les dates correctes"""
-        echantillons = self.get_queryset().select_related('client')
-        
-        clients_data = {}
-        for echantillon in echantillons:
-            client_nom = echantillon.client.nom if echantillon.client else 'Sans client'
-            if client_nom not in clients_data:
-                clients_data[client_nom] = []
-            clients_data[client_nom].append(echantillon)
-        
-        result = []
-        for client_nom, echs in clients_data.items():
-            date_reception = echs[0].date_reception if echs else None
-            date_traitement = echs[0].date_envoi_chef_projet.strftime('%d/%m/%Y') if echs and echs[0].date_envoi_chef_projet else '-'
-            date_chef_projet = echs[0].date_envoi_chef_service.strftime('%d/%m/%Y') if echs and echs[0].date_envoi_chef_service else '-'
-            date_chef_service = echs[0].date_envoi_directeur_technique.strftime('%d/%m/%Y') if echs and echs[0].date_envoi_directeur_technique else '-'
-            date_retour_client = '-'
-            
-            if echs:
-                ech_with_date = next((e for e in echs if e.date_retour_predite), None)
-                if ech_with_date:
-                    date_retour_client = ech_with_date.date_retour_predite
-                else:
-                    prediction = calculer_date_envoi_et_retour(echs[0])
-                    date_retour_client = prediction['date_retour']
-            
-            result.append({
-                'clientName': client_nom,
-                'nombreEchantillons': len(echs),
-                'dateReception': date_reception.strftime('%d/%m/%Y') if date_reception else '-',
-                'dateTraitement': date_traitement,
-                'dateChefProjet': date_chef_projet,
-                'dateChefService': date_chef_service,
-                'dateRetourClient': date_retour_client
-            })
-        
-        return Response(result)
-
+        return self._groupes_clients(request, regroupement_clients.dashboard_directeur_technique)
 
 
 # Mixin pour les essais rejetés
-class EssaiViewSet(viewsets.ModelViewSet):
+class EssaiViewSet(ConditionnelMixin, viewsets.ModelViewSet):
     """ViewSet pour les essais"""
     
     queryset = Essai.objects.select_related('echantillon', 'echantillon__client')
     serializer_class = EssaiSerializer
+    pagination_class = PaginationCurseur
     permission_classes = [IsAuthenticated, CanManageEssais]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['statut', 'type', 'section', 'statut_validation', 'echantillon']
     search_fields = ['echantillon__code', 'operateur', 'type']
     ordering_fields = ['created_at', 'date_debut', 'date_fin']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        champs = champs_demandes(self.request)
+        if champs is not None and self.action == 'list':
+            # Colonnes volumineuses non lues quand ?fields= ne les demande pas
+            queryset = queryset.defer(*[
+                champ for champ in ('resultats', 'commentaires', 'commentaires_validation')
+                if champ not in champs
+            ])
+        return queryset
+
+    def create(self, request, *args, **kwargs):
+        try:
+            return super().create(request, *args, **kwargs)
+        except CapaciteAtteinte as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+    
+    def update(self, request, *args, **kwargs):
+        try:
+            return super().update(request, *args, **kwargs)
+        except CapaciteAtteinte as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+    
+    def perform_create(self, serializer):
+        # La place dans le créneau est prise dans la même transaction que l'essai
+        with transaction.atomic():
+            essai = serializer.save()
+            if essai.date_reception:
+                reservations.occuper(essai.type, essai.date_reception, self.request.data.get('reservation_id'), essai)
+    
+    def perform_update(self, serializer):
+        essai = serializer.instance
+        with transaction.atomic():
+            reservations.deplacer_essai(
+                essai,
+                serializer.validated_data.get('type', essai.type),
+                serializer.validated_data.get('date_reception', essai.date_reception),
+                self.request.data.get('reservation_id')
+            )
+            serializer.save()
+    
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            reservations.deplacer_essai(instance, instance.type, None)
+            instance.delete()
     
     @action(detail=False, methods=['get'])
     def by_section(self, request):
@@ -592,8 +901,10 @@ class EssaiViewSet(viewsets.ModelViewSet):
         else:
             essais = self.get_queryset()
         
-        serializer = self.get_serializer(essais, many=True)
-        return Response(serializer.data)
+        return self.conditionnel(
+            request, essais,
+            lambda: Response(self.get_serializer(essais, many=True).data)
+        )
     
     @action(detail=True, methods=['post'])
     def demarrer(self, request, pk=None):
@@ -809,23 +1120,138 @@ class EssaiViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        essai = serializer.save()
+        try:
+            self.perform_create(serializer)
+        except CapaciteAtteinte as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        essai = serializer.instance
         
         if 'fichier' in request.FILES:
             essai.fichier = request.FILES['fichier']
             essai.save()
         
         return Response(serializer.data, status=status.HTTP_201_CREATED)
+    
+    @action(detail=False, methods=['post'])
+    def import_fichiers(self, request):
+        """
+        Dépôt groupé des fichiers de mesures de plusieurs essais
+        
+        multipart/form-data:
+            fichiers: un ou plusieurs fichiers
+            archive: une ou plusieurs archives zip
+            correspondance (optionnel): JSON {"nom du fichier": "<id essai>"}
+        Sans correspondance, le nom désigne l'essai: <code échantillon>_<type>.<ext>
+        (ex. S-0001-26_AG.csv). Les fichiers sont rattachés aux essais tout de
+        suite; les mesures des exports CSV/XLSX sont lues dans resultats par un
+        worker (202, progression sur /api/taches/<tache>/).
+        """
+        correspondance = request.data.get('correspondance') or {}
+        if isinstance(correspondance, str):
+            try:
+                correspondance = json.loads(correspondance)
+            except ValueError:
+                correspondance = None
+        if not isinstance(correspondance, dict):
+            return Response(
+                {'error': 'correspondance doit être un objet JSON {nom: id essai}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        fichiers = request.FILES.getlist('fichiers')
+        archives = request.FILES.getlist('archive')
+        if not fichiers and not archives:
+            return Response(
+                {'error': 'Aucun fichier envoyé (champs fichiers ou archive)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        deposes, ignores = import_essais.deposer(
+            fichiers, archives, correspondance,
+            autorise=lambda essai: CanManageEssais().has_object_permission(request, self, essai)
+        )
+        if not deposes:
+            return Response(
+                {'error': 'Aucun fichier rattaché à un essai', 'ignores': ignores},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        ids = [depose['essai'] for depose in deposes]
+        tache = importer_fichiers_essais.delay(ids)
+        return Response(
+            {**reponse_tache(request, tache), 'deposes': deposes, 'ignores': ignores},
+            status=status.HTTP_202_ACCEPTED
+        )
+    
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, IsAdmin])
+    def recalculer(self, request):
+        """
+        Recalcul des grandeurs géotechniques par un worker (202)
+        
+        Body (optionnel): {"tous": true, "type": "AG"}; par défaut seuls les
+        essais jamais calculés ou calculés avec d'anciennes formules le sont.
+        """
+        type_essai = request.data.get('type')
+        if type_essai and type_essai not in dict(Essai.TYPE_CHOICES):
+            return Response({'error': f"Type d'essai inconnu: {type_essai}"}, status=status.HTTP_400_BAD_REQUEST)
+        tache = recalculer_resultats_essais.delay(bool(request.data.get('tous')), type_essai)
+        return Response(reponse_tache(request, tache), status=status.HTTP_202_ACCEPTED)
 
 
-class NotificationViewSet(viewsets.ModelViewSet):
+class ResultatCalculeViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Grandeurs géotechniques calculées des essais (lecture seule)
+    
+    Filtres par plage, ex. ?type=AG&coefficient_uniformite__gte=6&passant_80um__lte=12
+    """
+    
+    queryset = ResultatCalcule.objects.select_related('essai__echantillon').order_by('-calcule_le')
+    serializer_class = ResultatCalculeSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = {
+        'type': ['exact'],
+        'source': ['exact'],
+        'essai__echantillon': ['exact'],
+        'essai__echantillon__client': ['exact'],
+        **{
+            champ: ['gte', 'lte', 'isnull']
+            for champ in (
+                'd60', 'coefficient_uniformite', 'coefficient_courbure', 'passant_2mm', 'passant_80um',
+                'teneur_eau_optimale', 'densite_seche_max', 'indice_cbr', 'cbr_95', 'gonflement',
+                'indice_compression', 'pression_preconsolidation', 'cohesion', 'angle_frottement',
+            )
+        },
+    }
+    ordering_fields = ['calcule_le', 'indice_cbr', 'densite_seche_max', 'coefficient_uniformite', 'angle_frottement']
+    
+    @action(detail=False, methods=['get'])
+    def analyses(self, request):
+        """
+        Agrégats d'une grandeur calculés en SQL (nombre, moyenne, min, max, percentiles)
+        
+        GET /api/resultats-calcules/analyses/?metrique=indice_cbr&min=30&client=<id>
+            &depuis=2026-01-01&grouper=client|nature|profondeur|type|annee
+            &pas_profondeur=1&percentiles=10,50,90
+        metrique: grandeur calculée (indice_cbr, densite_seche_max...) ou valeur
+        saisie dans resultats, sous son nom normalisé (teneur_en_eau).
+        """
+        try:
+            return Response(analyses_resultats.analyser(request.query_params))
+        except analyses_resultats.ParametreInvalide as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class NotificationViewSet(ConditionnelMixin, viewsets.ModelViewSet):
     """ViewSet pour les notifications"""
     
     serializer_class = NotificationSerializer
+    pagination_class = PaginationCurseur
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['type', 'read', 'action_required']
     ordering_fields = ['created_at']
+    compteurs_modification = {'non_lues': Q(read=False)}
     
     def get_queryset(self):
         """Retourne uniquement les notifications de l'utilisateur connecté"""
@@ -865,6 +1291,148 @@ class ValidationHistoryViewSet(viewsets.ModelViewSet):
     ordering_fields = ['created_at']
 
 
+class SyncViewSet(viewsets.ViewSet):
+    """Synchronisation différentielle (échantillons, essais, workflows, notifications)"""
+    
+    permission_classes = [IsAuthenticated]
+    
+    def list(self, request):
+        """
+        Retourne les changements depuis un jeton
+        
+        GET /api/sync/?since=<jeton>
+        Sans jeton: état complet. Réponse: jeton à renvoyer au prochain appel,
+        objets modifiés et identifiants supprimés par collection.
+        """
+        try:
+            return Response(synchronisation.changements(request.user, request.query_params.get('since'), request))
+        except synchronisation.JetonInvalide:
+            return Response(
+                {'error': 'Jeton de synchronisation invalide'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+
+class BlobViewSet(viewsets.ViewSet):
+    """Téléchargement en flux des fichiers de rapports (adressés par SHA-256)"""
+    
+    # Authentification par JWT ou par le jeton signé des URL renvoyées par l'API
+    permission_classes = [AllowAny]
+    lookup_value_regex = '[0-9a-f]{64}'
+    
+    def retrieve(self, request, pk=None):
+        """
+        GET /api/blobs/<sha256>/?jeton=...&nom=rapport.pdf
+        Le contenu d'un blob ne change jamais: il peut être gardé en cache.
+        Requêtes conditionnelles et partielles (Range) prises en charge.
+        """
+        if not request.user.is_authenticated and not blobs.jeton_valide(pk, request.query_params.get('jeton')):
+            return Response(
+                {'error': 'Authentification requise ou lien expiré'},
+                status=status.HTTP_401_UNAUTHORIZED
+            )
+        
+        blob = Blob.objects.filter(pk=pk).first()
+        if blob is None:
+            return Response(
+                {'error': 'Fichier non trouvé'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        return reponse_fichier(
+            request, blob,
+            nom=request.query_params.get('nom'),
+            attachment=request.query_params.get('attachment') in ('1', 'true'),
+            immuable=True,
+        )
+
+
+class MiniatureViewSet(viewsets.ViewSet):
+    """Miniatures des photos d'échantillons et de clients, générées à la première demande"""
+    
+    # Comme /media/: les balises <img> n'envoient pas d'en-tête Authorization
+    permission_classes = [AllowAny]
+    lookup_value_regex = '.+'
+    
+    def retrieve(self, request, pk=None):
+        """
+        GET /api/miniatures/<nom de la photo>/?taille=liste
+        Le nom d'une photo change à chaque remplacement: la réponse peut être
+        gardée en cache sans revalidation.
+        """
+        taille = request.query_params.get('taille', photos.MINIATURE_LISTE)
+        if taille not in photos.TAILLES_MINIATURES:
+            return Response(
+                {'error': f"Taille inconnue (valeurs: {', '.join(photos.TAILLES_MINIATURES)})"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if not photos.photo_connue(pk):
+            return Response(
+                {'error': 'Photo non trouvée'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        try:
+            chemin = photos.miniature(pk, taille)
+        except FileNotFoundError:
+            return Response(
+                {'error': 'Photo non trouvée'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        except photos.PhotoInvalide:
+            return Response(
+                {'error': "Le fichier n'est pas une image lisible"},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        
+        reponse = FileResponse(default_storage.open(chemin, 'rb'), content_type='image/jpeg')
+        patch_cache_control(reponse, public=True, max_age=31536000, immutable=True)
+        return reponse
+
+
+def reponse_rendu(request, blob):
+    """Description d'un PDF prêt: empreinte, taille et lien de téléchargement"""
+    return {
+        'statut': 'pret',
+        'sha256': blob.sha256,
+        'taille': blob.taille,
+        'file_url': url_telechargement(blob.sha256, request),
+    }
+
+
+def reponse_tache(request, tache):
+    return {
+        'statut': 'en_cours',
+        'tache': tache.id,
+        'suivi': request.build_absolute_uri(reverse('tache-detail', args=[tache.id])),
+    }
+
+
+class TacheViewSet(viewsets.ViewSet):
+    """Suivi des tâches Celery lancées par l'API (rendus PDF...)"""
+    
+    permission_classes = [IsAuthenticated]
+    
+    def retrieve(self, request, pk=None):
+        """
+        GET /api/taches/<id>/
+        etat: PENDING, STARTED, PROGRESS, SUCCESS, FAILURE...
+        """
+        tache = AsyncResult(pk)
+        donnees = {'tache': pk, 'etat': tache.state}
+        if tache.state == 'PROGRESS':
+            donnees['progression'] = tache.info
+        elif tache.successful():
+            resultat = tache.result
+            donnees['resultat'] = resultat
+            if isinstance(resultat, dict) and resultat.get('sha256'):
+                donnees['file_url'] = url_telechargement(resultat['sha256'], request)
+        elif tache.failed():
+            donnees['erreur'] = str(tache.result)
+        return Response(donnees)
+
+
 class DashboardViewSet(viewsets.ViewSet):
     """ViewSet pour les statistiques du dashboard"""
     
@@ -872,68 +1440,16 @@ class DashboardViewSet(viewsets.ViewSet):
     
     @action(detail=False, methods=['get'])
     def stats(self, request):
-        """Retourne les statistiques globales"""
-        
-        # Échantillons
-        total_echantillons = Echantillon.objects.count()
-        echantillons_en_cours = Echantillon.objects.filter(
-            statut__in=['stockage', 'essais', 'decodification', 'traitement', 'validation']
-        ).count()
-        echantillons_termines = Echantillon.objects.filter(statut='valide').count()
-        echantillons_urgents = Echantillon.objects.filter(priorite='urgente').count()
-        
-        # Essais
-        essais_en_attente = Essai.objects.filter(statut='attente').count()
-        essais_en_cours = Essai.objects.filter(statut='en_cours').count()
-        essais_termines = Essai.objects.filter(statut='termine').count()
-        
-        # Clients
-        clients_actifs = Client.objects.filter(
-            echantillons__created_at__gte=timezone.now() - timedelta(days=30)
-        ).distinct().count()
-        
-        # Délais
-        echantillons_finis = Echantillon.objects.filter(
-            statut='valide',
-            date_fin_estimee__isnull=False
+        """Retourne les statistiques globales (instantané rafraîchi périodiquement)"""
+        stats = stats_dashboard()
+        
+        # L'instantané ne change qu'au recalcul: sa date sert de validateur
+        return reponse_conditionnelle(
+            request,
+            quote_etag(str(stats['genere_le'].timestamp())),
+            stats['genere_le'],
+            lambda: Response(DashboardStatsSerializer(stats).data)
         )
-        
-        delai_moyen = 0
-        taux_respect = 0
-        
-        if echantillons_finis.exists():
-            delais = []
-            respectes = 0
-            
-            for ech in echantillons_finis:
-                if ech.created_at and ech.date_fin_estimee:
-                    delai = (ech.date_fin_estimee - ech.created_at.date()).days
-                    delais.append(delai)
-                    
-                    # Vérifier si le délai a été respecté
-                    # (Simplifié ici, devrait comparer avec la date réelle de fin)
-                    if delai <= 30:  # Exemple: 30 jours max
-                        respectes += 1
-            
-            if delais:
-                delai_moyen = sum(delais) / len(delais)
-                taux_respect = (respectes / len(delais)) * 100
-        
-        stats = {
-            'total_echantillons': total_echantillons,
-            'echantillons_en_cours': echantillons_en_cours,
-            'echantillons_termines': echantillons_termines,
-            'echantillons_urgents': echantillons_urgents,
-            'essais_en_attente': essais_en_attente,
-            'essais_en_cours': essais_en_cours,
-            'essais_termines': essais_termines,
-            'clients_actifs': clients_actifs,
-            'delai_moyen_traitement': round(delai_moyen, 2),
-            'taux_respect_delais': round(taux_respect, 2),
-        }
-        
-        serializer = DashboardStatsSerializer(stats)
-        return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
     def my_tasks(self, request):
@@ -986,6 +1502,26 @@ class DashboardViewSet(viewsets.ViewSet):
         charge = compter_echantillons_en_attente()
         return Response(charge)
     
+    @action(detail=False, methods=['get'])
+    def prevision_charge(self, request):
+        """
+        Projette la charge par type d'essai et par jour sur les prochaines semaines
+        
+        GET /api/dashboard/prevision_charge/?semaines=4
+        """
+        try:
+            semaines = int(request.query_params.get('semaines', 4))
+        except ValueError:
+            semaines = 0
+        
+        if not 1 <= semaines <= 12:
+            return Response(
+                {'error': 'Le nombre de semaines doit être compris entre 1 et 12'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response(prevoir_charge_cache(semaines))
+    
     @action(detail=False, methods=['post'])
     def sync_localStorage(self, request):
         """Synchronise les données localStorage avec le backend"""
@@ -1236,22 +1772,131 @@ class CapaciteLaboratoireViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        capacites = {}
-        for capacite in self.get_queryset():
-            # Calculer la capacité utilisée pour cette date
-            utilise = PlanificationEssai.objects.filter(
-                essai__type=capacite.type_essai,
-                date_planifiee=date_obj
-            ).count()
-            
-            capacites[capacite.type_essai] = {
-                'capacite_totale': capacite.capacite_quotidienne,
-                'capacite_utilisee': utilise,
-                'capacite_disponible': capacite.capacite_quotidienne - utilise
+        types = list(self.filter_queryset(self.get_queryset()).values_list('type_essai', flat=True))
+        if not types:
+            return Response({})
+        
+        jour = calendrier_capacite(date_obj, date_obj, types, source='planifications')[0]
+        
+        capacites = {
+            type_essai: {
+                'capacite_totale': valeurs['capacite_totale'],
+                'capacite_utilisee': valeurs['capacite_utilisee'],
+                'capacite_disponible': valeurs['capacite_totale'] - valeurs['capacite_utilisee']
             }
+            for type_essai, valeurs in jour['capacites'].items()
+        }
         
         return Response(capacites)
     
+    @action(detail=False, methods=['get'])
+    def calendrier(self, request):
+        """
+        Retourne la matrice de capacité jour × type d'essai
+        
+        GET /api/capacites/calendrier/?date_debut=2025-11-01&date_fin=2025-11-30
+        GET /api/capacites/calendrier/?mois=2025-11&type_essai=CBR
+        """
+        mois = request.query_params.get('mois')
+        
+        try:
+            if mois:
+                date_debut = timezone.datetime.strptime(mois, '%Y-%m').date()
+                date_fin = (date_debut + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+            else:
+                date_debut = parse_date(request.query_params.get('date_debut', ''))
+                date_fin = parse_date(request.query_params.get('date_fin', ''))
+                if not date_debut or not date_fin:
+                    raise ValueError
+        except ValueError:
+            return Response(
+                {'error': 'Paramètre mois (YYYY-MM) ou date_debut et date_fin (YYYY-MM-DD) requis'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if date_fin < date_debut:
+            return Response(
+                {'error': 'La date de fin doit être postérieure à la date de début'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if (date_fin - date_debut).days >= MAX_JOURS_CALENDRIER:
+            return Response(
+                {'error': f'La période ne peut pas dépasser {MAX_JOURS_CALENDRIER} jours'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        type_essai = request.query_params.get('type_essai')
+        types = [type_essai] if type_essai else None
+        
+        jours = calendrier_capacite(date_debut, date_fin, types)
+        
+        return Response({
+            'date_debut': date_debut.strftime('%Y-%m-%d'),
+            'date_fin': date_fin.strftime('%Y-%m-%d'),
+            'types': list(jours[0]['capacites'].keys()),
+            'jours': [
+                {
+                    'date': jour['date'].strftime('%Y-%m-%d'),
+                    'ouvrable': jour['ouvrable'],
+                    'capacites': jour['capacites'],
+                }
+                for jour in jours
+            ]
+        })
+    
+    @action(detail=False, methods=['post'])
+    def reserver(self, request):
+        """
+        Réserve temporairement de la capacité pendant la préparation d'un envoi
+        
+        POST /api/capacites/reserver/
+        {"type_essai": "CBR", "date": "2025-11-10", "quantite": 2}
+        """
+        type_essai = request.data.get('type_essai')
+        date_obj = parse_date(request.data.get('date') or '')
+        
+        if not type_essai or not date_obj:
+            return Response(
+                {'error': 'Type d\'essai et date (YYYY-MM-DD) requis'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            quantite = int(request.data.get('quantite', 1))
+            if quantite < 1:
+                raise ValueError
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'Quantité invalide'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            reservation = reservations.reserver(type_essai, date_obj, quantite, user=request.user)
+        except CapaciteAtteinte as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        
+        serializer = ReservationCapaciteSerializer(reservation)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    
+    @action(detail=False, methods=['post'])
+    def liberer(self, request):
+        """Libère une réservation temporaire (brouillon abandonné)"""
+        try:
+            reservation = ReservationCapacite.objects.get(id=request.data.get('reservation_id'))
+        except (ReservationCapacite.DoesNotExist, DjangoValidationError):
+            return Response(
+                {'error': 'Réservation non trouvée'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        reservations.liberer(reservation)
+        reservation.refresh_from_db()
+        
+        serializer = ReservationCapaciteSerializer(reservation)
+        return Response(serializer.data)
+    
     @action(detail=False, methods=['get'])
     def check(self, request):
         """Vérifie si la capacité est disponible pour un type d'essai à une date donnée"""
@@ -1274,30 +1919,21 @@ class CapaciteLaboratoireViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Récupérer la capacité pour ce type d'essai
-        capacite = CapaciteLaboratoire.objects.filter(type_essai=type_essai).first()
+        capacite = capacite_du_jour(type_essai, date_obj)
         
-        if not capacite:
+        if capacite['capacite_totale'] is None:
             # Si pas de capacité définie, autoriser l'envoi
             return Response({
                 'disponible': True,
                 'message': 'Aucune limite de capacité définie'
             })
         
-        # Compter les essais déjà planifiés pour cette date
-        essais_planifies = Essai.objects.filter(
-            type=type_essai,
-            date_reception=date_obj
-        ).count()
-        
-        disponible = essais_planifies < capacite.capacite_quotidienne
-        
         return Response({
-            'disponible': disponible,
-            'capacite_totale': capacite.capacite_quotidienne,
-            'capacite_utilisee': essais_planifies,
-            'capacite_restante': max(0, capacite.capacite_quotidienne - essais_planifies),
-            'message': 'Capacité disponible' if disponible else 'Capacité atteinte'
+            'disponible': capacite['disponible'],
+            'capacite_totale': capacite['capacite_totale'],
+            'capacite_utilisee': capacite['capacite_utilisee'],
+            'capacite_restante': capacite['capacite_restante'],
+            'message': 'Capacité disponible' if capacite['disponible'] else 'Capacité atteinte'
         })
     
     @action(detail=False, methods=['get'])
@@ -1311,58 +1947,43 @@ class CapaciteLaboratoireViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Récupérer la capacité pour ce type d'essai
-        capacite = CapaciteLaboratoire.objects.filter(type_essai=type_essai).first()
+        # Commencer à partir de demain
+        demain = timezone.now().date() + timedelta(days=1)
+        max_jours = 30  # Chercher jusqu'à 30 jours dans le futur
+        
+        date_disponible, capacite = chercher_prochaine_date(type_essai, demain, max_jours)
         
-        if not capacite:
+        if capacite and capacite['capacite_totale'] is None:
             # Si pas de capacité définie, retourner demain
-            demain = timezone.now().date() + timedelta(days=1)
             return Response({
                 'date_disponible': demain.strftime('%Y-%m-%d'),
                 'message': 'Aucune limite de capacité définie'
             })
         
-        # Commencer à partir de demain
-        date_test = timezone.now().date() + timedelta(days=1)
-        max_jours = 30  # Chercher jusqu'à 30 jours dans le futur
-        
-        for _ in range(max_jours):
-            # Ignorer les weekends
-            if date_test.weekday() >= 5:  # 5 = samedi, 6 = dimanche
-                date_test += timedelta(days=1)
-                continue
-            
-            # Compter les essais déjà planifiés pour cette date
-            essais_planifies = Essai.objects.filter(
-                type=type_essai,
-                date_reception=date_test
-            ).count()
-            
-            # Vérifier si la capacité est disponible
-            if essais_planifies < capacite.capacite_quotidienne:
-                return Response({
-                    'date_disponible': date_test.strftime('%Y-%m-%d'),
-                    'capacite_totale': capacite.capacite_quotidienne,
-                    'capacite_utilisee': essais_planifies,
-                    'capacite_restante': capacite.capacite_quotidienne - essais_planifies,
-                    'message': f'Prochaine date disponible trouvée'
-                })
-            
-            date_test += timedelta(days=1)
+        if date_disponible:
+            return Response({
+                'date_disponible': date_disponible.strftime('%Y-%m-%d'),
+                'capacite_totale': capacite['capacite_totale'],
+                'capacite_utilisee': capacite['capacite_utilisee'],
+                'capacite_restante': capacite['capacite_restante'],
+                'message': f'Prochaine date disponible trouvée'
+            })
         
         # Si aucune date trouvée dans les 30 jours, retourner dans 30 jours
         return Response({
-            'date_disponible': date_test.strftime('%Y-%m-%d'),
+            'date_disponible': (demain + timedelta(days=max_jours)).strftime('%Y-%m-%d'),
             'message': 'Aucune date disponible dans les 30 prochains jours, date suggérée par défaut'
         })
 
 
 # Mixin pour les workflows rejetés
-class WorkflowValidationViewSet(viewsets.ModelViewSet):
+class WorkflowValidationViewSet(ListeAlegeeMixin, TelechargementMixin, ConditionnelMixin, viewsets.ModelViewSet):
     """ViewSet pour le workflow de validation"""
     
-    queryset = WorkflowValidation.objects.select_related('echantillon', 'created_by')
+    queryset = WorkflowValidation.objects.select_related('echantillon', 'created_by', 'fichier')
     serializer_class = WorkflowValidationSerializer
+    serializer_liste_class = WorkflowValidationListSerializer
+    actions_liste = ('list', 'par_etape')
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['etape_actuelle', 'statut', 'code_echantillon']
@@ -1377,8 +1998,10 @@ class WorkflowValidationViewSet(viewsets.ModelViewSet):
         else:
             workflows = self.get_queryset().filter(statut='en_attente')
         
-        serializer = self.get_serializer(workflows, many=True)
-        return Response(serializer.data)
+        return self.conditionnel(
+            request, workflows,
+            lambda: Response(self.get_serializer(workflows, many=True).data)
+        )
     
     @action(detail=True, methods=['post'])
     def valider_chef_projet(self, request, pk=None):
@@ -1461,6 +2084,39 @@ class WorkflowValidationViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(workflow)
         return Response(serializer.data)
     
+    @action(detail=True, methods=['post'])
+    def signer_pdf(self, request, pk=None):
+        """
+        Appose la signature sur le PDF du workflow, côté serveur
+        
+        Body: {"signature": "<image base64 / data URL>"}. La signature est
+        surimprimée sur le PDF existant (sans nouveau rendu) par un worker;
+        le résultat remplace le fichier du workflow. Un PDF déjà signé est
+        re-signé à partir de sa version non signée.
+        """
+        workflow = self.get_object()
+        signature = request.data.get('signature')
+        
+        if not signature or not workflow.fichier_id:
+            return Response(
+                {'error': 'Signature et fichier du workflow requis'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if workflow.fichier.type_mime == blobs.TYPE_URL:
+            return Response(
+                {'error': "Le fichier du workflow est un lien, pas un PDF stocké"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            rendu_rapports.verifier_signature(signature)
+        except rendu_rapports.SignatureInvalide as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        tache = signer_rapport_workflow.delay(str(workflow.pk), signature)
+        return Response(reponse_tache(request, tache), status=status.HTTP_202_ACCEPTED)
+    
     @action(detail=True, methods=['post'])
     def aviser_directeur_snertp(self, request, pk=None):
         workflow = self.get_object()
@@ -1494,11 +2150,18 @@ class WorkflowValidationViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class RapportMarketingViewSet(viewsets.ModelViewSet):
+class RapportMarketingViewSet(ListeAlegeeMixin, TelechargementMixin, viewsets.ModelViewSet):
     """ViewSet pour les rapports marketing"""
     
-    queryset = RapportMarketing.objects.select_related('echantillon', 'echantillon__client')
+    fichiers_telechargeables = {
+        '': ('fichier', 'file_name'),
+        'signe': ('rapport_signe', 'file_name'),
+    }
+    
+    queryset = RapportMarketing.objects.select_related('echantillon', 'echantillon__client', 'fichier', 'rapport_signe')
     serializer_class = RapportMarketingSerializer
+    serializer_liste_class = RapportMarketingListSerializer
+    actions_liste = ('list', 'en_attente')
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['statut', 'code_echantillon']
@@ -1506,8 +2169,8 @@ class RapportMarketingViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def en_attente(self, request):
-        """Retourne les rapports en attente d'envoi"""
-        rapports = self.get_queryset().filter(statut='en_attente')
+        """Retourne les rapports en attente d'envoi (hors envois en file)"""
+        rapports = self.get_queryset().filter(statut='en_attente').exclude(statut_envoi__in=envoi_rapports.STATUTS_EN_COURS)
         serializer = self.get_serializer(rapports, many=True)
         return Response(serializer.data)
     
@@ -1532,14 +2195,22 @@ class RapportMarketingViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Créer le rapport marketing
+        try:
+            rapport_signe = blobs.stocker(signed_report_data)
+        except blobs.ContenuInvalide:
+            return Response(
+                {'error': 'signed_report_data invalide'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Créer le rapport marketing (le fichier est référencé, pas copié)
         rapport = RapportMarketing.objects.create(
             echantillon=workflow.echantillon,
             code_echantillon=workflow.code_echantillon,
             client_name=workflow.client_name,
             file_name=workflow.file_name,
-            file_data=signed_report_data or workflow.file_data,  # Utiliser le PDF signé si disponible
-            signed_report_data=signed_report_data or '',  # Stocker aussi dans signed_report_data
+            fichier=rapport_signe or workflow.fichier,  # Utiliser le PDF signé si disponible
+            rapport_signe=rapport_signe,
             signature_directeur_snertp=signature or '',
             statut='en_attente'
         )
@@ -1548,7 +2219,7 @@ class RapportMarketingViewSet(viewsets.ModelViewSet):
         workflow.etape_actuelle = 'marketing'
         workflow.date_envoi_marketing = timezone.now()
         workflow.signature_directeur_snertp = signature or ''
-        workflow.file_data = signed_report_data or workflow.file_data  # Remplacer le PDF original
+        workflow.fichier = rapport_signe or workflow.fichier  # Remplacer le PDF original
         workflow.save()
         
         serializer = self.get_serializer(rapport)
@@ -1556,7 +2227,12 @@ class RapportMarketingViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['post'])
     def envoyer_client(self, request, pk=None):
-        """Envoyer le rapport au client par email avec PDF en pièce jointe"""
+        """
+        Envoyer le rapport au client par email avec PDF en pièce jointe
+        
+        L'email est mis en file et envoyé par un worker Celery; statut_envoi
+        suit la livraison (en_file, en_cours, envoye, echec).
+        """
         rapport = self.get_object()
         email_client = request.data.get('email_client')
         
@@ -1566,82 +2242,41 @@ class RapportMarketingViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Préparer l'email
-        from django.core.mail import EmailMessage
-        from django.conf import settings
-        import base64
-        
-        subject = f'Rapport d\'essai SNERTP - {rapport.code_echantillon}'
-        message = f"""
-Bonjour,
-
-Veuillez trouver ci-joint le rapport d'essai pour l'échantillon {rapport.code_echantillon}.
-
-Client: {rapport.client_name}
-Date: {rapport.date_envoi_marketing.strftime('%d/%m/%Y %H:%M') if rapport.date_envoi_marketing else 'N/A'}
-
-Cordialement,
-Service Marketing - SNERTP
-Centre National d'Essais et de Recherches des Travaux Publics
-        """
-        
-        email = EmailMessage(
-            subject=subject,
-            body=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[email_client],
-        )
-        
-        # Attacher le PDF si disponible
-        if rapport.file_data:
-            try:
-                # Extraire le PDF du base64
-                if rapport.file_data.startswith('data:'):
-                    # Format: data:application/pdf;base64,<data>
-                    pdf_data = rapport.file_data.split(',')[1]
-                else:
-                    pdf_data = rapport.file_data
-                
-                pdf_bytes = base64.b64decode(pdf_data)
-                email.attach(
-                    f'Rapport_{rapport.code_echantillon}.pdf',
-                    pdf_bytes,
-                    'application/pdf'
-                )
-            except Exception as e:
-                print(f"Erreur lors de l'attachement du PDF: {e}")
-        
-        # Envoyer l'email
-        try:
-            email.send(fail_silently=False)
-        except Exception as e:
+        if not envoi_rapports.mettre_en_file([rapport], email_client):
             return Response(
-                {'error': f'Erreur lors de l\'envoi de l\'email: {str(e)}'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {'error': 'Envoi déjà en cours pour ce rapport'},
+                status=status.HTTP_409_CONFLICT
             )
         
-        # Mettre à jour le statut
-        rapport.statut = 'envoye'
-        rapport.email_client = email_client
-        rapport.date_envoi_client = timezone.now()
-        rapport.save()
-        
-        # Mettre à jour le workflow associé
-        workflow = WorkflowValidation.objects.filter(
-            code_echantillon=rapport.code_echantillon
-        ).first()
-        if workflow:
-            workflow.etape_actuelle = 'client'
-            workflow.date_envoi_client = timezone.now()
-            workflow.email_client = email_client
-            workflow.save()
-        
         serializer = self.get_serializer(rapport)
         return Response({
             'status': 'success',
-            'message': f'Email envoyé à {email_client}',
+            'message': f'Email en cours d\'envoi à {email_client}',
             'rapport': serializer.data
-        })
+        }, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=False, methods=['post'])
+    def envoyer_tous(self, request):
+        """
+        Mettre en file l'envoi de tous les rapports en attente (ou en échec)
+        
+        Destinataire: email_client du rapport, à défaut celui du client.
+        """
+        a_envoyer, sans_email = [], []
+        for rapport in envoi_rapports.rapports_a_envoyer():
+            email_client = rapport.email_client or rapport.echantillon.client.email
+            if not email_client:
+                sans_email.append(rapport.code_echantillon)
+                continue
+            rapport.email_client = email_client
+            a_envoyer.append(rapport)
+        
+        nombre = envoi_rapports.mettre_en_file(a_envoyer)
+        return Response({
+            'status': 'success',
+            'mis_en_file': nombre,
+            'sans_email': sans_email,
+        }, status=status.HTTP_202_ACCEPTED)
 """
 Views pour les logs d'actions
 """
@@ -1663,6 +2298,7 @@ class ActionLogViewSet(viewsets.ReadOnlyModelViewSet):
     
     queryset = ActionLog.objects.all()
     serializer_class = ActionLogSerializer
+    pagination_class = PaginationCurseur
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
@@ -1939,12 +2575,18 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.utils import timezone
-from .serializers import RapportValidationSerializer, EssaiDataSerializer, PlanificationDataSerializer
+from .serializers import RapportValidationSerializer, RapportValidationListSerializer, EssaiDataSerializer, PlanificationDataSerializer
 
 
-class RapportValidationViewSet(viewsets.ModelViewSet):
-    queryset = RapportValidation.objects.all()
+class RapportValidationViewSet(ListeAlegeeMixin, TelechargementMixin, ConditionnelMixin, viewsets.ModelViewSet):
+    fichiers_telechargeables = {
+        '': ('fichier', 'file_name'),
+        'original': ('fichier_original', 'original_file_name'),
+    }
+    queryset = RapportValidation.objects.select_related('fichier', 'fichier_original')
     serializer_class = RapportValidationSerializer
+    serializer_liste_class = RapportValidationListSerializer
+    actions_liste = ('list', 'by_etape', 'by_code', 'rejetes', 'valides')
     permission_classes = [IsAuthenticated]
     
     @action(detail=False, methods=['get'])
@@ -1953,15 +2595,17 @@ class RapportValidationViewSet(viewsets.ModelViewSet):
         etape = request.query_params.get('etape')
         status_filter = request.query_params.get('status', 'pending')
         
-        queryset = self.queryset.filter(etape_actuelle=etape, status=status_filter)
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        queryset = self.get_queryset().filter(etape_actuelle=etape, status=status_filter)
+        return self.conditionnel(
+            request, queryset,
+            lambda: Response(self.get_serializer(queryset, many=True).data)
+        )
     
     @action(detail=False, methods=['get'])
     def by_code(self, request):
         """Récupérer les rapports par code échantillon"""
         code = request.query_params.get('code')
-        queryset = self.queryset.filter(code_echantillon=code)
+        queryset = self.get_queryset().filter(code_echantillon=code)
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
     
@@ -2061,14 +2705,14 @@ class RapportValidationViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def rejetes(self, request):
         """Récupérer tous les rapports rejetés"""
-        queryset = self.queryset.filter(status='rejected')
+        queryset = self.get_queryset().filter(status='rejected')
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
     def valides(self, request):
         """Récupérer tous les rapports validés"""
-        queryset = self.queryset.filter(
+        queryset = self.get_queryset().filter(
             validated_by_directeur_technique=True,
             status='accepted'
         )
@@ -2148,14 +2792,17 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 
-from .serializers import RapportArchiveSerializer
+from .serializers import RapportArchiveSerializer, RapportArchiveListSerializer
 
 
-class RapportArchiveViewSet(viewsets.ModelViewSet):
+class RapportArchiveViewSet(ListeAlegeeMixin, TelechargementMixin, viewsets.ModelViewSet):
     """ViewSet pour l'archivage des rapports"""
     
-    queryset = RapportArchive.objects.select_related('envoye_par')
+    queryset = RapportArchive.objects.select_related('envoye_par', 'fichier')
     serializer_class = RapportArchiveSerializer
+    serializer_liste_class = RapportArchiveListSerializer
+    actions_liste = ('list', 'mes_archives')
+    champ_signature = None
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['etape_envoi', 'code_echantillon', 'envoye_par']
@@ -2165,13 +2812,14 @@ class RapportArchiveViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """Filtrer selon le rôle de l'utilisateur"""
         user = self.request.user
+        queryset = super().get_queryset()
         
         # Chef projet voit ses propres rapports archivés
         if user.role == 'chef_projet':
-            return self.queryset.filter(envoye_par=user)
+            return queryset.filter(envoye_par=user)
         
         # Autres rôles voient tous les rapports
-        return self.queryset
+        return queryset
     
     @action(detail=False, methods=['post'])
     def archiver_rapport(self, request):
@@ -2189,11 +2837,19 @@ class RapportArchiveViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        try:
+            fichier = blobs.stocker(file_data)
+        except blobs.ContenuInvalide:
+            return Response(
+                {'error': 'file_data invalide'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
         archive = RapportArchive.objects.create(
             code_echantillon=code_echantillon,
             client_name=client_name,
             file_name=file_name,
-            file_data=file_data,
+            fichier=fichier,
             etape_envoi=etape_envoi,
             commentaires=commentaires,
             envoye_par=request.user
@@ -2238,36 +2894,29 @@ class CapaciteViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Récupérer la capacité pour ce type d'essai
-        capacite = CapaciteLaboratoire.objects.filter(type_essai=type_essai).first()
+        capacite = capacite_du_jour(type_essai, date_obj)
         
-        if not capacite:
+        if capacite['capacite_totale'] is None:
             return Response({
                 'disponible': True,
                 'message': 'Aucune limite de capacité définie'
             })
         
-        # Compter les essais déjà planifiés pour cette date
-        essais_planifies = Essai.objects.filter(
-            type=type_essai,
-            date_reception=date_obj
-        ).count()
-        
-        disponible = essais_planifies < capacite.capacite_quotidienne
-        
         return Response({
-            'disponible': disponible,
-            'capacite_totale': capacite.capacite_quotidienne,
-            'capacite_utilisee': essais_planifies,
-            'capacite_restante': max(0, capacite.capacite_quotidienne - essais_planifies),
-            'message': 'Capacité disponible' if disponible else 'Capacité atteinte, veuillez patienter.'
+            'disponible': capacite['disponible'],
+            'capacite_totale': capacite['capacite_totale'],
+            'capacite_utilisee': capacite['capacite_utilisee'],
+            'capacite_restante': capacite['capacite_restante'],
+            'message': 'Capacité disponible' if capacite['disponible'] else 'Capacité atteinte, veuillez patienter.'
         })
     
     @action(detail=False, methods=['post'])
     def retarder_echantillon(self, request):
         """Retarder un échantillon et recalculer les dates"""
+        from .reprogrammation_helper import JOURS_RETARD_DEFAUT, reprogrammer_echantillons
+        
         echantillon_id = request.data.get('echantillon_id')
-        nouveau_delai = request.data.get('nouveau_delai', 4)  # jours
+        nouveau_delai = request.data.get('nouveau_delai', JOURS_RETARD_DEFAUT)  # jours
         
         try:
             echantillon = Echantillon.objects.get(id=echantillon_id)
@@ -2277,32 +2926,13 @@ class CapaciteViewSet(viewsets.ViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Calculer la nouvelle date d'envoi
-        nouvelle_date = timezone.now().date() + timedelta(days=nouveau_delai)
-        
-        # Mettre à jour les dates d'envoi selon les types d'essais
-        if 'AG' in (echantillon.essais_types or []):
-            echantillon.date_envoi_ag = nouvelle_date
-        if 'Proctor' in (echantillon.essais_types or []):
-            echantillon.date_envoi_proctor = nouvelle_date
-        if 'CBR' in (echantillon.essais_types or []):
-            echantillon.date_envoi_cbr = nouvelle_date
-        if 'Oedometre' in (echantillon.essais_types or []):
-            echantillon.date_envoi_oedometre = nouvelle_date
-        if 'Cisaillement' in (echantillon.essais_types or []):
-            echantillon.date_envoi_cisaillement = nouvelle_date
-        
-        # Recalculer la date de retour prédite
-        durees = {'AG': 5, 'Proctor': 5, 'CBR': 9, 'Oedometre': 18, 'Cisaillement': 4}
-        duree_max = max([durees.get(essai, 0) for essai in (echantillon.essais_types or [])] or [0])
-        echantillon.date_retour_predite = nouvelle_date + timedelta(days=duree_max + 2)
-        
-        echantillon.save()
+        resultat = reprogrammer_echantillons([echantillon.id], nouveau_delai)[0]
         
         return Response({
             'success': True,
-            'nouvelle_date_envoi': nouvelle_date,
-            'nouvelle_date_retour': echantillon.date_retour_predite,
+            'nouvelle_date_envoi': resultat['nouvelle_date_envoi'],
+            'nouvelle_date_retour': resultat['nouvelle_date_retour'],
+            'dates_envoi': resultat['dates_envoi'],
             'message': f'Échantillon retardé de {nouveau_delai} jours'
         })
     
@@ -2431,10 +3061,10 @@ class EssaiRejetesViewSet(viewsets.ViewSet):
 
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import Q
+from django.db.models import BooleanField, ExpressionWrapper, Q
 from django.utils import timezone
 from .models import WorkflowValidation
-from .serializers import WorkflowValidationSerializer
+from .serializers import WorkflowValidationSerializer, WorkflowValidationListSerializer
 
 class WorkflowRejetesViewSet(viewsets.ViewSet):
     """API pour gérer les workflows rejetés"""
@@ -2469,7 +3099,12 @@ class WorkflowRejetesViewSet(viewsets.ViewSet):
             statut='rejected'
         )
         
-        serializer = WorkflowValidationSerializer(workflows_rejetes, many=True)
+        serializer = WorkflowValidationListSerializer(
+            workflows_rejetes.select_related('fichier').defer('signature_directeur_snertp').annotate(
+                has_signature=ExpressionWrapper(~Q(signature_directeur_snertp=''), output_field=BooleanField())
+            ),
+            many=True, context={'request': request}
+        )
         return Response({'results': serializer.data})
     
     @action(detail=True, methods=['patch'])
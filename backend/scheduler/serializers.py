@@ -5,6 +5,7 @@ Serializers pour le module scheduler
 from rest_framework import serializers
 from .models import Ressource, ContrainteTemporelle, Planning, AffectationEssai
 from core.serializers import EssaiSerializer
+from .simulation import ARRIVEES_MAX, CHAMPS_SURCHARGES, TAUX_JOURNALIER_MAX, TYPES_ESSAIS
 
 
 class RessourceSerializer(serializers.ModelSerializer):
@@ -108,3 +109,76 @@ class OptimizationRequestSerializer(serializers.Serializer):
             )
         
         return data
+
+
+class SimulationRequestSerializer(serializers.Serializer):
+    """Serializer pour les requêtes de simulation de capacité"""
+    
+    date_debut = serializers.DateField()
+    date_fin = serializers.DateField()
+    source = serializers.ChoiceField(
+        choices=['historique', 'synthetique'],
+        required=False,
+        default='historique'
+    )
+    taux_journalier = serializers.FloatField(required=False, default=3.0, min_value=0, max_value=TAUX_JOURNALIER_MAX)
+    repartition = serializers.DictField(child=serializers.FloatField(), required=False)
+    taux_urgence = serializers.FloatField(required=False, default=0.1, min_value=0, max_value=1)
+    graine = serializers.IntegerField(required=False, allow_null=True, default=None)
+    politique = serializers.ChoiceField(
+        choices=['fifo', 'priorite', 'plus_court_dabord'],
+        required=False,
+        default='fifo'
+    )
+    scenarios = serializers.ListField(
+        child=serializers.DictField(),
+        required=False,
+        help_text="Liste de {nom, surcharges: {type: {capacite_simultanee, capacite_quotidienne, duree}}, politique}"
+    )
+    
+    def validate(self, data):
+        """Validation personnalisée"""
+        if data['date_fin'] < data['date_debut']:
+            raise serializers.ValidationError(
+                "La date de fin doit être postérieure à la date de début"
+            )
+        
+        # Vérifier que la période reste raisonnable (max 3 ans)
+        if (data['date_fin'] - data['date_debut']).days > 3 * 366:
+            raise serializers.ValidationError(
+                "La période ne peut pas dépasser 3 ans"
+            )
+        
+        # Arrivées synthétiques attendues (majorant: tous les jours comptés)
+        jours = (data['date_fin'] - data['date_debut']).days + 1
+        if data['source'] == 'synthetique' and data['taux_journalier'] * jours > ARRIVEES_MAX:
+            raise serializers.ValidationError(
+                f"Au plus {ARRIVEES_MAX} arrivées synthétiques: réduire le taux ou la période"
+            )
+        
+        if len(data.get('scenarios') or []) > 50:
+            raise serializers.ValidationError(
+                "Maximum 50 scénarios par simulation"
+            )
+        
+        return data
+    
+    def validate_scenarios(self, scenarios):
+        """Les surcharges sont des entiers strictement positifs par type d'essai connu"""
+        for scenario in scenarios:
+            surcharges = scenario.get('surcharges') or {}
+            if not isinstance(surcharges, dict):
+                raise serializers.ValidationError("surcharges doit être un objet {type: {...}}")
+            for type_essai, valeurs in surcharges.items():
+                if type_essai not in TYPES_ESSAIS:
+                    raise serializers.ValidationError(f"Type d'essai inconnu: {type_essai}")
+                if not isinstance(valeurs, dict):
+                    raise serializers.ValidationError(f"Surcharges de {type_essai}: objet attendu")
+                for champ, valeur in valeurs.items():
+                    if champ not in CHAMPS_SURCHARGES:
+                        raise serializers.ValidationError(f"Surcharge inconnue: {champ}")
+                    if isinstance(valeur, bool) or not isinstance(valeur, int) or valeur < 1:
+                        raise serializers.ValidationError(
+                            f"{type_essai}.{champ} doit être un entier strictement positif"
+                        )
+        return scenarios
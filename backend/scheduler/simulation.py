@@ -0,0 +1,331 @@
+"""
+Simulateur à événements discrets de la capacité du laboratoire
+Rejoue des arrivées d'échantillons (historiques ou synthétiques) contre des
+capacités et politiques d'ordonnancement configurables afin de comparer des
+scénarios (ex: une deuxième presse CBR, un banc Œdomètre supplémentaire)
+"""
+
+from datetime import timedelta
+import heapq
+import math
+import random
+import time
+
+from core.models import Echantillon, CapaciteLaboratoire
+from core.utils import DUREES_ESSAIS, CAPACITES_PAR_JOUR, est_weekend, est_jour_ferie
+from .models import Ressource
+
+
+TYPES_ESSAIS = ['AG', 'Proctor', 'CBR', 'Oedometre', 'Cisaillement']
+
+POLITIQUES = ['fifo', 'priorite', 'plus_court_dabord']
+
+# Paramètres de capacité modifiables par scénario
+CHAMPS_SURCHARGES = ['capacite_quotidienne', 'capacite_simultanee', 'duree']
+
+# Jours de traitement après le dernier essai (identique aux prédictions de core.utils)
+DELAI_TRAITEMENT = 2
+
+# Ordre de traitement des événements survenant le même jour
+EVT_FIN, EVT_ARRIVEE, EVT_JOUR = 0, 1, 2
+
+# Jours ouvrables simulés au plus après la dernière arrivée (files jamais vidées)
+MARGE_HORIZON = 260
+
+# Bornes des arrivées synthétiques (une requête ne doit pas occuper un worker indéfiniment)
+TAUX_JOURNALIER_MAX = 100
+ARRIVEES_MAX = 20000
+
+
+def percentile(valeurs, p):
+    """Percentile par interpolation linéaire sur une liste triée"""
+    if not valeurs:
+        return 0
+    if len(valeurs) == 1:
+        return valeurs[0]
+    rang = (len(valeurs) - 1) * p / 100
+    bas = math.floor(rang)
+    haut = math.ceil(rang)
+    return valeurs[bas] + (valeurs[haut] - valeurs[bas]) * (rang - bas)
+
+
+def charger_capacites(surcharges=None):
+    """
+    Construit la configuration de capacité par type d'essai
+
+    Priorité des sources: surcharges > ressources (équipements disponibles dont
+    le nom contient le type d'essai) > CapaciteLaboratoire > constantes de core.utils
+    """
+    config = {
+        type_essai: {
+            'capacite_quotidienne': CAPACITES_PAR_JOUR.get(type_essai, 1),
+            'capacite_simultanee': CAPACITES_PAR_JOUR.get(type_essai, 1),
+            'duree': DUREES_ESSAIS.get(type_essai, 5),
+        }
+        for type_essai in TYPES_ESSAIS
+    }
+
+    for capacite in CapaciteLaboratoire.objects.all():
+        # Une capacité nulle (type désactivé) ne serait jamais servie: valeurs par défaut
+        if capacite.type_essai not in config or capacite.capacite_quotidienne <= 0:
+            continue
+        config[capacite.type_essai].update({
+            'capacite_quotidienne': capacite.capacite_quotidienne,
+            'capacite_simultanee': capacite.capacite_simultanee or capacite.capacite_quotidienne,
+            'duree': max(1, capacite.duree_standard_jours),
+        })
+
+    equipements = Ressource.objects.filter(type='equipement', disponible=True).values_list('nom', 'capacite')
+    postes_par_type = {}
+    for nom, capacite in equipements:
+        for type_essai in TYPES_ESSAIS:
+            if type_essai.lower() in nom.lower():
+                postes_par_type[type_essai] = postes_par_type.get(type_essai, 0) + capacite
+    for type_essai, postes in postes_par_type.items():
+        if postes > 0:
+            config[type_essai]['capacite_simultanee'] = postes
+
+    for type_essai, valeurs in (surcharges or {}).items():
+        if type_essai in config:
+            config[type_essai].update(valeurs)
+
+    return config
+
+
+def charger_arrivees_historiques(date_debut, date_fin):
+    """Retourne les arrivées réelles [(date, types, urgente)] en une seule requête"""
+    lignes = Echantillon.objects.filter(
+        date_reception__gte=date_debut,
+        date_reception__lte=date_fin
+    ).order_by('date_reception', 'created_at').values_list('date_reception', 'essais_types', 'priorite')
+
+    return [
+        (date_reception, [t for t in (essais_types or []) if t in TYPES_ESSAIS], priorite == 'urgente')
+        for date_reception, essais_types, priorite in lignes
+    ]
+
+
+def generer_arrivees_synthetiques(date_debut, date_fin, taux_journalier, repartition=None,
+                                   taux_urgence=0.1, graine=None):
+    """
+    Génère des arrivées selon un processus de Poisson par jour ouvrable
+
+    La génération s'arrête à ARRIVEES_MAX arrivées.
+
+    Args:
+        taux_journalier: Nombre moyen d'échantillons reçus par jour ouvrable
+        repartition: Probabilité qu'un échantillon demande chaque type d'essai
+        taux_urgence: Proportion d'échantillons urgents
+        graine: Graine aléatoire pour des scénarios reproductibles
+    """
+    rng = random.Random(graine)
+    repartition = repartition or {'AG': 0.8, 'Proctor': 0.6, 'CBR': 0.5, 'Oedometre': 0.2, 'Cisaillement': 0.2}
+
+    arrivees = []
+    jour = date_debut
+    while jour <= date_fin and len(arrivees) < ARRIVEES_MAX:
+        if not est_weekend(jour) and not est_jour_ferie(jour):
+            # Tirage de Poisson par inter-arrivées exponentielles
+            nombre = 0
+            cumul = rng.expovariate(taux_journalier) if taux_journalier > 0 else 1
+            while cumul < 1 and nombre < ARRIVEES_MAX - len(arrivees):
+                nombre += 1
+                cumul += rng.expovariate(taux_journalier)
+
+            for _ in range(nombre):
+                types = [t for t, p in repartition.items() if t in TYPES_ESSAIS and rng.random() < p]
+                if not types:
+                    types = [max(repartition, key=repartition.get)]
+                arrivees.append((jour, types, rng.random() < taux_urgence))
+        jour += timedelta(days=1)
+
+    return arrivees
+
+
+class SimulateurLaboratoire:
+    """
+    Simulation à événements discrets au pas du jour ouvrable
+
+    Chaque type d'essai est une file servie par `capacite_simultanee` postes,
+    avec au plus `capacite_quotidienne` démarrages par jour. Un échantillon
+    lance un essai par type demandé; il est restitué quand tous ses essais sont
+    terminés, plus le délai de traitement.
+    """
+
+    def __init__(self, capacites, politique='fifo', delai_traitement=DELAI_TRAITEMENT):
+        if politique not in POLITIQUES:
+            raise ValueError(f"Politique inconnue: {politique}")
+
+        self.capacites = capacites
+        self.politique = politique
+        self.delai_traitement = delai_traitement
+
+    def _indexer_jours(self, date_debut, date_fin):
+        """Associe chaque date à son index de jour ouvrable (un jour fermé compte pour le suivant)"""
+        index = {}
+        ouvrables = 0
+        jour = date_debut
+        while jour <= date_fin:
+            index[jour] = ouvrables
+            if not est_weekend(jour) and not est_jour_ferie(jour):
+                ouvrables += 1
+            jour += timedelta(days=1)
+        return index
+
+    def _cle(self, echantillon, sequence):
+        if self.politique == 'priorite':
+            return (0 if echantillon['urgente'] else 1, sequence)
+        if self.politique == 'plus_court_dabord':
+            return (echantillon['travail'], sequence)
+        return (sequence,)
+
+    def executer(self, arrivees, horizon_jours=None):
+        """
+        Exécute la simulation
+
+        Args:
+            arrivees: Liste [(date_reception, types_essais, urgente)]
+            horizon_jours: Nombre de jours ouvrables simulés (par défaut jusqu'à vidage
+                des files, au plus MARGE_HORIZON jours après la dernière arrivée)
+        """
+        debut_calcul = time.perf_counter()
+
+        if not arrivees:
+            return self._rapport([], {}, 0, debut_calcul)
+
+        arrivees = sorted(arrivees, key=lambda a: a[0])
+        index_jours = self._indexer_jours(arrivees[0][0], arrivees[-1][0])
+        horizon_max = index_jours[arrivees[-1][0]] + MARGE_HORIZON
+        horizon_jours = horizon_max if horizon_jours is None else min(horizon_jours, horizon_max)
+
+        evenements = []
+        sequence = 0
+        echantillons = []
+        for date_reception, types, urgente in arrivees:
+            types = [t for t in types if t in self.capacites]
+            if not types:
+                continue
+            jour = index_jours[date_reception]
+            echantillons.append({
+                'arrivee': jour,
+                'urgente': urgente,
+                'restants': len(types),
+                'types': types,
+                'travail': max(self.capacites[t]['duree'] for t in types),
+            })
+            heapq.heappush(evenements, (jour, EVT_ARRIVEE, sequence, len(echantillons) - 1))
+            sequence += 1
+
+        files = {t: [] for t in self.capacites}
+        occupes = {t: 0 for t in self.capacites}
+        stats = {
+            t: {'longueurs': [], 'attentes': [], 'postes_jours': 0, 'traites': 0}
+            for t in self.capacites
+        }
+        delais = []
+        dernier_jour = -1
+
+        while evenements:
+            jour, nature, _, charge = heapq.heappop(evenements)
+            if jour >= horizon_jours:
+                break
+
+            if nature == EVT_FIN:
+                type_essai, indice = charge
+                occupes[type_essai] -= 1
+                echantillon = echantillons[indice]
+                echantillon['restants'] -= 1
+                if echantillon['restants'] == 0:
+                    delais.append(jour - echantillon['arrivee'] + self.delai_traitement)
+
+            elif nature == EVT_ARRIVEE:
+                echantillon = echantillons[charge]
+                for type_essai in echantillon['types']:
+                    heapq.heappush(files[type_essai], (self._cle(echantillon, sequence), jour, charge))
+                    sequence += 1
+
+            if jour != dernier_jour:
+                # Un seul tour d'affectation par jour, après les fins et arrivées du jour
+                heapq.heappush(evenements, (jour, EVT_JOUR, sequence, None))
+                sequence += 1
+                dernier_jour = jour
+                continue
+
+            if nature != EVT_JOUR:
+                continue
+
+            for type_essai, file in files.items():
+                capacite = self.capacites[type_essai]
+                demarres = 0
+                while (file and demarres < capacite['capacite_quotidienne']
+                       and occupes[type_essai] < capacite['capacite_simultanee']):
+                    _, jour_entree, indice = heapq.heappop(file)
+                    occupes[type_essai] += 1
+                    demarres += 1
+                    stats[type_essai]['traites'] += 1
+                    stats[type_essai]['attentes'].append(jour - jour_entree)
+                    stats[type_essai]['postes_jours'] += capacite['duree']
+                    heapq.heappush(evenements, (jour + capacite['duree'], EVT_FIN, sequence, (type_essai, indice)))
+                    sequence += 1
+                stats[type_essai]['longueurs'].append(len(file))
+
+            # Planifier le jour suivant tant qu'il reste du travail en file
+            if any(files.values()):
+                heapq.heappush(evenements, (jour + 1, EVT_JOUR, sequence, None))
+                sequence += 1
+                dernier_jour = jour + 1
+
+        return self._rapport(delais, stats, dernier_jour + 1, debut_calcul, len(echantillons))
+
+    def _rapport(self, delais, stats, jours_simules, debut_calcul, nombre_echantillons=0):
+        delais = sorted(delais)
+        par_type = {}
+        for type_essai, valeurs in stats.items():
+            # Les jours sans événement ont une file vide
+            longueurs = sorted([0] * max(0, jours_simules - len(valeurs['longueurs'])) + valeurs['longueurs'])
+            postes = self.capacites[type_essai]['capacite_simultanee']
+            capacite_totale = postes * jours_simules
+            par_type[type_essai] = {
+                'capacite': self.capacites[type_essai],
+                'essais_traites': valeurs['traites'],
+                'file_moyenne': round(sum(longueurs) / len(longueurs), 2) if longueurs else 0,
+                'file_p95': percentile(longueurs, 95),
+                'file_max': longueurs[-1] if longueurs else 0,
+                'attente_moyenne_jours': round(sum(valeurs['attentes']) / len(valeurs['attentes']), 2) if valeurs['attentes'] else 0,
+                # Borné à 1: les essais qui débordent de l'horizon comptent entièrement
+                'utilisation': round(min(1, valeurs['postes_jours'] / capacite_totale), 4) if capacite_totale else 0,
+            }
+
+        return {
+            'politique': self.politique,
+            'jours_ouvrables_simules': jours_simules,
+            'echantillons': nombre_echantillons,
+            'echantillons_restitues': len(delais),
+            'delai_restitution': {
+                'moyen': round(sum(delais) / len(delais), 2) if delais else 0,
+                'p50': percentile(delais, 50),
+                'p90': percentile(delais, 90),
+                'p95': percentile(delais, 95),
+                'max': delais[-1] if delais else 0,
+            },
+            'par_type': par_type,
+            'temps_calcul': round(time.perf_counter() - debut_calcul, 4),
+        }
+
+
+def simuler_scenarios(arrivees, scenarios, politique='fifo', horizon_jours=None):
+    """
+    Rejoue les mêmes arrivées contre plusieurs configurations
+
+    Args:
+        arrivees: Liste d'arrivées partagée par tous les scénarios
+        scenarios: Liste de dicts {'nom': ..., 'surcharges': {...}, 'politique': ...}
+    """
+    resultats = []
+    for scenario in scenarios:
+        capacites = charger_capacites(scenario.get('surcharges'))
+        simulateur = SimulateurLaboratoire(capacites, scenario.get('politique', politique))
+        resultat = simulateur.executer(arrivees, horizon_jours)
+        resultat['nom'] = scenario.get('nom', '')
+        resultats.append(resultat)
+    return resultats
@@ -10,6 +10,14 @@ from core.models import Echantillon, Essai, Notification
 from .optimizer import optimiser_planning_hebdomadaire
 
 
+def echantillons_en_retard():
+    """Échantillons dont la date de fin estimée est dépassée"""
+    return Echantillon.objects.filter(
+        date_fin_estimee__lt=timezone.now().date(),
+        statut__in=['stockage', 'essais', 'decodification', 'traitement']
+    )
+
+
 @shared_task
 def check_delayed_samples():
     """
@@ -21,10 +29,7 @@ def check_delayed_samples():
     today = timezone.now().date()
     
     # Échantillons dont la date de fin estimée est dépassée
-    echantillons_retard = Echantillon.objects.filter(
-        date_fin_estimee__lt=today,
-        statut__in=['stockage', 'essais', 'decodification', 'traitement']
-    )
+    echantillons_retard = echantillons_en_retard()
     
     for echantillon in echantillons_retard:
         jours_retard = (today - echantillon.date_fin_estimee).days
@@ -49,6 +54,26 @@ def check_delayed_samples():
     return f"Vérifié {echantillons_retard.count()} échantillons en retard"
 
 
+@shared_task
+def reprogrammer_echantillons_retardes(jours_retard=None):
+    """
+    Tâche quotidienne pour reprogrammer les envois des échantillons en retard
+    en une seule transaction, répartis selon la capacité disponible
+
+    Leur date de fin estimée est repoussée: ils ne sont repris que s'ils
+    prennent à nouveau du retard.
+    """
+    from core.reprogrammation_helper import JOURS_RETARD_DEFAUT, reprogrammer_echantillons
+    
+    # Seuls les essais encore en attente d'envoi sont reprogrammés
+    ids = list(echantillons_en_retard().filter(
+        essais__statut='attente'
+    ).distinct().values_list('id', flat=True))
+    
+    resultats = reprogrammer_echantillons(ids, JOURS_RETARD_DEFAUT if jours_retard is None else jours_retard)
+    return f"Reprogrammé {len(resultats)} échantillons en retard"
+
+
 @shared_task
 def optimize_daily_schedule():
     """
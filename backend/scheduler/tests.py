@@ -0,0 +1,53 @@
+"""
+Tests du module scheduler
+
+python manage.py test --settings=config.settings_test
+"""
+
+from datetime import date
+
+from django.test import TestCase
+
+from . import simulation
+from .serializers import SimulationRequestSerializer
+
+
+class SimulationTests(TestCase):
+    """Les paramètres de simulation sont bornés"""
+
+    def valider(self, **donnees):
+        donnees = {'date_debut': '2026-01-05', 'date_fin': '2026-03-31', 'source': 'synthetique', **donnees}
+        serializer = SimulationRequestSerializer(data=donnees)
+        return serializer.is_valid(), serializer.errors
+
+    def test_taux_journalier_borne(self):
+        valide, erreurs = self.valider(taux_journalier=1e9)
+        self.assertFalse(valide)
+        self.assertIn('taux_journalier', erreurs)
+
+    def test_nombre_d_arrivees_borne(self):
+        valide, _ = self.valider(taux_journalier=simulation.TAUX_JOURNALIER_MAX, date_fin='2028-12-31')
+        self.assertFalse(valide)
+        self.assertTrue(self.valider(taux_journalier=5)[0])
+
+    def test_generation_plafonnee(self):
+        arrivees = simulation.generer_arrivees_synthetiques(
+            date(2026, 1, 5), date(2026, 12, 31), 1e6, graine=1
+        )
+        self.assertEqual(len(arrivees), simulation.ARRIVEES_MAX)
+
+    def test_poste_supplementaire(self):
+        arrivees = [(date(2026, 1, 5), ['CBR'], False)] * 6
+        actuel, renforce = simulation.simuler_scenarios(arrivees, [
+            {'nom': 'Actuel', 'surcharges': {'CBR': {'capacite_simultanee': 1, 'capacite_quotidienne': 1}}},
+            {'nom': 'Deux presses', 'surcharges': {'CBR': {'capacite_simultanee': 2, 'capacite_quotidienne': 2}}},
+        ])
+        self.assertEqual(actuel['echantillons_restitues'], 6)
+        self.assertLess(renforce['delai_restitution']['max'], actuel['delai_restitution']['max'])
+
+    def test_surcharges_nulles_refusees(self):
+        valide, erreurs = self.valider(
+            taux_journalier=2, scenarios=[{'nom': 'Panne', 'surcharges': {'CBR': {'capacite_quotidienne': 0}}}]
+        )
+        self.assertFalse(valide)
+        self.assertIn('scenarios', erreurs)
@@ -7,7 +7,7 @@ from rest_framework.routers import DefaultRouter
 
 from .views import (
     RessourceViewSet, ContrainteTemporelleViewSet,
-    PlanningViewSet, AffectationEssaiViewSet
+    PlanningViewSet, AffectationEssaiViewSet, SimulationViewSet
 )
 
 router = DefaultRouter()
@@ -15,6 +15,7 @@ router.register(r'ressources', RessourceViewSet, basename='ressource')
 router.register(r'contraintes', ContrainteTemporelleViewSet, basename='contrainte')
 router.register(r'plannings', PlanningViewSet, basename='planning')
 router.register(r'affectations', AffectationEssaiViewSet, basename='affectation')
+router.register(r'simulations', SimulationViewSet, basename='simulation')
 
 urlpatterns = [
     path('', include(router.urls)),
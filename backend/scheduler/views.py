@@ -13,9 +13,12 @@ from .models import Ressource, ContrainteTemporelle, Planning, AffectationEssai
 from .serializers import (
     RessourceSerializer, ContrainteTemporelleSerializer,
     PlanningSerializer, PlanningListSerializer, AffectationEssaiSerializer,
-    OptimizationRequestSerializer
+    OptimizationRequestSerializer, SimulationRequestSerializer
 )
 from .optimizer import SchedulerOptimizer
+from .simulation import (
+    charger_arrivees_historiques, generer_arrivees_synthetiques, simuler_scenarios
+)
 from core.permissions import IsAdmin, IsResponsableMateriaux
 
 
@@ -196,3 +199,59 @@ class AffectationEssaiViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['planning', 'essai']
     ordering_fields = ['date_debut_planifiee', 'priorite_calculee']
+
+
+class SimulationViewSet(viewsets.ViewSet):
+    """ViewSet pour la simulation de capacité (what-if)"""
+    
+    permission_classes = [IsAuthenticated]
+    
+    @action(detail=False, methods=['post'])
+    def simuler(self, request):
+        """
+        Rejoue des arrivées contre un ou plusieurs scénarios de capacité
+        
+        POST /api/scheduler/simulations/simuler/
+        {
+            "date_debut": "2025-01-01",
+            "date_fin": "2025-12-31",
+            "source": "historique",  // ou "synthetique" (avec taux_journalier)
+            "politique": "fifo",     // "fifo", "priorite" ou "plus_court_dabord"
+            "scenarios": [
+                {"nom": "Actuel"},
+                {"nom": "2 presses CBR", "surcharges": {"CBR": {"capacite_simultanee": 2}}}
+            ]
+        }
+        """
+        serializer = SimulationRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        data = serializer.validated_data
+        
+        if data['source'] == 'synthetique':
+            arrivees = generer_arrivees_synthetiques(
+                data['date_debut'],
+                data['date_fin'],
+                data['taux_journalier'],
+                repartition=data.get('repartition'),
+                taux_urgence=data['taux_urgence'],
+                graine=data.get('graine')
+            )
+        else:
+            arrivees = charger_arrivees_historiques(data['date_debut'], data['date_fin'])
+        
+        scenarios = data.get('scenarios') or [{'nom': 'Actuel'}]
+        
+        try:
+            resultats = simuler_scenarios(arrivees, scenarios, politique=data['politique'])
+        except (ValueError, TypeError, KeyError) as e:
+            return Response(
+                {'error': f'Scénario invalide: {str(e)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response({
+            'source': data['source'],
+            'arrivees': len(arrivees),
+            'scenarios': resultats,
+        })
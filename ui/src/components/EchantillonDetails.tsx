@@ -303,7 +303,7 @@ export function EchantillonDetails() {
               <span className="text-2xl font-bold">&times;</span>
             </button>
             <img
-              src={echantillon.photo}
+              src={echantillon.photo_miniatures?.grand || echantillon.photo}
               alt={`Photo de l'échantillon ${echantillon.code}`}
               className="max-w-full max-h-screen rounded-lg"
               onClick={(e) => e.stopPropagation()}
@@ -17,6 +17,7 @@ interface RapportMarketing {
   dateEnvoi: string;
   avisDirecteurSNERTP: string;
   signatureDirecteurSNERTP: string;
+  hasSignature?: boolean;
   clientEmail?: string;
   clientId?: string;
 }
@@ -82,6 +83,7 @@ export function ServiceMarketingModule() {
             dateEnvoi: rapport.date_envoi_marketing,
             avisDirecteurSNERTP: rapport.avis_directeur_snertp || '',
             signatureDirecteurSNERTP: rapport.signature_directeur_snertp || '',
+            hasSignature: rapport.has_signature,
             clientEmail,
             clientId
           });
@@ -118,6 +120,28 @@ export function ServiceMarketingModule() {
     loadRapports();
   }, []);
 
+  // La liste ne contient pas les signatures: chargées depuis le détail à l'ouverture
+  const handleVoirGroupe = async (groupe: GroupeClient) => {
+    setSelectedGroupe(groupe);
+    const rapport = groupe.rapports[0];
+    if (!rapport.hasSignature || rapport.signatureDirecteurSNERTP) return;
+
+    try {
+      const response = await fetch(`https://snertp.onrender.com/api/rapports-marketing/${rapport.id}/`, {
+        headers: {
+          'Authorization': `Bearer ${localStorage.getItem('access_token')}`,
+        },
+      });
+      if (response.ok) {
+        const detail = await response.json();
+        rapport.signatureDirecteurSNERTP = detail.signature_directeur_snertp || '';
+        setSelectedGroupe({ ...groupe, rapports: [...groupe.rapports] });
+      }
+    } catch (error) {
+      console.error('Erreur chargement signature:', error);
+    }
+  };
+
   const handlePrepareEmail = (groupe: GroupeClient) => {
     setSelectedGroupe(groupe);
     setEmailAddress(groupe.clientEmail || '');
@@ -163,7 +187,7 @@ export function ServiceMarketingModule() {
       }
 
       if (successCount > 0) {
-        toast.success(`${successCount} rapport(s) envoyé(s) à ${emailAddress}`);
+        toast.success(`${successCount} rapport(s) en cours d'envoi à ${emailAddress}`);
         setShowEmailDialog(false);
         setSelectedGroupe(null);
         setEmailAddress('');
@@ -246,7 +270,7 @@ export function ServiceMarketingModule() {
                       <Button
                         size="sm"
                         variant="outline"
-                        onClick={() => setSelectedGroupe(groupe)}
+                        onClick={() => handleVoirGroupe(groupe)}
                         style={{ borderColor: '#2196F3', color: '#1565C0' }}
                       >
                         <FileText className="h-4 w-4 mr-2" />
@@ -13,6 +13,7 @@ export interface Echantillon {
   nappe?: string;
   qr_code: string;
   photo?: string;
+  photo_miniatures?: { mini: string; liste: string; grand: string } | null;
   date_reception: string;
   date_fin_estimee?: string;
   statut: string;